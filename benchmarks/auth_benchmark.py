@@ -0,0 +1,64 @@
+"""
+Microbenchmark of the authentication overhead of the get_user dependency, with
+and without the in-process token cache.
+
+    python benchmarks/auth_benchmark.py --iterations 10000
+
+For end to end numbers, run the locust suite with RESTLLM_ACCESS_TOKEN set and
+compare the response times with USER_TOKEN_CACHE_SIZE=0 and the default.
+"""
+
+import asyncio
+import statistics
+import time
+from datetime import timedelta
+
+import click
+
+from restllm.cryptography.authentication import create_token
+from restllm.dependencies import get_user, user_token_cache
+
+
+async def time_calls(token: str, iterations: int, cached: bool) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        if not cached:
+            user_token_cache.entries.clear()
+        start = time.perf_counter()
+        await get_user(token)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    click.echo(
+        f"{name:<10} "
+        f"mean {statistics.mean(timings):8.2f} us  "
+        f"p50 {timings[len(timings) // 2]:8.2f} us  "
+        f"p99 {timings[int(len(timings) * 0.99)]:8.2f} us"
+    )
+
+
+async def run_benchmark(iterations: int) -> None:
+    token = create_token(
+        {
+            "id": 999_999,
+            "first_name": "Bench",
+            "last_name": "Mark",
+            "email": "bench@example.com",
+        },
+        expires_delta=timedelta(minutes=5),
+    )
+    report("uncached", await time_calls(token, iterations, cached=False))
+    report("cached", await time_calls(token, iterations, cached=True))
+
+
+@click.command()
+@click.option("--iterations", default=10_000, help="Measured calls per scenario")
+def main(iterations: int):
+    asyncio.run(run_benchmark(iterations))
+
+
+if __name__ == "__main__":
+    main()
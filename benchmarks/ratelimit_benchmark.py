@@ -0,0 +1,100 @@
+"""
+Microbenchmark of the sorted set rate limiter against the GCRA Lua script.
+
+Each scenario prefills the rate limit window with the given number of calls in
+the last minute and then times repeated checks against a running Redis.
+
+    python benchmarks/ratelimit_benchmark.py --redis-url redis://localhost:6379/0
+"""
+
+import asyncio
+import statistics
+import time
+
+import click
+import redis.asyncio as redis
+
+from restllm.models import User
+from restllm.redis.ratelimit import (
+    MILLISECONDS_IN_MINUTE,
+    check_gcra_rate_limit,
+    check_rate_limit,
+    get_current_epoch_milliseconds,
+    get_gcra_key,
+)
+from restllm.settings import settings
+
+API_PATH = "/benchmark"
+CALLS_PER_MINUTE = (25, 1_000, 10_000)
+
+
+async def prefill_sorted_set(redis_client: redis.Redis, user: User, calls: int):
+    key = f"ratelimit:{user.id}:{API_PATH}"
+    epoch_ms = get_current_epoch_milliseconds()
+    step = MILLISECONDS_IN_MINUTE / calls
+    await redis_client.delete(key)
+    await redis_client.zadd(
+        key,
+        {
+            f"{epoch_ms - int(i * step)}:{i}:1": epoch_ms - int(i * step)
+            for i in range(calls)
+        },
+    )
+
+
+async def time_calls(check, iterations: int, setup=None) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        if setup:
+            await setup()
+        start = time.perf_counter()
+        await check()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, calls: int, timings: list[float]) -> None:
+    timings = sorted(timings)
+    click.echo(
+        f"{name:<12} {calls:>7} calls/min  "
+        f"mean {statistics.mean(timings):7.3f} ms  "
+        f"p50 {timings[len(timings) // 2]:7.3f} ms  "
+        f"p99 {timings[int(len(timings) * 0.99)]:7.3f} ms"
+    )
+
+
+async def run_benchmark(redis_url: str, iterations: int) -> None:
+    redis_client = redis.from_url(redis_url)
+    user = User(
+        id=999_999, first_name="Bench", last_name="Mark", email="bench@example.com"
+    )
+
+    for calls in CALLS_PER_MINUTE:
+        # The sorted set limiter adds a member per check, so the window is
+        # refilled before every measured call to keep its size constant.
+        timings = await time_calls(
+            lambda: check_rate_limit(redis_client, user, API_PATH),
+            iterations,
+            setup=lambda: prefill_sorted_set(redis_client, user, calls),
+        )
+        report("sorted set", calls, timings)
+
+        await redis_client.delete(get_gcra_key(user, API_PATH))
+        timings = await time_calls(
+            lambda: check_gcra_rate_limit(redis_client, user, API_PATH, limit=calls),
+            iterations,
+        )
+        report("gcra", calls, timings)
+
+    await redis_client.aclose()
+
+
+@click.command()
+@click.option("--redis-url", default=str(settings.redis_dsn), help="Redis URL")
+@click.option("--iterations", default=200, help="Measured checks per scenario")
+def main(redis_url: str, iterations: int):
+    asyncio.run(run_benchmark(redis_url, iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 import random
 from functools import cache
 from pathlib import Path
@@ -25,6 +26,11 @@ class ApiUser(HttpUser):
     wait_time = between(1, 5)
     sorting_fields = ["updated_at", "created_at", "id"]
 
+    def on_start(self):
+        access_token = os.environ.get("RESTLLM_ACCESS_TOKEN")
+        if access_token:
+            self.client.headers["Authorization"] = f"Bearer {access_token}"
+
     @task
     def get_chat(self):
         chat_id = self.get_id()
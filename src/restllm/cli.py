@@ -6,10 +6,15 @@ import redis
 import redis.exceptions
 
 from .redis.index import (
-    create_index_on_meta_model,
+    backfill_documents,
+    create_index_with_alias,
+    create_versioned_index,
     get_class_from_class_name,
-    get_meta_model_schema,
+    get_index_key,
+    get_index_version,
     string_to_class_mapping,
+    swap_index_alias,
+    wait_for_indexing,
 )
 from .settings import settings
 
@@ -36,11 +41,12 @@ def cli():
 )
 def create_index(redis_url: str, class_name: str):
     redis_client: redis.Redis = redis.from_url(redis_url)
-    meta_model_schema = get_meta_model_schema()
+    get_class_from_class_name(class_name)
 
-    _class = get_class_from_class_name(class_name)
-
-    create_index_on_meta_model(redis_client, meta_model_schema, _class)
+    if not create_index_with_alias(redis_client, class_name):
+        click.echo(
+            f"Index for model class '{class_name}' already exists. Use migrate_index to update it."
+        )
 
 
 @cli.command(name="migrate_all_index")
@@ -51,19 +57,83 @@ def create_index(redis_url: str, class_name: str):
 )
 def migrate_all_index(redis_url: str):
     redis_client: redis.Redis = redis.from_url(redis_url)
-    meta_model_schema = get_meta_model_schema()
-
-    for _class in string_to_class_mapping.values():
-        try:
-            create_index_on_meta_model(redis_client, meta_model_schema, _class)
-        except redis.exceptions.ResponseError as error:
-            if str(error) == "Index already exists":
-                click.echo(
-                    f"Index for model class '{_class.__name__}' already exists. Skipping index creation!",
-                    color=True,
-                )
-            else:
-                raise error
+
+    for class_name, _class in string_to_class_mapping.items():
+        if not create_index_with_alias(redis_client, class_name):
+            click.echo(
+                f"Index for model class '{_class.__name__}' already exists. Skipping index creation!",
+                color=True,
+            )
+
+
+@cli.command(name="migrate_index")
+@click.option(
+    "--redis-url",
+    default=str(settings.redis_dsn),
+    help="Redis URL",
+)
+@click.option(
+    "--class-name",
+    default=None,
+    help="Class name for which the index is migrated. All classes when omitted",
+)
+@click.option(
+    "--version",
+    type=int,
+    default=None,
+    help="Index version to build. Defaults to the current schema version",
+)
+@click.option(
+    "--poll-interval",
+    default=1.0,
+    help="Seconds between indexing progress checks",
+)
+@click.option(
+    "--drop-old/--keep-old",
+    default=False,
+    help="Drop the previous versioned index after the alias is swapped",
+)
+def migrate_index(
+    redis_url: str,
+    class_name: str | None,
+    version: int | None,
+    poll_interval: float,
+    drop_old: bool,
+):
+    """
+    Builds a new versioned index in the background and swaps the alias queried
+    by the app to it once all documents are indexed.
+    """
+    redis_client: redis.Redis = redis.from_url(redis_url)
+    class_names = [class_name] if class_name else list(string_to_class_mapping)
+
+    for class_name in class_names:
+        get_class_from_class_name(class_name)
+        backfilled = backfill_documents(redis_client, class_name)
+        if backfilled:
+            click.echo(f"{class_name}: backfilled {backfilled} documents")
+        index_name = create_versioned_index(
+            redis_client, class_name, version or get_index_version(class_name)
+        )
+        for progress in wait_for_indexing(redis_client, index_name, poll_interval):
+            click.echo(
+                f"{index_name}: {progress.percent_indexed:.1%} indexed, "
+                f"{progress.num_docs} documents, "
+                f"{progress.docs_per_second:.0f} documents/s"
+            )
+        average_throughput = progress.num_docs / max(progress.elapsed_seconds, 1e-9)
+        click.echo(
+            f"{index_name}: indexed {progress.num_docs} documents in "
+            f"{progress.elapsed_seconds:.1f}s ({average_throughput:.0f} documents/s)"
+        )
+
+        previous_index_name = swap_index_alias(redis_client, class_name, index_name)
+        click.echo(f"Alias for '{class_name}' now points to {index_name}")
+        if drop_old and previous_index_name not in (None, index_name):
+            # Unversioned indexes were already dropped during the swap
+            if previous_index_name != get_index_key(class_name):
+                redis_client.ft(previous_index_name).dropindex(delete_documents=False)
+                click.echo(f"Dropped previous index {previous_index_name}")
 
 
 @cli.command(name="delete_data")
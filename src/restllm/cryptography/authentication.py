@@ -1,4 +1,8 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from typing import Any
 
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
@@ -47,3 +51,41 @@ async def create_tokens(data: dict) -> tuple[str, str]:
     )
 
     return access_token, refresh_token
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens. Entries are keyed by the token digest
+    and are only returned until the expiry of the token.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self.entries: OrderedDict[bytes, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Any | None:
+        digest = self.get_digest(token)
+        entry = self.entries.get(digest)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self.entries[digest]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(digest)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, token: str, value: Any, expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        digest = self.get_digest(token)
+        self.entries[digest] = (expires_at, value)
+        self.entries.move_to_end(digest)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
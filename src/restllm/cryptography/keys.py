@@ -1,19 +1,127 @@
+import asyncio
+import logging
+import time
+
 import redis.asyncio as redis
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+from .secure_url import decrypt_payload
+
+logger = logging.getLogger(__name__)
+
+
+class KeyRingNotLoaded(RuntimeError):
+    pass
+
+
+def build_multi_fernet(keys: list[bytes | str]) -> MultiFernet:
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def rotation_is_due(rotated_at: float | None, rotation_interval: int) -> bool:
+    return rotated_at is None or time.time() - rotated_at >= rotation_interval
+
+
+class FernetKeyRing:
+    """
+    Process local cache of the Fernet keys stored in Redis.
+
+    The first key encrypts new payloads, while previous keys are kept for
+    decryption until they are rotated out of the ring.
+    """
+
+    def __init__(
+        self,
+        key_name: str = "fernet_key_ring",
+        ring_size: int = 6,
+        rotation_interval: int = 3600,
+        refresh_interval: int = 60,
+    ):
+        self.key_name = key_name
+        self.ring_size = ring_size
+        self.rotation_interval = rotation_interval
+        self.refresh_interval = refresh_interval
+        self.multi_fernet: MultiFernet | None = None
+        self.refreshed_at: float = 0.0
+
+    @property
+    def rotated_at_key(self) -> str:
+        return f"{self.key_name}:rotated_at"
+
+    @property
+    def lock_key(self) -> str:
+        return f"{self.key_name}:lock"
+
+    async def get_fernet(
+        self,
+        redis_client: redis.Redis | None = None,
+    ) -> MultiFernet:
+        if self.multi_fernet is None and redis_client is not None:
+            await self.refresh(redis_client)
+        if self.multi_fernet is None:
+            raise KeyRingNotLoaded("Fernet key ring has not been loaded")
+        return self.multi_fernet
+
+    async def decrypt_payload(
+        self,
+        redis_client: redis.Redis,
+        encrypted_payload: bytes | str,
+    ) -> dict:
+        """
+        Decrypts the payload with the keys of the ring. Another worker may have
+        rotated in a key that this process has not loaded yet, so the ring is
+        refreshed and the payload decrypted once more before InvalidToken is
+        raised.
+        """
+        fernet = await self.get_fernet(redis_client)
+        try:
+            return decrypt_payload(fernet, encrypted_payload)
+        except InvalidToken:
+            fernet = await self.refresh(redis_client)
+            if fernet is None:
+                raise
+            return decrypt_payload(fernet, encrypted_payload)
 
+    async def refresh(self, redis_client: redis.Redis) -> MultiFernet:
+        keys, rotated_at = await self.load(redis_client)
+        if not keys or rotation_is_due(rotated_at, self.rotation_interval):
+            if await self.rotate(redis_client):
+                keys, rotated_at = await self.load(redis_client)
+        if keys:
+            self.multi_fernet = build_multi_fernet(keys)
+            self.refreshed_at = time.monotonic()
+        return self.multi_fernet
 
-async def get_fernet(
-    redis_client: redis.Redis,
-    key_name: str = "fernet_crypto_key",
-    expiration_time: int = 3600,
-) -> Fernet:
-    fernet_key = await redis_client.get(key_name)
+    async def load(
+        self,
+        redis_client: redis.Redis,
+    ) -> tuple[list[bytes], float | None]:
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.lrange(self.key_name, 0, self.ring_size - 1)
+            pipeline.get(self.rotated_at_key)
+            keys, rotated_at = await pipeline.execute()
+        return keys, float(rotated_at) if rotated_at else None
 
-    if fernet_key is None:
-        fernet_key = Fernet.generate_key().decode()
-        await redis_client.setex(key_name, expiration_time, fernet_key)
-    else:
-        fernet_key = fernet_key.decode()
-        await redis_client.expire(key_name, expiration_time)
+    async def rotate(self, redis_client: redis.Redis) -> bool:
+        # Only one worker rotates, the others pick up the new key on refresh
+        acquired = await redis_client.set(self.lock_key, 1, nx=True, ex=30)
+        if not acquired:
+            return False
+        async with redis_client.pipeline() as pipeline:
+            pipeline.multi()
+            (
+                pipeline.lpush(self.key_name, Fernet.generate_key()),
+                pipeline.ltrim(self.key_name, 0, self.ring_size - 1),
+                pipeline.set(self.rotated_at_key, time.time()),
+                pipeline.delete(self.lock_key),
+            )
+            await pipeline.execute()
+        return True
 
-    return Fernet(fernet_key)
+    async def run(self, redis_client: redis.Redis) -> None:
+        while True:
+            try:
+                await self.refresh(redis_client)
+            except Exception:
+                logger.exception("Failed to refresh Fernet key ring")
+            await asyncio.sleep(self.refresh_interval)
@@ -2,17 +2,19 @@ import hashlib
 import hmac
 import json
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 
 from ..settings import settings
 
 
-def encrypt_payload(fernet: Fernet, payload: dict) -> bytes:
+def encrypt_payload(fernet: Fernet | MultiFernet, payload: dict) -> bytes:
     payload_json = json.dumps(payload)
     return fernet.encrypt(payload_json.encode())
 
 
-def decrypt_payload(fernet: Fernet, encrypted_payload: bytes | str) -> dict:
+def decrypt_payload(
+    fernet: Fernet | MultiFernet, encrypted_payload: bytes | str
+) -> dict:
     decrypted_payload = fernet.decrypt(encrypted_payload)
     return json.loads(decrypted_payload)
 
@@ -30,7 +32,7 @@ def signature_is_valid(encrypted_payload: str, received_signature: str) -> bool:
     )
 
 
-def generate_secure_url(fernet: Fernet, payload: dict) -> dict[str, str]:
+def generate_secure_url(fernet: Fernet | MultiFernet, payload: dict) -> dict[str, str]:
     encrypted_payload = encrypt_payload(fernet, payload)
     signature = sign_data(encrypted_payload)
     return {"payload": encrypted_payload.decode(), "signature": signature}
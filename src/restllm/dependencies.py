@@ -1,17 +1,31 @@
+import asyncio
+
 import redis.asyncio as redis
 
-from fastapi import Depends, Form
+from cryptography.fernet import MultiFernet
+from fastapi import Depends, Form, Request, Response
 from jose import JWTError, ExpiredSignatureError, jwt
 from typing import Type
 from pydantic import SecretStr, EmailStr
 
 from .models.base import User
 from .settings import settings
-from .types import paths
+from .tracing import traced
+from .types import paths, queries
 from .models.share import ShareableClass
 from .redis.keys import get_class_name
 from .redis.commands import get_instance
-from .cryptography.authentication import verify_password
+from .redis.access_log import AccessLogWriter
+from .redis.events import EventHub, SlowConsumerPolicy
+from .redis.pagination import Cursor, InvalidCursor
+from .redis.projection import InvalidField, parse_fields
+from .redis.ratelimit import RateLimitResult, check_gcra_rate_limit
+from .cryptography.authentication import TokenCache, verify_password
+from .cryptography.keys import FernetKeyRing
+from .redis.coalescing import CompletionCoalescer
+from .redis.jobs import CompletionJobWorker
+from .redis.admission import AdmissionController
+from .providers import CompletionRouter, FirstTokenTracker
 from .models.authentication import (
     UserWithPasswordHash,
     UserSignUp,
@@ -19,21 +33,76 @@ from .models.authentication import (
     get_user_email_key,
 )
 from .exceptions import (
+    InvalidBatchException,
     InvalidCredentialsException,
+    InvalidCursorException,
+    InvalidFieldsException,
+    RateLimitExceededException,
     TokenExpiredException,
 )
 from .cryptography.authentication import oauth2_scheme
 from .settings import settings
 
 connection_pool: redis.ConnectionPool = None
+key_ring = FernetKeyRing(
+    ring_size=settings.fernet_key_ring_size,
+    rotation_interval=settings.fernet_key_rotation_interval,
+    refresh_interval=settings.fernet_key_refresh_interval,
+)
+access_log_writer = AccessLogWriter(
+    max_queue_size=settings.access_log_queue_size,
+    batch_size=settings.access_log_batch_size,
+    stream_max_len=settings.access_log_stream_max_len,
+)
+event_hub = EventHub(
+    max_queue_size=settings.event_queue_size,
+    policy=SlowConsumerPolicy(settings.event_slow_consumer_policy),
+)
+user_token_cache = TokenCache(max_size=settings.user_token_cache_size)
+completion_coalescer = CompletionCoalescer(
+    cross_worker=settings.completion_coalescing == "redis",
+    flight_ttl=settings.completion_flight_ttl,
+)
+completion_job_worker = CompletionJobWorker(
+    concurrency=settings.completion_job_concurrency,
+    model_concurrency=settings.completion_job_model_concurrency,
+    heartbeat_ttl=settings.completion_job_heartbeat_ttl,
+)
+admission_controller = AdmissionController(
+    default_limit=settings.admission_default_limit,
+    model_limits=settings.admission_model_limits,
+    queue_size=settings.admission_queue_size,
+    queue_timeout=settings.admission_queue_timeout,
+    lease_ttl=settings.admission_lease_ttl,
+    poll_interval=settings.admission_poll_interval,
+)
+first_token_tracker = FirstTokenTracker(
+    min_samples=settings.completion_hedge_min_samples,
+    percentile=settings.completion_hedge_percentile,
+    default_deadline=settings.completion_hedge_default_deadline,
+)
+completion_router = CompletionRouter(
+    first_token_tracker, hedging=settings.completion_hedging
+)
+background_tasks: set[asyncio.Task] = set()
 
 
 async def startup():
     global connection_pool
     connection_pool = redis.ConnectionPool.from_url(str(settings.redis_dsn))
+    redis_client = redis.Redis.from_pool(connection_pool)
+    background_tasks.add(asyncio.create_task(key_ring.run(redis_client)))
+    background_tasks.add(asyncio.create_task(access_log_writer.run(redis_client)))
+    background_tasks.add(asyncio.create_task(event_hub.run(redis_client)))
 
 
 async def shutdown():
+    tasks = background_tasks | completion_job_worker.tasks
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    background_tasks.clear()
+    await access_log_writer.drain(redis.Redis.from_pool(connection_pool))
     await connection_pool.aclose()
 
 
@@ -42,32 +111,71 @@ async def get_redis_client():
     yield redis_client
 
 
+async def get_event_hub() -> EventHub:
+    return event_hub
+
+
+async def get_key_ring() -> FernetKeyRing:
+    return key_ring
+
+
+@traced
+async def get_fernet(
+    redis_client: redis.Redis = Depends(get_redis_client),
+) -> MultiFernet:
+    return await key_ring.get_fernet(redis_client)
+
+
+@traced
 async def create_instance_id(redis_client: redis.Redis, class_name: str):
     return await redis_client.incr(f"sequence:{class_name}")
 
 
+@traced
+async def create_instance_ids(
+    redis_client: redis.Redis,
+    class_name: str,
+    count: int,
+) -> list[int]:
+    last_id = await redis_client.incrby(f"sequence:{class_name}", count)
+    return list(range(last_id - count + 1, last_id + 1))
+
+
+@traced
 async def get_user(token: str = Depends(oauth2_scheme)) -> User:
-    payload = await decode_user_token(token)
-    return User(**payload)
+    user = user_token_cache.get(token)
+    if user is None:
+        payload, expires_at = decode_token(token)
+        user = User(**payload)
+        user_token_cache.set(token, user, expires_at)
+    return user
 
 
+@traced
 async def decode_user_token(token: str) -> dict:
+    payload, _ = decode_token(token)
+    return payload
+
+
+@traced
+def decode_token(token: str) -> tuple[dict, float]:
     try:
         payload = jwt.decode(
             token,
             settings.secret_key,
             algorithms=[settings.jwt_algorithm],
         )
-        payload.pop("exp")
-        if not payload:
+        expires_at = payload.pop("exp", None)
+        if expires_at is None or not payload:
             raise InvalidCredentialsException
-        return payload
+        return payload, expires_at
     except ExpiredSignatureError:
         raise TokenExpiredException
     except JWTError:
         raise InvalidCredentialsException
 
 
+@traced
 async def get_user_with_password_hash(
     email: EmailStr,
     redis_client: redis.Redis = Depends(get_redis_client),
@@ -82,6 +190,7 @@ async def get_user_with_password_hash(
     return user_instance
 
 
+@traced
 async def get_shareable_key(
     object: ShareableClass,
     id: int = paths.id_path,
@@ -90,6 +199,7 @@ async def get_shareable_key(
     return f"{object.value}:{user.id}:{id}"
 
 
+@traced
 async def authenticate_user(
     email: str,
     password: str,
@@ -104,6 +214,7 @@ async def authenticate_user(
     return UserWithPasswordHash(**user)
 
 
+@traced
 async def signup_form(
     first_name: str = Form(...),
     last_name: str = Form(...),
@@ -120,6 +231,7 @@ async def signup_form(
     )
 
 
+@traced
 async def change_password_form(
     old_password: SecretStr = Form(...),
     new_password: SecretStr = Form(...),
@@ -132,6 +244,47 @@ async def change_password_form(
     )
 
 
+def check_batch_size(size: int) -> None:
+    if size == 0:
+        raise InvalidBatchException("Batch must contain at least one item")
+    if size > settings.batch_max_size:
+        raise InvalidBatchException(
+            f"Batch size {size} exceeds maximum of {settings.batch_max_size}"
+        )
+
+
+@traced
+async def get_ids(ids: str = queries.ids_query) -> list[int]:
+    try:
+        id_list = [int(id) for id in ids.split(",") if id.strip()]
+    except ValueError as exec:
+        raise InvalidBatchException("IDs must be comma separated integers") from exec
+    if any(id <= 0 for id in id_list):
+        raise InvalidBatchException("IDs must be positive integers")
+    check_batch_size(len(id_list))
+    return id_list
+
+
+@traced
+async def get_fields(fields: str | None = queries.fields_query) -> list[str] | None:
+    if not fields:
+        return None
+    try:
+        return parse_fields(fields)
+    except InvalidField as exec:
+        raise InvalidFieldsException(str(exec)) from exec
+
+
+@traced
+async def get_cursor(cursor: str | None = queries.cursor_query) -> Cursor | None:
+    if not cursor:
+        return None
+    try:
+        return Cursor.decode(cursor)
+    except InvalidCursor as exec:
+        raise InvalidCursorException(str(exec)) from exec
+
+
 def get_key_with_id(class_name: str, owner: User, instance_id: int):
     return f"{class_name}:{owner.id}:{instance_id}"
 
@@ -141,6 +294,7 @@ def get_single_key(class_name: str, owner: User):
 
 
 def build_get_new_instance_key(cls: Type):
+    @traced
     async def get_new_instance_key(
         user: User = Depends(get_user),
         redis_client: redis.Redis = Depends(get_redis_client),
@@ -153,6 +307,7 @@ def build_get_new_instance_key(cls: Type):
 
 
 def build_get_instance_key(cls: Type):
+    @traced
     async def get_instance_key(
         id: int = paths.id_path,
         user: User = Depends(get_user),
@@ -164,6 +319,7 @@ def build_get_instance_key(cls: Type):
 
 
 def build_get_new_class_user_key(cls: Type):
+    @traced
     async def get_class_user_key(
         user: User = Depends(get_user),
         redis_client: redis.Redis = Depends(get_redis_client),
@@ -176,6 +332,7 @@ def build_get_new_class_user_key(cls: Type):
 
 
 def build_get_class_user_key(cls: Type):
+    @traced
     async def get_class_user_key(
         user: User = Depends(get_user),
     ):
@@ -183,3 +340,26 @@ def build_get_class_user_key(cls: Type):
         return get_single_key(class_name, user)
 
     return get_class_user_key
+
+
+def build_rate_limit(route_weight_score: int = 1):
+    @traced
+    async def rate_limit(
+        request: Request,
+        response: Response,
+        user: User = Depends(get_user),
+        redis_client: redis.Redis = Depends(get_redis_client),
+    ) -> RateLimitResult:
+        result = await check_gcra_rate_limit(
+            redis_client,
+            user=user,
+            api_path=request.scope["route"].path,
+            route_weight_score=route_weight_score,
+            limit=settings.rate_limit_per_minute,
+        )
+        if not result.allowed:
+            raise RateLimitExceededException(result.get_headers())
+        response.headers.update(result.get_headers())
+        return result
+
+    return rate_limit
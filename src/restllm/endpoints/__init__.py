@@ -3,5 +3,9 @@ from .crud import (
     build_create_instance_endpoint,
     build_update_instance_endpoint,
     build_delete_instance_endpoint,
+    build_get_multiple_instances_endpoint,
+    build_create_multiple_instances_endpoint,
+    build_update_multiple_instances_endpoint,
+    build_delete_multiple_instances_endpoint,
     add_crud_route,
 )
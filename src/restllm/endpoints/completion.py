@@ -1,30 +1,370 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator
+
+import anyio
 import redis.asyncio as redis
 
 from litellm import acompletion
 
-from ..models import ChatMessage, ChatWithMeta
-from ..redis.commands import append_chat_message
+from .. import dependencies, metrics, tracing
+from ..dependencies import (
+    admission_controller,
+    background_tasks,
+    completion_coalescer,
+    completion_router,
+    completion_job_worker,
+)
+from ..models import (
+    ChatMessage,
+    ChatWithMeta,
+    CompletionJob,
+    EventStatus,
+    RoleTypes,
+    TaskAction,
+    TokenUsage,
+)
+from ..models.jobs import get_timestamp
+from ..providers import get_route_kwargs, get_routes
+from ..redis.admission import AdmissionRejected
+from ..redis.commands import (
+    append_chat_message,
+    append_chat_message_content,
+    get_instance,
+    set_message_token_count,
+    start_chat_message,
+)
+from ..redis.completion_cache import (
+    get_cached_completion,
+    get_completion_hash,
+    set_cached_completion,
+)
+from ..redis.jobs import get_job_chat_key, get_job_stream_key, save_job
+from ..redis.streams import TokenBuffer, end_token_stream, publish_token_stream
+from .context import count_completion_tokens, count_prompt_tokens, fit_to_context
+from ..settings import settings
 
+logger = logging.getLogger(__name__)
 
-async def chat_acompletion_call(
-    chat_with_meta: ChatWithMeta,
-    redis_client: redis.Redis,
-    key: str,
-):
-    kwargs = chat_with_meta.object.dump_json_for_completion()
-    response = acompletion(
-        **kwargs,
-        stream=True,
-    )
-    chat_message = ChatMessage(role="assistant", content="")
+
+async def stream_completion_tokens(response) -> AsyncIterator[str]:
     async for chunk in await response:
         next_token = chunk["choices"][0]["delta"].get("content")
         if not next_token:
             continue
-        chat_message.content += next_token
         yield next_token
+
+
+async def instrument_completion(
+    tokens: AsyncIterator[str],
+    model: str,
+    route: str,
+    started_at: float,
+) -> AsyncIterator[str]:
+    token_count = 0
+    first_token_at = last_token_at = None
+    try:
+        async for token in tokens:
+            now = time.perf_counter()
+            if first_token_at is None:
+                first_token_at = now
+                metrics.completion_first_token_seconds.observe(
+                    now - started_at, model, route
+                )
+            else:
+                metrics.completion_inter_token_seconds.observe(
+                    now - last_token_at, model, route
+                )
+            last_token_at = now
+            token_count += 1
+            yield token
+    finally:
+        if first_token_at is not None:
+            metrics.completion_duration_seconds.observe(
+                last_token_at - started_at, model, route
+            )
+            metrics.completion_tokens_total.inc(token_count, model, route)
+            if last_token_at > first_token_at:
+                metrics.completion_tokens_per_second.observe(
+                    (token_count - 1) / (last_token_at - first_token_at), model, route
+                )
+
+
+async def replay_cached_completion(content: str) -> AsyncIterator[str]:
+    yield content
+
+
+async def cache_completion_tokens(
+    tokens: AsyncIterator[str],
+    redis_client: redis.Redis,
+    completion_hash: str,
+) -> AsyncIterator[str]:
+    content = []
+    async for token in tokens:
+        content.append(token)
+        yield token
+    await set_cached_completion(
+        redis_client,
+        completion_hash,
+        "".join(content),
+        ttl=settings.completion_cache_ttl,
+        max_entries=settings.completion_cache_max_entries,
+    )
+
+
+def is_cacheable(completion_kwargs: dict, cache: bool = False) -> bool:
+    if not settings.completion_cache or (completion_kwargs.get("n") or 1) > 1:
+        return False
+    return cache or completion_kwargs.get("temperature") == 0
+
+
+async def persist_completed_tokens(
+    tokens: AsyncIterator[str],
+    redis_client: redis.Redis,
+    key: str,
+    model: str,
+    usage: TokenUsage | None = None,
+) -> AsyncIterator[str]:
+    content = []
+    async for token in tokens:
+        content.append(token)
+        yield token
+    content = "".join(content)
+    token_count = count_completion_tokens(model, content)
+    if usage:
+        usage.completion_tokens = token_count
     await append_chat_message(
         redis_client=redis_client,
-        instance=chat_message,
+        instance=ChatMessage(
+            role=RoleTypes.ASSISTANT,
+            content=content,
+            token_count=token_count,
+        ),
         key=key,
+        usage=usage,
+    )
+
+
+async def persist_streamed_tokens(
+    tokens: AsyncIterator[str],
+    redis_client: redis.Redis,
+    key: str,
+    model: str,
+    usage: TokenUsage | None = None,
+) -> AsyncIterator[str]:
+    buffer = TokenBuffer(
+        settings.completion_flush_bytes,
+        settings.completion_flush_interval,
+    )
+    content = []
+    index = None
+
+    async def flush() -> None:
+        nonlocal index
+        if index is None:
+            # Appended with its first content, so a completion that fails or is
+            # disconnected before it leaves no empty message in the chat
+            index = await start_chat_message(
+                redis_client,
+                ChatMessage(role=RoleTypes.ASSISTANT, content=buffer.flush()),
+                key,
+                usage,
+            )
+        else:
+            await append_chat_message_content(redis_client, buffer.flush(), index, key)
+
+    try:
+        async for token in tokens:
+            content.append(token)
+            buffer.append(token)
+            if buffer.should_flush():
+                await flush()
+            yield token
+    finally:
+        # Starlette cancels the scope of a disconnected request, which would
+        # cancel the writes of what was generated until the disconnect
+        with anyio.CancelScope(shield=True):
+            if buffer:
+                await flush()
+            if index is not None:
+                token_count = count_completion_tokens(model, "".join(content))
+                await set_message_token_count(
+                    redis_client,
+                    key,
+                    index,
+                    token_count,
+                    TokenUsage(
+                        owner=usage.owner,
+                        model=usage.model,
+                        completion_tokens=token_count,
+                        period=usage.period,
+                    )
+                    if usage
+                    else None,
+                )
+
+
+@tracing.traced
+async def admit_completion(
+    redis_client: redis.Redis,
+    completion_kwargs: dict,
+    prompt_tokens: int,
+) -> AsyncIterator[str]:
+    model = completion_kwargs["model"]
+    tokens = prompt_tokens + (
+        completion_kwargs.get("max_tokens") or settings.completion_token_reserve
+    )
+    lease = await admission_controller.admit(redis_client, model, tokens)
+    try:
+        response = acompletion(
+            **completion_kwargs,
+            stream=True,
+        )
+    except BaseException:
+        await admission_controller.release(redis_client, lease)
+        raise
+    return admission_controller.hold(
+        redis_client, lease, stream_completion_tokens(response)
+    )
+
+
+@tracing.traced
+async def chat_acompletion_call(
+    chat_with_meta: ChatWithMeta,
+    redis_client: redis.Redis,
+    key: str,
+    cache: bool = False,
+) -> AsyncIterator[str]:
+    """
+    Returns the tokens of the completion once it has started, so callers can
+    respond to a rejected or failed completion before they start streaming.
+    """
+    started_at = time.perf_counter()
+    request_kwargs = chat_with_meta.object.dump_json_for_completion()
+    kwargs = request_kwargs
+    if settings.context_trimming:
+        kwargs = fit_to_context({**request_kwargs})
+    model = kwargs["model"]
+    # Usage is only recorded by the request that calls the model
+    usage = TokenUsage(
+        owner=chat_with_meta.owner,
+        model=model,
+        prompt_tokens=count_prompt_tokens(model, kwargs["messages"]),
+        requests=1,
+    )
+    completion_hash = get_completion_hash(kwargs)
+    cacheable = is_cacheable(kwargs, cache)
+
+    async def start_route(route: str) -> AsyncIterator[str]:
+        if route == model:
+            route_kwargs = get_route_kwargs(kwargs, route)
+            prompt_tokens = usage.prompt_tokens
+        else:
+            # Fallbacks can have a different context window and tokenizer
+            route_kwargs = get_route_kwargs(request_kwargs, route)
+            if settings.context_trimming:
+                route_kwargs = fit_to_context(route_kwargs)
+            prompt_tokens = count_prompt_tokens(route, route_kwargs["messages"])
+        if settings.admission_control:
+            return await admit_completion(redis_client, route_kwargs, prompt_tokens)
+        return stream_completion_tokens(acompletion(**route_kwargs, stream=True))
+
+    async def start_completion() -> AsyncIterator[str]:
+        routes = get_routes(model)
+        if len(routes) == 1 and not settings.completion_hedging:
+            tokens = await start_route(model)
+        else:
+            usage.model, tokens = await completion_router.route(routes, start_route)
+        # The hash is of the request to the model, which a fallback did not answer
+        if cacheable and usage.model == model:
+            tokens = cache_completion_tokens(tokens, redis_client, completion_hash)
+        return tokens
+
+    cached = None
+    if cacheable:
+        cached = await get_cached_completion(redis_client, completion_hash)
+    if cached is not None:
+        tokens, usage, route = replay_cached_completion(cached), None, "cache"
+    elif settings.completion_coalescing == "off":
+        tokens = await start_completion()
+        route = usage.model
+    else:
+        tokens, started = await completion_coalescer.join(
+            redis_client, completion_hash, start_completion
+        )
+        route = usage.model if started else "coalesced"
+        if not started:
+            usage = None
+    if settings.metrics:
+        tokens = instrument_completion(tokens, model, route, started_at)
+    if tracing.tracer is not None:
+        tokens = tracing.trace_completion_stream(tokens, model, route)
+
+    if settings.completion_stream_persistence:
+        tokens = persist_streamed_tokens(tokens, redis_client, key, model, usage)
+    else:
+        tokens = persist_completed_tokens(tokens, redis_client, key, model, usage)
+    return tokens
+
+
+@tracing.traced
+async def run_completion_job(redis_client: redis.Redis, job: CompletionJob) -> None:
+    key = get_job_chat_key(job)
+    if job.started_at is not None:
+        # Run again after its worker stopped. Readers of the stream of the
+        # last attempt are told to attach again
+        await end_token_stream(
+            redis_client,
+            get_job_stream_key(job),
+            "Completion job was restarted, attach again to follow it",
+            settings.completion_job_ttl,
+        )
+        job.attempt += 1
+    job.status = EventStatus.IN_PROGRESS
+    job.started_at = get_timestamp()
+    await save_job(redis_client, job, settings.completion_job_ttl, TaskAction.START)
+    try:
+        instance = await get_instance(redis_client=redis_client, key=key)
+        if not instance:
+            raise LookupError(f"Chat {job.chat_id} not found")
+        chat_with_meta = ChatWithMeta.model_validate(instance)
+        while True:
+            try:
+                tokens = await chat_acompletion_call(
+                    chat_with_meta, redis_client, key, job.cache
+                )
+                break
+            except AdmissionRejected as exec:
+                # Jobs have no client waiting on a response, so they keep waiting
+                await asyncio.sleep(exec.retry_after)
+        tokens = publish_token_stream(
+            tokens,
+            redis_client,
+            get_job_stream_key(job),
+            settings.completion_job_ttl,
+        )
+        job.content = "".join([token async for token in tokens])
+        job.status = EventStatus.COMPLETED
+    except Exception as exec:
+        logger.exception("Completion job %s failed", job.id)
+        job.status = EventStatus.FAILED
+        job.error = str(exec)
+    except asyncio.CancelledError:
+        job.status = EventStatus.FAILED
+        job.error = "Completion job was cancelled"
+        raise
+    finally:
+        job.finished_at = get_timestamp()
+        await save_job(
+            redis_client, job, settings.completion_job_ttl, TaskAction.COMPLETE
+        )
+
+
+async def start_completion_job_worker() -> None:
+    if not settings.completion_job_concurrency:
+        return
+    redis_client = redis.Redis.from_pool(dependencies.connection_pool)
+    background_tasks.add(
+        asyncio.create_task(completion_job_worker.run(redis_client, run_completion_job))
     )
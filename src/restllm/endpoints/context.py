@@ -0,0 +1,163 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+import litellm
+
+from ..models.chat import Chat, RoleTypes
+from ..models.completion import ModelTypes
+from ..settings import settings
+
+MODEL_CONTEXT_WINDOWS = {
+    ModelTypes.GPT3_TURBO: 4_096,
+    ModelTypes.GPT3_TURBO_16K: 16_384,
+    ModelTypes.GPT4: 8_192,
+    ModelTypes.GPT4_32K: 32_768,
+}
+DEFAULT_CONTEXT_WINDOW = 4_096
+
+# Messages stored outside of a completion are counted with this model. All
+# supported models share its tokenizer
+TOKENIZER_MODEL = ModelTypes.GPT3_TURBO
+
+# Tokens added by the chat format around every message and before the reply
+MESSAGE_TOKEN_OVERHEAD = 4
+REPLY_TOKEN_OVERHEAD = 3
+
+
+class TokenCountCache:
+    """
+    Bounded LRU cache of token counts. Entries are keyed by the model and a
+    digest of the text, so the cache does not keep message texts alive.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self.entries: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def count(self, model: str, text: str) -> int:
+        key = (model, self.get_digest(text))
+        token_count = self.entries.get(key)
+        if token_count is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return token_count
+        self.misses += 1
+        token_count = self.entries[key] = litellm.token_counter(model=model, text=text)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return token_count
+
+
+token_count_cache = TokenCountCache(settings.token_count_cache_size)
+
+
+def count_text_tokens(model: str, text: str) -> int:
+    return token_count_cache.count(model, text)
+
+
+def count_message_tokens(model: str, message: dict) -> int:
+    tokens = MESSAGE_TOKEN_OVERHEAD + count_text_tokens(
+        model, message.get("content") or ""
+    )
+    if message.get("name"):
+        tokens += count_text_tokens(model, message["name"])
+    if message.get("function_call"):
+        tokens += count_text_tokens(
+            model, json.dumps(message["function_call"], sort_keys=True)
+        )
+    return tokens
+
+
+def count_prompt_tokens(model: str, messages: list[dict]) -> int:
+    return REPLY_TOKEN_OVERHEAD + sum(
+        count_message_tokens(model, message) for message in messages
+    )
+
+
+def count_completion_tokens(model: str, content: str) -> int:
+    # Completions are unique, so they are not added to the cache
+    return litellm.token_counter(model=model, text=content)
+
+
+def set_token_count(message, model: str = TOKENIZER_MODEL):
+    message.token_count = count_text_tokens(model, message.content or "")
+    return message
+
+
+def set_token_counts(instance):
+    # Token counts sent by the client are replaced, as only the server sets them
+    if isinstance(instance, Chat):
+        for message in instance.messages:
+            set_token_count(message)
+    return instance
+
+
+def get_context_budget(model: str, completion_kwargs: dict) -> int:
+    context_window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    reserved = completion_kwargs.get("max_tokens") or settings.completion_token_reserve
+    functions = completion_kwargs.get("functions")
+    if functions:
+        reserved += count_text_tokens(model, json.dumps(functions, sort_keys=True))
+    return context_window - reserved - REPLY_TOKEN_OVERHEAD
+
+
+def get_message_units(messages: list[dict]) -> list[list[int]]:
+    """
+    Groups the indexes of the non-system messages into units that are kept or
+    dropped together. A function reply is grouped with the assistant message
+    calling the function, as providers reject a reply without its call.
+    """
+    units: list[list[int]] = []
+    for index, message in enumerate(messages):
+        role = message.get("role")
+        if role == RoleTypes.SYSTEM:
+            continue
+        if (
+            role == RoleTypes.FUNCTION
+            and units
+            and units[-1][-1] == index - 1
+            and messages[units[-1][0]].get("function_call")
+        ):
+            units[-1].append(index)
+        else:
+            units.append([index])
+    return units
+
+
+def trim_messages(messages: list[dict], model: str, budget: int) -> list[dict]:
+    """
+    Keeps the system messages and the most recent messages that fit within the
+    token budget. The last message is always kept, with the function call it
+    replies to.
+    """
+    token_counts = [count_message_tokens(model, message) for message in messages]
+    kept = {
+        index
+        for index, message in enumerate(messages)
+        if message.get("role") == RoleTypes.SYSTEM
+    }
+    used = sum(token_counts[index] for index in kept)
+    units = get_message_units(messages)
+    for unit in reversed(units):
+        unit_tokens = sum(token_counts[index] for index in unit)
+        if used + unit_tokens > budget and unit is not units[-1]:
+            break
+        used += unit_tokens
+        kept.update(unit)
+    return [message for index, message in enumerate(messages) if index in kept]
+
+
+def fit_to_context(completion_kwargs: dict) -> dict:
+    model = completion_kwargs["model"]
+    budget = get_context_budget(model, completion_kwargs)
+    completion_kwargs["messages"] = trim_messages(
+        completion_kwargs["messages"], model, budget
+    )
+    return completion_kwargs
@@ -1,34 +1,79 @@
+import datetime
 from typing import Optional, Type
 
+import orjson
 import redis.asyncio as redis
 import redis.exceptions
 from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from ..dependencies import (
     get_redis_client,
     get_user,
+    get_ids,
+    get_fields,
+    get_cursor,
     build_get_new_instance_key,
     build_get_instance_key,
+    check_batch_size,
+    create_instance_ids,
+    get_key_with_id,
 )
-from ..exceptions import IndexNotImplemented, ObjectNotFoundException
-from ..models import User
+from ..exceptions import (
+    IndexNotImplemented,
+    InvalidSearchException,
+    ObjectNotFoundException,
+)
+from ..models import (
+    BatchItemResult,
+    BatchUpdateItem,
+    CRUDAction,
+    Datetime,
+    Page,
+    SearchHit,
+    User,
+)
+from ..models.completion import ModelTypes
 from ..redis.commands import (
     create_instance,
+    create_multiple_instances,
     delete_instance,
+    delete_multiple_instances,
     get_instance,
+    get_instance_fields,
+    get_multiple_instances,
     update_instance,
+    update_multiple_instances,
 )
+from ..redis.events import build_change_event, build_change_events
 from ..redis.keys import get_class_name
-from ..redis.search import SortingField, list_instances
-from ..types import queries
+from ..redis.pagination import Cursor, build_page_body
+from ..redis.index import get_tag_field_names, get_text_field_names
+from ..redis.queries import create_search_query
+from ..redis.search import SortingField, list_instances, search_instances
+from ..settings import settings
+from ..types import paths, queries
+from .context import set_token_counts
+
+OBJECT_PATHS = ["$.object"]
 
 
 def build_get_instance_endpoint(cls: Type):
     async def get_instance_endpoint(
         redis_client: redis.Redis = Depends(get_redis_client),
         key: str = Depends(build_get_instance_key(cls)),
+        fields: Optional[list[str]] = Depends(get_fields),
     ):
+        if fields:
+            projection = await get_instance_fields(
+                redis_client=redis_client,
+                key=key,
+                fields=fields,
+            )
+            if not projection:
+                raise ObjectNotFoundException(cls)
+            return JSONResponse(content=projection)
         instance = await get_instance(
             redis_client=redis_client,
             key=key,
@@ -47,12 +92,17 @@ def build_create_instance_endpoint(cls: Type):
         new_key: tuple[str, int] = Depends(build_get_new_instance_key(cls)),
         user: User = Depends(get_user),
     ):
+        created_at = Datetime()
         created, instance = await create_instance(
             redis_client=redis_client,
             owner=user,
-            instance=instance,
+            instance=set_token_counts(instance),
             key=new_key[0],
             instance_id=new_key[1],
+            created_at=created_at,
+            change_event=build_change_event(
+                user, get_class_name(cls), new_key[1], CRUDAction.CREATE, created_at
+            ),
         )
         if not created:
             raise HTTPException(
@@ -67,13 +117,20 @@ def build_create_instance_endpoint(cls: Type):
 def build_update_instance_endpoint(cls: Type):
     async def update_instance_endpoint(
         instance: cls,
+        id: int = paths.id_path,
         redis_client: redis.Redis = Depends(get_redis_client),
         key: str = Depends(build_get_instance_key(cls)),
+        user: User = Depends(get_user),
     ):
+        now = Datetime()
         updated, updated_at, instance = await update_instance(
             redis_client=redis_client,
-            instance=instance,
+            instance=set_token_counts(instance),
             key=key,
+            updated_at=now,
+            change_event=build_change_event(
+                user, get_class_name(cls), id, CRUDAction.UPDATE, now, OBJECT_PATHS
+            ),
         )
         if not updated and not updated_at:
             raise ObjectNotFoundException(cls)
@@ -84,12 +141,17 @@ def build_update_instance_endpoint(cls: Type):
 
 def build_delete_instance_endpoint(cls: Type):
     async def delete_instance_endpoint(
+        id: int = paths.id_path,
         redis_client: redis.Redis = Depends(get_redis_client),
         key: str = Depends(build_get_instance_key(cls)),
+        user: User = Depends(get_user),
     ):
         deleted = await delete_instance(
             redis_client=redis_client,
             key=key,
+            change_event=build_change_event(
+                user, get_class_name(cls), id, CRUDAction.DELETE
+            ),
         )
         if deleted:
             return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -99,17 +161,166 @@ def build_delete_instance_endpoint(cls: Type):
     return delete_instance_endpoint
 
 
+def batch_succeeded(*results) -> bool:
+    return all(result and not isinstance(result, Exception) for result in results)
+
+
+def get_batch_error_detail(default_detail: str, *results) -> str:
+    errors = [str(result) for result in results if isinstance(result, Exception)]
+    return errors[0] if errors else default_detail
+
+
+def get_not_found_detail(cls: Type) -> str:
+    return f"Ressource of type '{get_class_name(cls)}' not found"
+
+
+def build_get_multiple_instances_endpoint(cls: Type):
+    async def get_multiple_instances_endpoint(
+        ids: list[int] = Depends(get_ids),
+        redis_client: redis.Redis = Depends(get_redis_client),
+        user: User = Depends(get_user),
+    ):
+        class_name = get_class_name(cls)
+        instances = await get_multiple_instances(
+            redis_client=redis_client,
+            keys=[get_key_with_id(class_name, user, id) for id in ids],
+        )
+        return [
+            (
+                BatchItemResult(id=id, success=True, instance=instance)
+                if instance
+                else BatchItemResult(
+                    id=id, success=False, detail=get_not_found_detail(cls)
+                )
+            )
+            for id, instance in zip(ids, instances)
+        ]
+
+    return get_multiple_instances_endpoint
+
+
+def build_create_multiple_instances_endpoint(cls: Type):
+    async def create_multiple_instances_endpoint(
+        instances: list[cls],
+        redis_client: redis.Redis = Depends(get_redis_client),
+        user: User = Depends(get_user),
+    ):
+        check_batch_size(len(instances))
+        class_name = get_class_name(cls)
+        instance_ids = await create_instance_ids(
+            redis_client, class_name, len(instances)
+        )
+        created_at = Datetime()
+        results = await create_multiple_instances(
+            redis_client=redis_client,
+            owner=user,
+            instances=[set_token_counts(instance) for instance in instances],
+            instance_ids=instance_ids,
+            keys=[get_key_with_id(class_name, user, id) for id in instance_ids],
+            created_at=created_at,
+            change_events=build_change_events(
+                user, class_name, instance_ids, CRUDAction.CREATE, created_at
+            ),
+        )
+        return [
+            (
+                BatchItemResult(id=instance.id, success=True, instance=instance)
+                if batch_succeeded(created)
+                else BatchItemResult(
+                    id=instance.id,
+                    success=False,
+                    detail=get_batch_error_detail(
+                        f"Ressource of type '{class_name}' could not be created.",
+                        created,
+                    ),
+                )
+            )
+            for created, instance in results
+        ]
+
+    return create_multiple_instances_endpoint
+
+
+def build_update_multiple_instances_endpoint(cls: Type):
+    async def update_multiple_instances_endpoint(
+        items: list[BatchUpdateItem[cls]],
+        redis_client: redis.Redis = Depends(get_redis_client),
+        user: User = Depends(get_user),
+    ):
+        check_batch_size(len(items))
+        class_name = get_class_name(cls)
+        updated_at = Datetime()
+        results = await update_multiple_instances(
+            redis_client=redis_client,
+            instances=[set_token_counts(item.object) for item in items],
+            keys=[get_key_with_id(class_name, user, item.id) for item in items],
+            updated_at=updated_at,
+            change_events=build_change_events(
+                user,
+                class_name,
+                [item.id for item in items],
+                CRUDAction.UPDATE,
+                updated_at,
+                OBJECT_PATHS,
+            ),
+        )
+        return [
+            (
+                BatchItemResult(id=item.id, success=True, instance=result[-1])
+                if batch_succeeded(*result)
+                else BatchItemResult(
+                    id=item.id,
+                    success=False,
+                    detail=get_batch_error_detail(get_not_found_detail(cls), *result),
+                )
+            )
+            for item, result in zip(items, results)
+        ]
+
+    return update_multiple_instances_endpoint
+
+
+def build_delete_multiple_instances_endpoint(cls: Type):
+    async def delete_multiple_instances_endpoint(
+        ids: list[int] = Depends(get_ids),
+        redis_client: redis.Redis = Depends(get_redis_client),
+        user: User = Depends(get_user),
+    ):
+        class_name = get_class_name(cls)
+        results = await delete_multiple_instances(
+            redis_client=redis_client,
+            keys=[get_key_with_id(class_name, user, id) for id in ids],
+            change_events=build_change_events(user, class_name, ids, CRUDAction.DELETE),
+        )
+        return [
+            (
+                BatchItemResult(id=id, success=True)
+                if batch_succeeded(deleted)
+                else BatchItemResult(
+                    id=id,
+                    success=False,
+                    detail=get_batch_error_detail(get_not_found_detail(cls), deleted),
+                )
+            )
+            for id, deleted in zip(ids, results)
+        ]
+
+    return delete_multiple_instances_endpoint
+
+
 def build_list_instances_endpoint(cls: Type):
     async def list_instances_endpoint(
         offset: Optional[int] = queries.offset_query,
         limit: Optional[int] = queries.limit_query,
         sorting_field: Optional[SortingField] = queries.sorting_field_query,
         ascending: Optional[bool] = queries.ascending_query,
+        cursor: Optional[Cursor] = Depends(get_cursor),
+        fields: Optional[list[str]] = Depends(get_fields),
         redis_client: redis.Redis = Depends(get_redis_client),
         user: User = Depends(get_user),
     ):
         try:
-            return await list_instances(
+            total, instances, next_cursor = await list_instances(
                 redis_client,
                 class_name=get_class_name(cls),
                 owner=user,
@@ -117,7 +328,13 @@ def build_list_instances_endpoint(cls: Type):
                 limit=limit,
                 sorting_field=sorting_field,
                 ascending=ascending,
+                cursor=cursor,
+                fields=fields,
             )
+            body = build_page_body(total, instances, next_cursor)
+            if settings.validate_list_responses and not fields:
+                return orjson.loads(body)
+            return Response(content=body, media_type="application/json")
         except redis.exceptions.ResponseError as exec:
             if str(exec).endswith("no such index"):
                 raise IndexNotImplemented(cls) from exec
@@ -127,12 +344,97 @@ def build_list_instances_endpoint(cls: Type):
     return list_instances_endpoint
 
 
+def get_tag_filters(class_name: str, **tag_filters: list[str] | None) -> dict:
+    tag_field_names = get_tag_field_names(class_name)
+    for field, values in tag_filters.items():
+        if values and field not in tag_field_names:
+            raise InvalidSearchException(
+                f"Filtering on '{field}' is not supported for {class_name}"
+            )
+    return {field: values for field, values in tag_filters.items() if values}
+
+
+def build_search_instances_endpoint(cls: Type):
+    async def search_instances_endpoint(
+        q: Optional[str] = queries.search_text_query,
+        tag: Optional[list[str]] = queries.tag_query,
+        model: Optional[ModelTypes] = queries.model_query,
+        language: Optional[str] = queries.language_query,
+        created_after: Optional[datetime.datetime] = queries.created_after_query,
+        offset: Optional[int] = queries.offset_query,
+        limit: Optional[int] = queries.limit_query,
+        redis_client: redis.Redis = Depends(get_redis_client),
+        user: User = Depends(get_user),
+    ):
+        class_name = get_class_name(cls)
+        text_fields = get_text_field_names(class_name)
+        if q and not text_fields:
+            raise InvalidSearchException(
+                f"Full text search is not supported for {class_name}"
+            )
+        query = create_search_query(
+            owner=user,
+            text=q,
+            tag_filters=get_tag_filters(
+                class_name,
+                tag=tag,
+                model=[model] if model else None,
+                language=[language] if language else None,
+            ),
+            created_after=created_after.timestamp() if created_after else None,
+            text_fields=text_fields,
+        ).paging(offset, limit)
+        try:
+            total, hits = await search_instances(redis_client, query, class_name)
+        except redis.exceptions.ResponseError as exec:
+            if str(exec).endswith("no such index"):
+                raise IndexNotImplemented(cls) from exec
+            raise exec
+        body = build_page_body(total, hits)
+        if settings.validate_list_responses:
+            return orjson.loads(body)
+        return Response(content=body, media_type="application/json")
+
+    return search_instances_endpoint
+
+
 def add_crud_route(
     router: APIRouter,
     instance_model: BaseModel,
     response_model: BaseModel,
     prefix: str = "",
 ):
+    # Batch and search routes must be registered before "/{id}" routes to not be shadowed
+    router.add_api_route(
+        prefix + "/search",
+        build_search_instances_endpoint(instance_model),
+        response_model=Page[SearchHit[response_model]],
+        methods=["GET"],
+    )
+    router.add_api_route(
+        prefix + "/batch",
+        build_get_multiple_instances_endpoint(instance_model),
+        response_model=list[BatchItemResult[response_model]],
+        methods=["GET"],
+    )
+    router.add_api_route(
+        prefix + "/batch",
+        build_create_multiple_instances_endpoint(instance_model),
+        response_model=list[BatchItemResult[response_model]],
+        methods=["POST"],
+    )
+    router.add_api_route(
+        prefix + "/batch",
+        build_update_multiple_instances_endpoint(instance_model),
+        response_model=list[BatchItemResult[response_model]],
+        methods=["PUT"],
+    )
+    router.add_api_route(
+        prefix + "/batch",
+        build_delete_multiple_instances_endpoint(instance_model),
+        response_model=list[BatchItemResult[response_model]],
+        methods=["DELETE"],
+    )
     router.add_api_route(
         prefix + "/{id}",
         build_get_instance_endpoint(instance_model),
@@ -161,6 +463,6 @@ def add_crud_route(
     router.add_api_route(
         prefix,
         build_list_instances_endpoint(instance_model),
-        response_model=list[response_model],
+        response_model=Page[response_model],
         methods=["GET"],
     )
@@ -0,0 +1,88 @@
+import json
+from typing import Any, Iterator
+
+from fastapi import Request
+from jinja2 import TemplateError
+from pydantic import ValidationError
+
+from ..dependencies import check_batch_size
+from ..exceptions import InvalidBatchException
+from ..models import PromptTemplate
+from ..settings import settings
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+RENDER_CHUNK_SIZE = 100
+
+
+def split_ndjson(body: bytes) -> list[bytes]:
+    return [line for line in body.splitlines() if line.strip()]
+
+
+async def read_batch_body(request: Request) -> bytes:
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > settings.batch_max_body_size:
+            raise InvalidBatchException(
+                f"Request body exceeds maximum of {settings.batch_max_body_size} bytes"
+            )
+    return bytes(body)
+
+
+def iter_batch_parameters(body: bytes, content_type: str | None) -> Iterator[Any]:
+    """
+    Splits the body of a batch request into the parameters of each row. The
+    number of rows is checked up front, so the request fails before the
+    response starts streaming.
+    """
+    if content_type and content_type.startswith(NDJSON_MEDIA_TYPE):
+        parameters_list = split_ndjson(body)
+    else:
+        try:
+            parameters_list = json.loads(body)
+        except ValueError:
+            raise InvalidBatchException("Request body is not valid JSON")
+        if not isinstance(parameters_list, list):
+            raise InvalidBatchException(
+                "Request body must be a list of parameter objects"
+            )
+    check_batch_size(len(parameters_list))
+    return iter(parameters_list)
+
+
+def render_parameters(prompt_template: PromptTemplate, parameters: Any) -> Any:
+    if isinstance(parameters, bytes):
+        parameters = json.loads(parameters)
+    if not isinstance(parameters, dict):
+        raise ValueError("Parameters must be a JSON object")
+    return prompt_template.render_messages(parameters)
+
+
+def render_prompt_template_lines(
+    prompt_template: PromptTemplate,
+    parameters_iterator: Iterator[Any],
+) -> Iterator[str]:
+    prompt_data = prompt_template.model_dump(
+        mode="json", exclude={"arguments", "messages"}
+    )
+    lines = []
+    for index, parameters in enumerate(parameters_iterator):
+        try:
+            result = {
+                "index": index,
+                "prompt": {
+                    **prompt_data,
+                    "messages": render_parameters(prompt_template, parameters),
+                },
+            }
+        except ValidationError as exec:
+            result = {"index": index, "detail": exec.errors(include_url=False)}
+        except (ValueError, TemplateError) as exec:
+            # Undefined variables and failing filters only fail their own row
+            result = {"index": index, "detail": str(exec)}
+        lines.append(json.dumps(result, default=str))
+        if len(lines) == RENDER_CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
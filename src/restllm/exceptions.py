@@ -1,3 +1,5 @@
+import math
+
 import litellm
 
 from typing import Type
@@ -16,6 +18,14 @@ class ObjectNotFoundException(HTTPException):
         )
 
 
+class CompletionJobNotFoundException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Completion job not found",
+        )
+
+
 class IndexNotImplemented(HTTPException):
     def __init__(self, cls: Type):
         super().__init__(
@@ -32,6 +42,56 @@ class ObjectAlreadyExistsException(HTTPException):
         )
 
 
+class InvalidBatchException(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail,
+        )
+
+
+class InvalidFieldsException(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail,
+        )
+
+
+class InvalidCursorException(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail,
+        )
+
+
+class InvalidSearchException(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=detail,
+        )
+
+
+class RateLimitExceededException(HTTPException):
+    def __init__(self, headers: dict[str, str]):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers=headers,
+        )
+
+
+class CompletionOverloadedException(HTTPException):
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many completions are waiting for the model. Try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
 class InvalidCredentialsException(HTTPException):
     def __init__(self):
         super().__init__(
@@ -1,7 +1,10 @@
 from fastapi import FastAPI
 from .dependencies import shutdown, startup
+from .endpoints.completion import start_completion_job_worker
 from .middleware import AccessLogMiddleware
 from .routers import (
+    admission,
+    analytics,
     chats,
     events,
     prompts,
@@ -10,8 +13,10 @@ from .routers import (
     users,
     functions,
     authentication,
+    metrics,
 )
 from .exceptions import validation_exception_handler, litellm_badrequest_handler
+from .settings import settings
 from pydantic import ValidationError
 import litellm
 
@@ -22,6 +27,7 @@ app = FastAPI(
 
 # Event handlers
 app.add_event_handler("startup", startup)
+app.add_event_handler("startup", start_completion_job_worker)
 app.add_event_handler("shutdown", shutdown)
 
 # Exception handlers
@@ -37,5 +43,14 @@ app.include_router(completion_parameters.router, prefix="/v1")
 app.include_router(users.router, prefix="/v1")
 app.include_router(functions.router, prefix="/v1")
 app.include_router(authentication.router, prefix="/v1")
+app.include_router(analytics.router, prefix="/v1")
+app.include_router(admission.router, prefix="/v1")
+if settings.metrics:
+    app.include_router(metrics.router)
 
-app.add_middleware(AccessLogMiddleware)
\ No newline at end of file
+app.add_middleware(AccessLogMiddleware)
+
+if settings.tracing:
+    from .tracing import instrument_app
+
+    instrument_app(app)
\ No newline at end of file
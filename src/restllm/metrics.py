@@ -0,0 +1,229 @@
+import functools
+import time
+from bisect import bisect_left
+from typing import Awaitable, Callable, Iterable, ParamSpec, TypeVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+RATE_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+Parameters = ParamSpec("Parameters")
+Result = TypeVar("Result")
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    labels = ",".join(
+        f'{name}="{escape_label_value(str(value))}"'
+        for name, value in zip(names, values)
+    )
+    return f"{{{labels}}}" if labels else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+
+    def render_header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        return self.render_header() + [
+            f"{self.name}{format_labels(self.labels, values)} {format_value(value)}"
+            for values, value in self.values.items()
+        ]
+
+
+class Histogram(Metric):
+    """
+    Counts observations per bucket and label values. Counts are kept per
+    bucket and only summed into cumulative buckets when rendered, so an
+    observation is a bisect and two additions.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = (*buckets, float("inf"))
+        self.counts: dict[tuple[str, ...], list[int]] = {}
+        self.sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        counts = self.counts.get(label_values)
+        if counts is None:
+            counts = self.counts[label_values] = [0] * len(self.buckets)
+            self.sums[label_values] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[label_values] += value
+
+    def get_count(self, *label_values: str) -> int:
+        return sum(self.counts.get(label_values, ()))
+
+    def render(self) -> list[str]:
+        lines = self.render_header()
+        for values, counts in self.counts.items():
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = format_labels(
+                    (*self.labels, "le"), (*values, format_value(bucket))
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {format_value(self.sums[values])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """Reads its samples from a callback when rendered"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...],
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+    ):
+        super().__init__(name, description, labels)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        return self.render_header() + [
+            f"{self.name}{format_labels(self.labels, values)} {format_value(value)}"
+            for values, value in self.collect()
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+completion_first_token_seconds: Histogram = registry.register(
+    Histogram(
+        "restllm_completion_first_token_seconds",
+        "Time from the completion request to its first token",
+        ("model", "route"),
+    )
+)
+completion_inter_token_seconds: Histogram = registry.register(
+    Histogram(
+        "restllm_completion_inter_token_seconds",
+        "Time between two tokens of a completion",
+        ("model", "route"),
+    )
+)
+completion_duration_seconds: Histogram = registry.register(
+    Histogram(
+        "restllm_completion_duration_seconds",
+        "Time from the completion request to its last token",
+        ("model", "route"),
+    )
+)
+completion_tokens_per_second: Histogram = registry.register(
+    Histogram(
+        "restllm_completion_tokens_per_second",
+        "Tokens per second of a completion after its first token",
+        ("model", "route"),
+        buckets=RATE_BUCKETS,
+    )
+)
+completion_tokens_total: Counter = registry.register(
+    Counter(
+        "restllm_completion_tokens_total",
+        "Streamed completion tokens",
+        ("model", "route"),
+    )
+)
+redis_command_seconds: Histogram = registry.register(
+    Histogram(
+        "restllm_redis_command_seconds",
+        "Duration of the Redis commands in redis.commands, including the round trip",
+        ("command",),
+    )
+)
+
+
+def timed_redis_command(
+    function: Callable[Parameters, Awaitable[Result]],
+) -> Callable[Parameters, Awaitable[Result]]:
+    command = function.__name__
+
+    @functools.wraps(function)
+    async def wrapper(*args: Parameters.args, **kwargs: Parameters.kwargs) -> Result:
+        start = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            redis_command_seconds.observe(time.perf_counter() - start, command)
+
+    return wrapper
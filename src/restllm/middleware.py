@@ -1,27 +1,41 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-
-from .dependencies import get_redis_client
 import datetime
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .dependencies import access_log_writer
+
+EXCLUDED_PATHS = ("/docs", "/openapi.json", "/redoc", "/metrics")
+
+
+class AccessLogMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PATHS):
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
 
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-class AccessLogMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self,
-        request: Request,
-        call_next,
-    ):
-        if not request.url.path.startswith(("/docs", "/openapi.json", "/redoc")):
-            async_gen = get_redis_client()
-            redis_client = await async_gen.__anext__()
-            await redis_client.xadd(
-                "access_log_stream",
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            access_log_writer.log(
                 {
-                    "path": request.url.path,
+                    "path": scope["path"],
+                    "method": scope["method"],
+                    "status_code": status_code,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 3),
                     "timestamp": datetime.datetime.now(
                         tz=datetime.timezone.utc
                     ).timestamp(),
-                },
+                }
             )
-            return await call_next(request)
-        return await call_next(request)
@@ -3,3 +3,14 @@ from ..models.chat import *
 from ..models.events import *
 from ..models.prompts import *
 from ..models.completion import CompletionParameters, CompletionParametersWithMeta
+from ..models.batch import BatchItemResult, BatchUpdateItem
+from ..models.pagination import Page
+from ..models.search import SearchHit
+from ..models.analytics import (
+    DailyCount,
+    MessageStatistics,
+    ModelUsage,
+    ModelUsageStatistics,
+)
+from ..models.usage import TokenUsage, UsageSummary
+from ..models.jobs import CompletionJob
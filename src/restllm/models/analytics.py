@@ -0,0 +1,29 @@
+import datetime
+
+from pydantic import BaseModel, Field
+
+
+class DailyCount(BaseModel):
+    day: datetime.date = Field(description="UTC day", examples=["2023-11-01"])
+    count: int = Field(ge=0, examples=[4])
+
+
+class MessageStatistics(BaseModel):
+    chats: int = Field(default=0, ge=0, description="Number of chats")
+    messages: int = Field(default=0, ge=0, description="Number of messages in chats")
+    average: float = Field(default=0, ge=0, description="Average messages per chat")
+    max: int = Field(default=0, ge=0, description="Most messages in a single chat")
+
+
+class ModelUsage(BaseModel):
+    model: str | None = Field(
+        examples=["gpt-4"], description="Model, or null for documents without one"
+    )
+    count: int = Field(ge=0, examples=[12])
+
+
+class ModelUsageStatistics(BaseModel):
+    chats: list[ModelUsage] = Field(description="Models used by chats")
+    completion_parameters: list[ModelUsage] = Field(
+        description="Models used by saved completion parameters"
+    )
@@ -0,0 +1,23 @@
+from typing import Generic, Optional, TypeVar
+
+from pydantic import BaseModel, Field
+
+ObjectT = TypeVar("ObjectT")
+
+
+class BatchUpdateItem(BaseModel, Generic[ObjectT]):
+    id: int = Field(gt=0, examples=[1, 2, 3])
+    object: ObjectT
+
+
+class BatchItemResult(BaseModel, Generic[ObjectT]):
+    id: int = Field(examples=[1, 2, 3])
+    success: bool = Field(description="Whether the operation succeeded for this item")
+    detail: Optional[str] = Field(
+        default=None,
+        description="Reason for failure when the operation did not succeed",
+    )
+    instance: Optional[ObjectT] = Field(
+        default=None,
+        description="Resulting ressource. Empty for failed items and deletions",
+    )
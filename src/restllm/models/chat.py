@@ -1,6 +1,6 @@
 from enum import auto, UNIQUE, verify, StrEnum
 from typing import Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field
 
 from .base import MetaModel
 from .functions import FunctionCall
@@ -44,6 +44,12 @@ class ChatMessage(BaseModel):
         description="The name and arguments of a function that should be called, as generated by the model.",
         examples=[None]
     )
+    token_count: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="Number of tokens in the message. Set by the server",
+        examples=[None, 12],
+    )
 
 
 class Chat(BaseModel):
@@ -54,11 +60,20 @@ class Chat(BaseModel):
         description="A list of messages comprising the conversation so far."
     )
 
+    @computed_field(return_type=int)
+    @property
+    def message_count(self) -> int:
+        return len(self.messages)
+
     def last_message_is_user(self) -> bool:
         return self.messages[-1].role == RoleTypes.USER
 
     def dump_json_for_completion(self) -> dict:
-        completion_kwargs = self.model_dump(mode="json", exclude_none=True)
+        completion_kwargs = self.model_dump(
+            mode="json",
+            exclude_none=True,
+            exclude={"message_count": True, "messages": {"__all__": {"token_count"}}},
+        )
         completion_parameters: dict = completion_kwargs.pop("completion_parameters")
         completion_kwargs.update(completion_parameters)
 
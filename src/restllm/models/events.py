@@ -6,6 +6,8 @@ from typing import Any
 import redis.asyncio as redis
 from pydantic import UUID4, BaseModel, Field
 
+from ..settings import settings
+
 
 class EventType(str, Enum):
     TASK = "task"
@@ -40,6 +42,36 @@ class Event(BaseModel):
     object: Any
 
 
+class ObjectChange(BaseModel):
+    class_name: str
+    id: int
+    updated_at: float | None = Field(
+        default=None,
+        description="Timestamp of the change. Empty for deleted objects",
+    )
+    paths: list[str] | None = Field(
+        default=None,
+        description="JSON paths of the object that changed",
+        examples=[["$.object"], ["$.object.messages[2]"]],
+    )
+
+
+# Adds the event to the owner's stream and publishes it with the stream id in one
+# atomic call. When an object key is given, the event is only published if the
+# key's existence matches. Queued before a create or delete, or after an update,
+# in the same transaction, this keeps writes that fail from emitting events.
+# KEYS[1]: event stream, KEYS[2]: changed object key (optional)
+# ARGV[1]: stream max length, ARGV[2]: channel, ARGV[3]: event, ARGV[4]: 1 or 0
+PUBLISH_EVENT_SCRIPT = """
+if #KEYS > 1 and redis.call("EXISTS", KEYS[2]) ~= tonumber(ARGV[4]) then
+    return false
+end
+local id = redis.call("XADD", KEYS[1], "MAXLEN", "~", ARGV[1], "*", "data", ARGV[3])
+redis.call("PUBLISH", ARGV[2], id .. " " .. ARGV[3])
+return id
+"""
+
+
 class EventWithMeta(BaseModel):
     uuid: str | UUID4 = Field(default_factory=uuid.uuid4)
     owner: int | str
@@ -47,11 +79,43 @@ class EventWithMeta(BaseModel):
     event: Event
     created_at: datetime = Field(default_factory=datetime.now)
 
-    async def publish(self, redis_client: redis.Redis) -> int:
-        return await redis_client.publish(
-            self.get_channel(),
-            self.model_dump_json(),
+    async def publish(
+        self,
+        redis_client: redis.Redis,
+        stream_max_len: int = settings.event_stream_max_len,
+    ) -> bytes:
+        return await self.add_to_pipeline(redis_client, stream_max_len)
+
+    def add_to_pipeline(
+        self,
+        pipeline: redis.Redis,
+        stream_max_len: int = settings.event_stream_max_len,
+        object_key: str | None = None,
+        object_exists: bool = True,
+    ):
+        keys = [self.get_stream_key()]
+        if object_key:
+            keys.append(object_key)
+        return pipeline.eval(
+            PUBLISH_EVENT_SCRIPT,
+            len(keys),
+            *keys,
+            *self.get_publish_args(stream_max_len),
+            int(object_exists),
         )
 
+    def get_publish_args(
+        self,
+        stream_max_len: int = settings.event_stream_max_len,
+    ) -> list[int | str]:
+        return [stream_max_len, self.get_channel(), self.model_dump_json()]
+
     def get_channel(self) -> str:
         return f"{self.type.value}:{self.owner}"
+
+    def get_stream_key(self) -> str:
+        return get_event_stream_key(self.get_channel())
+
+
+def get_event_stream_key(channel: str) -> str:
+    return f"event_stream:{channel}"
@@ -0,0 +1,34 @@
+import datetime
+import uuid
+
+from pydantic import BaseModel, Field
+
+from .events import EventStatus
+
+
+def get_timestamp() -> float:
+    return datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+
+
+class CompletionJob(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    owner: int
+    chat_id: int
+    model: str = Field(examples=["gpt-4"])
+    cache: bool = False
+    status: EventStatus = EventStatus.PENDING
+    content: str | None = Field(
+        default=None,
+        description="Content of the completion once the job has completed",
+    )
+    error: str | None = None
+    attempt: int = Field(
+        default=0,
+        description="Times the job was run again after its worker stopped",
+    )
+    created_at: float = Field(default_factory=get_timestamp)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    def is_finished(self) -> bool:
+        return self.status in (EventStatus.COMPLETED, EventStatus.FAILED)
@@ -0,0 +1,14 @@
+from typing import Generic, Optional, TypeVar
+
+from pydantic import BaseModel, Field
+
+ObjectT = TypeVar("ObjectT")
+
+
+class Page(BaseModel, Generic[ObjectT]):
+    total: int = Field(description="Number of ressources matching the query")
+    items: list[ObjectT]
+    next_cursor: Optional[str] = Field(
+        default=None,
+        description="Cursor for the next page. Empty when there are no more results",
+    )
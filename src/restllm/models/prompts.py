@@ -1,5 +1,6 @@
 import re
 from enum import Enum, auto, UNIQUE, verify, StrEnum
+from functools import lru_cache
 
 from jinja2 import Template
 from pydantic import (
@@ -12,7 +13,12 @@ from pydantic import (
 )
 
 from .base import MetaModel
-from .validators import is_valid_jinja2_template, names_and_variables_match
+from ..settings import settings
+from .validators import (
+    environment,
+    is_valid_jinja2_template,
+    names_and_variables_match,
+)
 
 import iso639
 import iso639.exceptions
@@ -178,6 +184,31 @@ class TemplateMessage(BaseModel):
     )
 
 
+@lru_cache(maxsize=settings.template_cache_size)
+def compile_template(content: str) -> Template:
+    return environment.from_string(content)
+
+
+@lru_cache(maxsize=settings.template_cache_size)
+def create_arguments_model(
+    name: str, arguments: tuple[tuple[str, VariableType], ...]
+) -> type[BaseModel]:
+    return create_model(
+        name,
+        **{
+            argument_name: (variable_type.type, ...)
+            for argument_name, variable_type in arguments
+        },
+    )
+
+
+def get_template_cache_info() -> dict[str, dict[str, int]]:
+    return {
+        cached_function.__name__: cached_function.cache_info()._asdict()
+        for cached_function in (compile_template, create_arguments_model)
+    }
+
+
 class PromptTemplate(BasePrompt):
     arguments: list[PromptTemplateArgument] = Field(
         description="Parameter name and type for the Jinja2 template. Keys must match the template"
@@ -201,24 +232,26 @@ class PromptTemplate(BasePrompt):
     def _get_variable_names(self) -> list[str]:
         return [item.name for item in self.arguments]
 
-    def _get_pydantic_types(self) -> dict[str, tuple[type, ...]]:
-        return {item.name: (item.type.type, ...) for item in self.arguments}
-
-    def create_model(self) -> BaseModel:
-        return create_model(self.name, **self._get_pydantic_types())
+    def create_model(self) -> type[BaseModel]:
+        return create_arguments_model(
+            self.name, tuple((item.name, item.type) for item in self.arguments)
+        )
 
-    def render(self, parameters: dict) -> dict:
+    def render_messages(self, parameters: dict) -> list[dict]:
         template_model = self.create_model()
         parameter_instance = template_model.model_validate(parameters, strict=True)
-        messages = [
+        return [
             {
                 "role": message.role,
-                "content": Template(message.content).render(
+                "content": compile_template(message.content).render(
                     parameter_instance.model_dump()
                 ),
             }
             for message in self.messages
         ]
+
+    def render(self, parameters: dict) -> dict:
+        messages = self.render_messages(parameters)
         prompt_dict = self.model_dump()
         prompt_dict.update({"messages": messages})
         return prompt_dict
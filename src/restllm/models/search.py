@@ -0,0 +1,14 @@
+from typing import Generic, TypeVar
+
+from pydantic import BaseModel, Field
+
+ObjectT = TypeVar("ObjectT")
+
+
+class SearchHit(BaseModel, Generic[ObjectT]):
+    score: float = Field(description="Relevance score of the ressource for the query")
+    highlights: dict[str, str] = Field(
+        default_factory=dict,
+        description="Matching text fields with the query terms highlighted",
+    )
+    instance: ObjectT
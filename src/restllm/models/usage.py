@@ -0,0 +1,64 @@
+import datetime
+
+from pydantic import BaseModel, Field, computed_field
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "requests")
+
+
+def get_current_period() -> str:
+    return datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y-%m")
+
+
+def get_usage_key(owner: int, period: str) -> str:
+    return f"usage:{owner}:{period}"
+
+
+class TokenUsage(BaseModel):
+    owner: int
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    requests: int = 0
+    period: str = Field(default_factory=get_current_period)
+
+    def get_key(self) -> str:
+        return get_usage_key(self.owner, self.period)
+
+    def get_increments(self) -> dict[str, int]:
+        return {
+            f"{self.model}:{field}": getattr(self, field)
+            for field in USAGE_FIELDS
+            if getattr(self, field)
+        }
+
+
+class ModelTokenUsage(BaseModel):
+    model: str = Field(examples=["gpt-4"])
+    prompt_tokens: int = Field(default=0, ge=0)
+    completion_tokens: int = Field(default=0, ge=0)
+    requests: int = Field(default=0, ge=0, description="Number of completions")
+
+    @computed_field(return_type=int)
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class UsageSummary(BaseModel):
+    period: str = Field(description="Month of the usage", examples=["2023-11"])
+    models: list[ModelTokenUsage]
+
+
+def parse_usage_ledger(period: str, ledger: dict[bytes, bytes]) -> UsageSummary:
+    models: dict[str, dict[str, int]] = {}
+    for name, value in ledger.items():
+        model, _, field = name.decode().rpartition(":")
+        if field in USAGE_FIELDS:
+            models.setdefault(model, {})[field] = int(value)
+    return UsageSummary(
+        period=period,
+        models=[
+            ModelTokenUsage(model=model, **fields)
+            for model, fields in sorted(models.items())
+        ],
+    )
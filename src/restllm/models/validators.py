@@ -1,17 +1,29 @@
-from jinja2 import Environment, TemplateSyntaxError, meta
+from functools import lru_cache
+
+from jinja2 import Environment, TemplateSyntaxError, meta, nodes
+
+from ..settings import settings
+
+environment = Environment()
+
+
+@lru_cache(maxsize=settings.template_cache_size)
+def parse_template(template: str) -> nodes.Template:
+    return environment.parse(template)
+
+
+@lru_cache(maxsize=settings.template_cache_size)
+def get_template_variables(template: str) -> frozenset[str]:
+    return frozenset(meta.find_undeclared_variables(parse_template(template)))
 
 
 def is_valid_jinja2_template(template: str) -> bool:
-    env = Environment()
     try:
-        env.parse(template)
+        parse_template(template)
         return True
     except TemplateSyntaxError:
         return False
 
 
 def names_and_variables_match(template: str, parameters: list[str]) -> bool:
-    env = Environment()
-    parsed_content = env.parse(template)
-    required_keys = meta.find_undeclared_variables(parsed_content)
-    return set(required_keys) == set(parameters)
+    return get_template_variables(template) == set(parameters)
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_PREFIX = "ollama/"
+
+StartRoute = Callable[[str], Awaitable[AsyncIterator[str]]]
+
+
+def get_routes(model: str) -> list[str]:
+    return list(dict.fromkeys([model, *settings.completion_fallbacks.get(model, [])]))
+
+
+def get_route_kwargs(completion_kwargs: dict, route: str) -> dict:
+    route_kwargs = {**completion_kwargs, "model": route}
+    if route.startswith(OLLAMA_PREFIX):
+        route_kwargs["api_base"] = str(settings.ollama_base_url)
+    return route_kwargs
+
+
+class FirstTokenTracker:
+    """
+    Keeps a window of recent times to first token per route. The deadline for
+    hedging a route is a percentile of its window, or the default deadline
+    until the window holds enough samples.
+    """
+
+    def __init__(
+        self,
+        window_size: int = 200,
+        min_samples: int = 20,
+        percentile: float = 0.95,
+        default_deadline: float = 5.0,
+    ):
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.default_deadline = default_deadline
+        self.samples: dict[str, deque[float]] = {}
+
+    def record(self, route: str, seconds: float) -> None:
+        if route not in self.samples:
+            self.samples[route] = deque(maxlen=self.window_size)
+        self.samples[route].append(seconds)
+
+    def get_percentile(self, route: str, percentile: float) -> float | None:
+        samples = self.samples.get(route)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(math.ceil(percentile * len(ordered)), len(ordered)) - 1]
+
+    def get_deadline(self, route: str) -> float:
+        if len(self.samples.get(route, ())) < self.min_samples:
+            return self.default_deadline
+        return self.get_percentile(route, self.percentile)
+
+
+class RouteAttempt:
+    def __init__(self, route: str, start: StartRoute):
+        self.route = route
+        self.started_at = time.monotonic()
+        self.requested_at: float | None = None
+        self.requested = asyncio.Event()
+        self.tokens: AsyncIterator[str] | None = None
+        self.task = asyncio.create_task(self.get_first_token(start))
+
+    async def get_first_token(self, start: StartRoute) -> str | None:
+        self.tokens = await start(self.route)
+        self.requested_at = time.monotonic()
+        self.requested.set()
+        return await anext(self.tokens, None)
+
+    def is_queued(self) -> bool:
+        return self.requested_at is None and not self.task.done()
+
+    async def wait_requested(self) -> None:
+        """Waits until the completion was requested, or failed before that"""
+        requested = asyncio.create_task(self.requested.wait())
+        try:
+            await asyncio.wait(
+                [self.task, requested], return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            requested.cancel()
+
+    def get_elapsed(self) -> float:
+        return time.monotonic() - (self.requested_at or self.started_at)
+
+    async def cancel(self) -> None:
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        if self.tokens is not None:
+            await self.tokens.aclose()
+
+
+async def stream_from_first_token(
+    first_token: str | None,
+    tokens: AsyncIterator[str],
+) -> AsyncIterator[str]:
+    try:
+        if first_token is None:
+            return
+        yield first_token
+        async for token in tokens:
+            yield token
+    finally:
+        await tokens.aclose()
+
+
+class CompletionRouter:
+    """
+    Starts a completion on the first of an ordered list of routes, and falls
+    back to the next route when a route fails before its first token. With
+    hedging, a second request is fired when no first token arrived within the
+    deadline of the route, and the request that produces a token first is
+    streamed while the other is cancelled. The deadline counts from when the
+    completion was requested, so time spent waiting for admission is not
+    hedged.
+    """
+
+    def __init__(self, tracker: FirstTokenTracker, hedging: bool = False):
+        self.tracker = tracker
+        self.hedging = hedging
+
+    def get_hedge_timeout(self, attempts: list[RouteAttempt]) -> float | None:
+        if len(attempts) != 1 or attempts[0].requested_at is None:
+            return None
+        attempt = attempts[0]
+        return max(
+            self.tracker.get_deadline(attempt.route)
+            - (time.monotonic() - attempt.requested_at),
+            0,
+        )
+
+    async def route(
+        self,
+        routes: list[str],
+        start: StartRoute,
+    ) -> tuple[str, AsyncIterator[str]]:
+        """
+        Returns the route that produced the first token, and the tokens of
+        its completion. Raises the error of the last route when all fail.
+        """
+        remaining_routes = deque(routes)
+        attempts: list[RouteAttempt] = []
+        hedged = not self.hedging
+        try:
+            while True:
+                if not attempts:
+                    attempts.append(RouteAttempt(remaining_routes.popleft(), start))
+                if not hedged and attempts[0].is_queued():
+                    await attempts[0].wait_requested()
+                    continue
+                done, _ = await asyncio.wait(
+                    [attempt.task for attempt in attempts],
+                    timeout=None if hedged else self.get_hedge_timeout(attempts),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedged = True
+                    route = (
+                        remaining_routes.popleft()
+                        if remaining_routes
+                        else attempts[0].route
+                    )
+                    logger.info("Hedging %s with %s", attempts[0].route, route)
+                    attempts.append(RouteAttempt(route, start))
+                    continue
+                for attempt in [attempt for attempt in attempts if attempt.task in done]:
+                    attempts.remove(attempt)
+                    error = attempt.task.exception()
+                    if error is None:
+                        return attempt.route, await self.finish(attempt, attempts)
+                    if not attempts and not remaining_routes:
+                        raise error
+                    logger.warning(
+                        "Completion route %s failed: %s", attempt.route, error
+                    )
+        except BaseException:
+            for attempt in attempts:
+                await attempt.cancel()
+            raise
+
+    async def finish(
+        self,
+        winner: RouteAttempt,
+        losers: list[RouteAttempt],
+    ) -> AsyncIterator[str]:
+        self.tracker.record(winner.route, winner.get_elapsed())
+        for loser in losers:
+            if loser.requested_at is not None:
+                # The first token of the loser would have arrived later than this
+                self.tracker.record(loser.route, loser.get_elapsed())
+            await loser.cancel()
+        losers.clear()
+        return stream_from_first_token(winner.task.result(), winner.tokens)
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogWriter:
+    """
+    Buffers access log entries in a bounded queue and writes them to a Redis
+    stream in pipelined batches. Entries are dropped and counted when the
+    queue is full, so logging never blocks a request.
+    """
+
+    def __init__(
+        self,
+        stream_name: str = "access_log_stream",
+        max_queue_size: int = 10_000,
+        batch_size: int = 500,
+        stream_max_len: int = 100_000,
+    ):
+        self.stream_name = stream_name
+        self.batch_size = batch_size
+        self.stream_max_len = stream_max_len
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self.written = 0
+
+    def log(self, entry: dict) -> None:
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def get_batch(self, first_entry: dict | None = None) -> list[dict]:
+        batch = [first_entry] if first_entry else []
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def write(self, redis_client: redis.Redis, batch: list[dict]) -> None:
+        if not batch:
+            return
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            for entry in batch:
+                pipeline.xadd(
+                    self.stream_name,
+                    entry,
+                    maxlen=self.stream_max_len,
+                    approximate=True,
+                )
+            await pipeline.execute()
+        self.written += len(batch)
+
+    async def run(self, redis_client: redis.Redis) -> None:
+        while True:
+            batch = self.get_batch(await self.queue.get())
+            try:
+                await self.write(redis_client, batch)
+            except redis.RedisError:
+                self.dropped += len(batch)
+                logger.exception("Failed to write %d access log entries", len(batch))
+
+    async def drain(self, redis_client: redis.Redis) -> None:
+        while not self.queue.empty():
+            await self.write(redis_client, self.get_batch())
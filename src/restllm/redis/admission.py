@@ -0,0 +1,332 @@
+import asyncio
+import secrets
+import time
+from collections import deque
+from typing import AsyncIterator
+
+import anyio
+import redis.asyncio as redis
+from pydantic import BaseModel, Field
+
+from ..settings import ModelLimit
+from .scripts import LuaScript
+
+# Admits a completion when the model has a free slot and the tokens of the
+# completion fit in its budget for the last minute. Slots are leases that expire,
+# so a worker that dies mid completion does not hold its slot forever.
+# KEYS[1]: leases of the model, KEYS[2]: tokens charged to the model
+# ARGV[1]: concurrency, ARGV[2]: tokens per minute or 0, ARGV[3]: tokens of the
+# completion, ARGV[4]: lease id, ARGV[5]: lease ttl in ms
+ADMISSION_SCRIPT = """
+local concurrency = tonumber(ARGV[1])
+local tokens_per_minute = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+if redis.call("ZCARD", KEYS[1]) >= concurrency then
+    return {0, 0}
+end
+
+if tokens_per_minute > 0 then
+    tokens = math.min(tokens, tokens_per_minute)
+    redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", now - 60000)
+    local charges = redis.call("ZRANGE", KEYS[2], 0, -1, "WITHSCORES")
+    local used = 0
+    for index = 1, #charges, 2 do
+        used = used + tonumber(string.match(charges[index], ":(%d+)$"))
+    end
+    if used + tokens > tokens_per_minute then
+        for index = 1, #charges, 2 do
+            used = used - tonumber(string.match(charges[index], ":(%d+)$"))
+            if used + tokens <= tokens_per_minute then
+                return {0, tonumber(charges[index + 1]) + 60000 - now}
+            end
+        end
+    end
+    redis.call("ZADD", KEYS[2], now, ARGV[4] .. ":" .. tokens)
+    redis.call("PEXPIRE", KEYS[2], 60000)
+end
+
+redis.call("ZADD", KEYS[1], now + tonumber(ARGV[5]), ARGV[4])
+redis.call("PEXPIRE", KEYS[1], tonumber(ARGV[5]))
+return {1, 0}
+"""
+
+admission_script = LuaScript(ADMISSION_SCRIPT)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Too many completions waiting for model '{model}'")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def get_lease_key(model: str) -> str:
+    return f"admission:{model}:leases"
+
+
+def get_token_budget_key(model: str) -> str:
+    return f"admission:{model}:tokens"
+
+
+class AdmissionLease(BaseModel):
+    model: str
+    id: str = Field(default_factory=lambda: secrets.token_hex(8))
+    tokens: int
+    refreshed_at: float = Field(default_factory=time.monotonic)
+
+
+class AdmissionStatistics(BaseModel):
+    model: str = Field(examples=["gpt-4"])
+    queued: int = Field(
+        default=0,
+        description="Completions waiting for admission in this process",
+    )
+    in_flight: int = Field(
+        default=0,
+        description="Admitted completions running in this process",
+    )
+    admitted: int = 0
+    rejected: int = Field(
+        default=0,
+        description="Completions rejected as the queue was full",
+    )
+    timed_out: int = Field(
+        default=0,
+        description="Completions rejected after waiting for the queue timeout",
+    )
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    global_in_flight: int = Field(
+        default=0,
+        description="Admitted completions running in all workers",
+    )
+
+    def record_wait(self, wait_seconds: float) -> None:
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+class AdmissionController:
+    """
+    Admits upstream completions per model within the concurrency and tokens per
+    minute shared by all workers in Redis. Completions wait for admission in a
+    FIFO queue per model and process, where only the head of the queue asks
+    Redis. A completion is rejected when the queue is full, or when it has
+    waited for longer than the queue timeout.
+    """
+
+    def __init__(
+        self,
+        default_limit: ModelLimit,
+        model_limits: dict[str, ModelLimit] | None = None,
+        queue_size: int = 100,
+        queue_timeout: float = 30.0,
+        lease_ttl: int = 300,
+        poll_interval: float = 0.1,
+    ):
+        self.default_limit = default_limit
+        self.model_limits = model_limits or {}
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.queues: dict[str, deque[asyncio.Event]] = {}
+        self.released: dict[str, asyncio.Event] = {}
+        self.statistics: dict[str, AdmissionStatistics] = {}
+        self.retry_hints: dict[str, float] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def get_limit(self, model: str) -> ModelLimit:
+        return self.model_limits.get(model, self.default_limit)
+
+    def get_statistics(self, model: str) -> AdmissionStatistics:
+        if model not in self.statistics:
+            self.statistics[model] = AdmissionStatistics(model=model)
+        return self.statistics[model]
+
+    def get_retry_after(self, model: str) -> float:
+        """Seconds until the token budget of the model has room, as told by Redis"""
+        return max(self.retry_hints.get(model, 0.0), 1.0)
+
+    async def try_acquire(
+        self,
+        redis_client: redis.Redis,
+        lease: AdmissionLease,
+    ) -> tuple[bool, float]:
+        limit = self.get_limit(lease.model)
+        allowed, retry_after_ms = await admission_script(
+            redis_client,
+            keys=[get_lease_key(lease.model), get_token_budget_key(lease.model)],
+            args=[
+                limit.concurrency,
+                limit.tokens_per_minute,
+                lease.tokens,
+                lease.id,
+                self.lease_ttl * 1000,
+            ],
+        )
+        return allowed == 1, retry_after_ms / 1000
+
+    async def wait_for_release(self, model: str, timeout: float) -> None:
+        released = self.released.setdefault(model, asyncio.Event())
+        try:
+            await asyncio.wait_for(released.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def notify_release(self, model: str) -> None:
+        released = self.released.pop(model, None)
+        if released is not None:
+            released.set()
+
+    async def admit(
+        self,
+        redis_client: redis.Redis,
+        model: str,
+        tokens: int,
+    ) -> AdmissionLease:
+        statistics = self.get_statistics(model)
+        queue = self.queues.setdefault(model, deque())
+        if len(queue) >= self.queue_size:
+            statistics.rejected += 1
+            raise AdmissionRejected(model, self.get_retry_after(model))
+
+        lease = AdmissionLease(model=model, tokens=tokens)
+        turn = asyncio.Event()
+        queue.append(turn)
+        statistics.queued += 1
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        try:
+            while (remaining := deadline - time.monotonic()) > 0:
+                if queue[0] is not turn:
+                    await asyncio.wait_for(turn.wait(), remaining)
+                    continue
+                allowed, retry_after = await self.try_acquire(redis_client, lease)
+                self.retry_hints[model] = retry_after
+                if allowed:
+                    statistics.admitted += 1
+                    statistics.in_flight += 1
+                    statistics.record_wait(time.monotonic() - start)
+                    return lease
+                await self.wait_for_release(
+                    model, min(remaining, max(retry_after, self.poll_interval))
+                )
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            statistics.queued -= 1
+            queue.remove(turn)
+            if queue:
+                queue[0].set()
+        statistics.timed_out += 1
+        raise AdmissionRejected(model, self.get_retry_after(model))
+
+    async def refresh(self, redis_client: redis.Redis, lease: AdmissionLease) -> None:
+        lease.refreshed_at = time.monotonic()
+        lease_key = get_lease_key(lease.model)
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.zadd(
+                lease_key,
+                {lease.id: int((time.time() + self.lease_ttl) * 1000)},
+                xx=True,
+            )
+            pipeline.expire(lease_key, self.lease_ttl)
+            await pipeline.execute()
+
+    async def release(self, redis_client: redis.Redis, lease: AdmissionLease) -> None:
+        self.get_statistics(lease.model).in_flight -= 1
+        try:
+            await redis_client.zrem(get_lease_key(lease.model), lease.id)
+        finally:
+            self.notify_release(lease.model)
+
+    def release_later(self, redis_client: redis.Redis, lease: AdmissionLease) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # The lease expires in Redis after the lease ttl
+            self.get_statistics(lease.model).in_flight -= 1
+            return
+        task = loop.create_task(self.release(redis_client, lease))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def hold(
+        self,
+        redis_client: redis.Redis,
+        lease: AdmissionLease,
+        tokens: AsyncIterator[str],
+    ) -> "AdmissionHold":
+        return AdmissionHold(self, redis_client, lease, tokens)
+
+    async def get_global_in_flight(
+        self,
+        redis_client: redis.Redis,
+        models: list[str],
+    ) -> list[int]:
+        now = int(time.time() * 1000)
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            for model in models:
+                pipeline.zcount(get_lease_key(model), now, "+inf")
+            return await pipeline.execute()
+
+
+class AdmissionHold:
+    """
+    Passes on the tokens of an admitted completion and keeps its lease alive
+    while tokens arrive. The lease is released once, when the tokens end, fail
+    or are closed. Unlike the finally block of an async generator, closing
+    releases the lease even before the first token was read, and a hold that
+    is dropped without being closed releases it when collected.
+    """
+
+    def __init__(
+        self,
+        controller: AdmissionController,
+        redis_client: redis.Redis,
+        lease: AdmissionLease,
+        tokens: AsyncIterator[str],
+    ):
+        self.controller = controller
+        self.redis_client = redis_client
+        self.lease = lease
+        self.tokens = tokens
+        self.released = False
+
+    def __aiter__(self) -> "AdmissionHold":
+        return self
+
+    async def __anext__(self) -> str:
+        if self.released:
+            raise StopAsyncIteration
+        try:
+            token = await anext(self.tokens)
+        except BaseException:
+            await self.aclose()
+            raise
+        if time.monotonic() - self.lease.refreshed_at > self.controller.lease_ttl / 3:
+            await self.controller.refresh(self.redis_client, self.lease)
+        return token
+
+    async def aclose(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        try:
+            await self.tokens.aclose()
+        finally:
+            # Starlette cancels the scope of a disconnected request, which
+            # would cancel every await here and leave the lease in Redis
+            with anyio.CancelScope(shield=True):
+                await self.controller.release(self.redis_client, self.lease)
+
+    def __del__(self):
+        if not self.released:
+            self.released = True
+            self.controller.release_later(self.redis_client, self.lease)
@@ -0,0 +1,92 @@
+from typing import Awaitable, Callable
+
+import orjson
+import redis.asyncio as redis
+from redis.commands.search import reducers
+from redis.commands.search.aggregation import AggregateRequest, Asc, Desc
+
+from ..models import User
+from .index import get_index_key
+from .search import parse_aggregate_row
+
+SECONDS_IN_DAY = 86_400
+
+
+def create_owner_query_string(owner: User, created_after: float | None = None) -> str:
+    query_string = f"@owner:[{owner.id} {owner.id}]"
+    if created_after is not None:
+        query_string += f" @created_at:[{created_after!r} +inf]"
+    return query_string
+
+
+def create_count_per_day_request(
+    owner: User, created_after: float | None = None, max_days: int = 366
+) -> AggregateRequest:
+    return (
+        AggregateRequest(create_owner_query_string(owner, created_after))
+        .load("@created_at")
+        .apply(day=f"floor(@created_at / {SECONDS_IN_DAY}) * {SECONDS_IN_DAY}")
+        .group_by("@day", reducers.count().alias("count"))
+        .sort_by(Asc("@day"), max=max_days)
+    )
+
+
+def create_message_statistics_request(
+    owner: User, created_after: float | None = None
+) -> AggregateRequest:
+    return (
+        AggregateRequest(create_owner_query_string(owner, created_after))
+        .load("@message_count")
+        .group_by(
+            [],
+            reducers.count().alias("chats"),
+            reducers.sum("@message_count").alias("messages"),
+            reducers.avg("@message_count").alias("average"),
+            reducers.max("@message_count").alias("max"),
+        )
+    )
+
+
+def create_model_usage_request(
+    owner: User, created_after: float | None = None, max_models: int = 100
+) -> AggregateRequest:
+    return (
+        AggregateRequest(create_owner_query_string(owner, created_after))
+        .load("@model")
+        .group_by("@model", reducers.count().alias("count"))
+        .sort_by(Desc("@count"), max=max_models)
+    )
+
+
+async def aggregate(
+    redis_client: redis.Redis,
+    class_name: str,
+    request: AggregateRequest,
+) -> list[dict[str, str]]:
+    reply = await redis_client.execute_command(
+        "FT.AGGREGATE", get_index_key(class_name), *request.build_args()
+    )
+    return [parse_aggregate_row(row) for row in reply[1:]]
+
+
+def get_analytics_cache_key(owner: User, name: str, *arguments) -> str:
+    return ":".join(["analytics", str(owner.id), name, *map(str, arguments)])
+
+
+async def get_cached(
+    redis_client: redis.Redis,
+    key: str,
+    ttl: int,
+    compute: Callable[[], Awaitable],
+):
+    """
+    Returns the cached result for the key, or computes and caches it for ttl
+    seconds, so repeated dashboard requests do not hit the index.
+    """
+    cached = await redis_client.get(key)
+    if cached is not None:
+        return orjson.loads(cached)
+    result = await compute()
+    if ttl > 0:
+        await redis_client.set(key, orjson.dumps(result), ex=ttl)
+    return result
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+import redis.asyncio as redis
+
+from .completion_cache import (
+    acquire_flight_lock,
+    publish_flight_stream,
+    read_flight_stream,
+    release_flight_lock,
+)
+from .streams import TokenStreamError
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionFlight:
+    """
+    Buffer of the tokens of one upstream completion. Every follower replays
+    the tokens from the beginning and then waits for new ones.
+    """
+
+    def __init__(self):
+        self.tokens: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.changed = asyncio.Event()
+        self.started = asyncio.Event()
+        self.start_error: BaseException | None = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, token: str) -> None:
+        self.tokens.append(token)
+        self.notify()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.done = True
+        self.error = error
+        self.notify()
+
+    def fail_start(self, error: BaseException) -> None:
+        self.start_error = error
+        self.finish(error)
+        self.started.set()
+
+    async def wait_started(self) -> None:
+        """Waits until the upstream completion was admitted and has started"""
+        await self.started.wait()
+        if self.start_error is not None:
+            raise self.start_error
+
+    async def follow(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            changed = self.changed
+            while index < len(self.tokens):
+                yield self.tokens[index]
+                index += 1
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class CompletionCoalescer:
+    """
+    Runs a single upstream completion per payload hash. Concurrent requests for
+    the same hash follow the tokens of the running completion. With
+    cross_worker enabled, the first worker to take the Redis lock drives the
+    completion and publishes its tokens to a stream that other workers read.
+    """
+
+    def __init__(self, cross_worker: bool = False, flight_ttl: int = 60):
+        self.cross_worker = cross_worker
+        self.flight_ttl = flight_ttl
+        self.flights: dict[str, CompletionFlight] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    async def join(
+        self,
+        redis_client: redis.Redis,
+        completion_hash: str,
+        start: Callable[[], Awaitable[AsyncIterator[str]]],
+    ) -> tuple[AsyncIterator[str], bool]:
+        """
+        Returns the tokens for the completion, and whether this request started
+        the upstream completion. Requests that join a completion that is still
+        starting wait for it, and raise its error when it fails to start.
+        """
+        flight = self.flights.get(completion_hash)
+        if flight is not None:
+            await flight.wait_started()
+            return flight.follow(), False
+
+        flight = CompletionFlight()
+        self.flights[completion_hash] = flight
+        leader, flight_id = True, None
+        try:
+            if self.cross_worker:
+                leader, flight_id = await acquire_flight_lock(
+                    redis_client, completion_hash, self.flight_ttl
+                )
+            if not leader:
+                tokens = read_flight_stream(
+                    redis_client, completion_hash, flight_id, self.flight_ttl
+                )
+            else:
+                tokens = await start()
+        except BaseException as exec:
+            del self.flights[completion_hash]
+            # Requests that joined while the completion was starting fail with it
+            flight.fail_start(
+                exec
+                if isinstance(exec, Exception)
+                else TokenStreamError("Shared completion was cancelled")
+            )
+            if leader and flight_id is not None:
+                await release_flight_lock(redis_client, completion_hash, flight_id)
+            raise
+        flight.started.set()
+        if leader and self.cross_worker:
+            tokens = publish_flight_stream(
+                tokens, redis_client, completion_hash, flight_id, self.flight_ttl
+            )
+        task = asyncio.create_task(self.drive(completion_hash, flight, tokens))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return flight.follow(), leader
+
+    async def drive(
+        self,
+        completion_hash: str,
+        flight: CompletionFlight,
+        tokens: AsyncIterator[str],
+    ) -> None:
+        try:
+            async for token in tokens:
+                flight.publish(token)
+            flight.finish()
+        except Exception as error:
+            logger.exception("Shared completion %s failed", completion_hash)
+            flight.finish(error)
+        finally:
+            self.flights.pop(completion_hash, None)
@@ -1,19 +1,58 @@
+import json
 import secrets
+from itertools import repeat
 
 import redis.asyncio as redis
 from pydantic import BaseModel
 from redis.commands.json.path import Path
 
-from ..models import ChatMessage, Datetime, MetaModel, User
+from ..models import (
+    ChatMessage,
+    Datetime,
+    EventWithMeta,
+    MetaModel,
+    TokenUsage,
+    User,
+)
+from ..metrics import timed_redis_command
+from ..tracing import traced
+from ..models.usage import get_usage_key
+from .projection import build_projection_from_json_get, get_field_paths
 
+# Write an object and publish its change event only when the write succeeded.
+# Batches run in a non transactional pipeline, so the write and the event are
+# made atomic per object by the script rather than by a MULTI.
+# KEYS[1]: object key, KEYS[2]: event stream key
+# ARGV[1]: stream max length, ARGV[2]: channel, ARGV[3]: event, ARGV[4]: object
+CREATE_WITH_EVENT_SCRIPT = """
+if not redis.call("JSON.SET", KEYS[1], "$", ARGV[4], "NX") then
+    return 0
+end
+local id = redis.call("XADD", KEYS[2], "MAXLEN", "~", ARGV[1], "*", "data", ARGV[3])
+redis.call("PUBLISH", ARGV[2], id .. " " .. ARGV[3])
+return 1
+"""
+DELETE_WITH_EVENT_SCRIPT = """
+if redis.call("DEL", KEYS[1]) == 0 then
+    return 0
+end
+local id = redis.call("XADD", KEYS[2], "MAXLEN", "~", ARGV[1], "*", "data", ARGV[3])
+redis.call("PUBLISH", ARGV[2], id .. " " .. ARGV[3])
+return 1
+"""
 
+
+@traced
+@timed_redis_command
 async def get_multiple_instances(
     redis_client: redis.Redis,
     keys: list[str],
 ) -> dict:
-    return await redis_client.json().mget(keys)
+    return await redis_client.json().mget(keys, Path.root_path())
 
 
+@traced
+@timed_redis_command
 async def get_instance(
     redis_client: redis.Redis,
     key: str,
@@ -21,6 +60,19 @@ async def get_instance(
     return await redis_client.json().get(key)
 
 
+@traced
+@timed_redis_command
+async def get_instance_fields(
+    redis_client: redis.Redis,
+    key: str,
+    fields: list[str],
+) -> dict | None:
+    result = await redis_client.json().get(key, *get_field_paths(fields))
+    return build_projection_from_json_get(fields, result)
+
+
+@traced
+@timed_redis_command
 async def copy_instance(
     redis_client: redis.Redis,
     source_key: str,
@@ -40,16 +92,68 @@ async def copy_instance(
     return copied, expired, token
 
 
-async def create_instance(
+def add_usage(pipeline: redis.Redis, usage: TokenUsage | None) -> None:
+    if usage is None:
+        return
+    for field, amount in usage.get_increments().items():
+        pipeline.hincrby(usage.get_key(), field, amount)
+
+
+@traced
+@timed_redis_command
+async def get_usage(
     redis_client: redis.Redis,
+    owner: User,
+    period: str,
+) -> dict[bytes, bytes]:
+    return await redis_client.hgetall(get_usage_key(owner.id, period))
+
+
+@traced
+@timed_redis_command
+async def set_message_token_count(
+    redis_client: redis.Redis,
+    key: str,
+    index: int,
+    token_count: int,
+    usage: TokenUsage | None = None,
+) -> list:
+    async with redis_client.pipeline() as pipeline:
+        pipeline.multi()
+        pipeline.json().set(
+            key, f"$.object.messages[{index}].token_count", token_count, xx=True
+        )
+        add_usage(pipeline, usage)
+        return await pipeline.execute()
+
+
+def add_change_event(
+    pipeline: redis.Redis,
+    change_event: EventWithMeta | None,
+    key: str,
+    object_exists: bool = True,
+) -> None:
+    if change_event is not None:
+        change_event.add_to_pipeline(
+            pipeline,
+            object_key=key,
+            object_exists=object_exists,
+        )
+
+
+def split_results(results: list, size: int) -> list[list]:
+    return [results[index : index + size] for index in range(0, len(results), size)]
+
+
+def create_meta_instance(
     owner: User,
     instance: BaseModel,
     instance_id: int,
-    key: str,
-) -> tuple[bool, MetaModel]:
-    datetime_instance = Datetime()
+    datetime_instance: Datetime | None = None,
+) -> MetaModel:
+    datetime_instance = datetime_instance or Datetime()
 
-    meta_instance = MetaModel(
+    return MetaModel(
         id=instance_id,
         class_name=instance.__class__.__name__,
         owner=owner.id,
@@ -58,19 +162,41 @@ async def create_instance(
         updated_at=datetime_instance,
     )
 
-    created = await redis_client.json().set(
-        key,
-        Path.root_path(),
-        meta_instance.model_dump(mode="json"),
-        nx=True,
-    )
+
+@traced
+@timed_redis_command
+async def create_instance(
+    redis_client: redis.Redis,
+    owner: User,
+    instance: BaseModel,
+    instance_id: int,
+    key: str,
+    created_at: Datetime | None = None,
+    change_event: EventWithMeta | None = None,
+) -> tuple[bool, MetaModel]:
+    meta_instance = create_meta_instance(owner, instance, instance_id, created_at)
+
+    async with redis_client.pipeline() as pipeline:
+        pipeline.multi()
+        add_change_event(pipeline, change_event, key, object_exists=False)
+        pipeline.json().set(
+            key,
+            Path.root_path(),
+            meta_instance.model_dump(mode="json"),
+            nx=True,
+        )
+        *_, created = await pipeline.execute()
     return created, meta_instance
 
 
+@traced
+@timed_redis_command
 async def update_instance(
     redis_client: redis.Redis,
     instance: BaseModel,
     key: str,
+    updated_at: Datetime | None = None,
+    change_event: EventWithMeta | None = None,
 ) -> list[bool, bool, dict]:
     async with redis_client.pipeline() as pipeline:
         pipeline.multi()
@@ -84,26 +210,126 @@ async def update_instance(
             pipeline.json().set(
                 key,
                 "$.updated_at",
-                Datetime().model_dump(mode="json"),
+                (updated_at or Datetime()).model_dump(mode="json"),
                 xx=True,
             ),
             pipeline.json().get(key),
         )
-        return await pipeline.execute()
+        add_change_event(pipeline, change_event, key)
+        return (await pipeline.execute())[:3]
 
 
+@traced
+@timed_redis_command
 async def delete_instance(
     redis_client: redis.Redis,
     key: str,
+    change_event: EventWithMeta | None = None,
 ) -> bool:
-    return await redis_client.delete(key)
+    if change_event is None:
+        return await redis_client.delete(key)
+    async with redis_client.pipeline() as pipeline:
+        pipeline.multi()
+        add_change_event(pipeline, change_event, key)
+        pipeline.delete(key)
+        _, deleted = await pipeline.execute()
+    return deleted
 
 
+@traced
+@timed_redis_command
+async def create_multiple_instances(
+    redis_client: redis.Redis,
+    owner: User,
+    instances: list[BaseModel],
+    instance_ids: list[int],
+    keys: list[str],
+    created_at: Datetime | None = None,
+    change_events: list[EventWithMeta] | None = None,
+) -> list[tuple[bool | Exception, MetaModel]]:
+    meta_instances = [
+        create_meta_instance(owner, instance, instance_id, created_at)
+        for instance, instance_id in zip(instances, instance_ids)
+    ]
+    async with redis_client.pipeline(transaction=False) as pipeline:
+        for key, meta_instance, change_event in zip(
+            keys, meta_instances, change_events or repeat(None)
+        ):
+            value = meta_instance.model_dump(mode="json")
+            if change_event is None:
+                pipeline.json().set(key, Path.root_path(), value, nx=True)
+            else:
+                pipeline.eval(
+                    CREATE_WITH_EVENT_SCRIPT,
+                    2,
+                    key,
+                    change_event.get_stream_key(),
+                    *change_event.get_publish_args(),
+                    json.dumps(value),
+                )
+        created = await pipeline.execute(raise_on_error=False)
+    return list(zip(created, meta_instances))
+
+
+@traced
+@timed_redis_command
+async def update_multiple_instances(
+    redis_client: redis.Redis,
+    instances: list[BaseModel],
+    keys: list[str],
+    updated_at: Datetime | None = None,
+    change_events: list[EventWithMeta] | None = None,
+) -> list[list[bool | Exception, bool | Exception, dict | Exception]]:
+    updated_at = (updated_at or Datetime()).model_dump(mode="json")
+    size = 3 if change_events is None else 4
+    async with redis_client.pipeline(transaction=False) as pipeline:
+        for key, instance, change_event in zip(
+            keys, instances, change_events or repeat(None)
+        ):
+            pipeline.json().set(
+                key,
+                "$.object",
+                instance.model_dump(mode="json"),
+                xx=True,
+            )
+            pipeline.json().set(key, "$.updated_at", updated_at, xx=True)
+            pipeline.json().get(key)
+            add_change_event(pipeline, change_event, key)
+        results = await pipeline.execute(raise_on_error=False)
+    return [result[:3] for result in split_results(results, size)]
+
+
+@traced
+@timed_redis_command
+async def delete_multiple_instances(
+    redis_client: redis.Redis,
+    keys: list[str],
+    change_events: list[EventWithMeta] | None = None,
+) -> list[int | Exception]:
+    async with redis_client.pipeline(transaction=False) as pipeline:
+        for key, change_event in zip(keys, change_events or repeat(None)):
+            if change_event is None:
+                pipeline.delete(key)
+            else:
+                pipeline.eval(
+                    DELETE_WITH_EVENT_SCRIPT,
+                    2,
+                    key,
+                    change_event.get_stream_key(),
+                    *change_event.get_publish_args(),
+                )
+        return await pipeline.execute(raise_on_error=False)
+
+
+@traced
+@timed_redis_command
 async def edit_chat_message(
     redis_client: redis.Redis,
     instance: ChatMessage,
     index: int,
     key: str,
+    updated_at: Datetime | None = None,
+    change_event: EventWithMeta | None = None,
 ) -> list[bool, bool, dict]:
     async with redis_client.pipeline() as pipeline:
         pipeline.multi()
@@ -117,18 +343,50 @@ async def edit_chat_message(
             pipeline.json().set(
                 key,
                 "$.updated_at",
-                Datetime().model_dump(mode="json"),
+                (updated_at or Datetime()).model_dump(mode="json"),
                 xx=True,
             ),
             pipeline.json().get(key),
         )
+        add_change_event(pipeline, change_event, key)
+        return (await pipeline.execute())[:3]
+
+
+@traced
+@timed_redis_command
+async def append_chat_message_content(
+    redis_client: redis.Redis,
+    content: str,
+    index: int,
+    key: str,
+) -> list[list[int], bool]:
+    async with redis_client.pipeline() as pipeline:
+        pipeline.multi()
+        (
+            pipeline.json().strappend(
+                key,
+                content,
+                f"$.object.messages[{index}].content",
+            ),
+            pipeline.json().set(
+                key,
+                "$.updated_at",
+                Datetime().model_dump(mode="json"),
+                xx=True,
+            ),
+        )
         return await pipeline.execute()
 
 
+@traced
+@timed_redis_command
 async def append_chat_message(
     redis_client: redis.Redis,
     instance: ChatMessage,
     key: str,
+    updated_at: Datetime | None = None,
+    change_event: EventWithMeta | None = None,
+    usage: TokenUsage | None = None,
 ) -> list[bool, bool, dict]:
     async with redis_client.pipeline() as pipeline:
         pipeline.multi()
@@ -141,9 +399,32 @@ async def append_chat_message(
             pipeline.json().set(
                 key,
                 "$.updated_at",
-                Datetime().model_dump(mode="json"),
+                (updated_at or Datetime()).model_dump(mode="json"),
                 xx=True,
             ),
             pipeline.json().get(key),
+            # Keeps the indexed message count in sync with the appended message
+            pipeline.json().numincrby(key, "$.object.message_count", 1),
         )
-        return await pipeline.execute()
+        add_change_event(pipeline, change_event, key)
+        add_usage(pipeline, usage)
+        return (await pipeline.execute())[:3]
+
+
+@traced
+@timed_redis_command
+async def start_chat_message(
+    redis_client: redis.Redis,
+    instance: ChatMessage,
+    key: str,
+    usage: TokenUsage | None = None,
+) -> int:
+    """Appends the message and returns its index, for appending content to it"""
+    message_count, _, _ = await append_chat_message(
+        redis_client=redis_client,
+        instance=instance,
+        key=key,
+        usage=usage,
+    )
+    # The length of the messages right after the append, in the same transaction
+    return message_count[0] - 1
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import secrets
+import time
+from typing import AsyncIterator
+
+import redis.asyncio as redis
+
+from .scripts import LuaScript
+from .streams import publish_token_stream, read_token_stream
+
+CACHE_INDEX_KEY = "completion_cache:index"
+
+# Stores a completion and evicts the oldest completions beyond the maximum in
+# one step, so workers storing at the same time do not evict the same entries
+# or miss entries added in between.
+# KEYS[1]: cache key, KEYS[2]: index of cached completions
+# ARGV[1]: completion, ARGV[2]: ttl in seconds, ARGV[3]: completion hash,
+# ARGV[4]: current time, ARGV[5]: max entries, ARGV[6]: prefix of cache keys
+SET_CACHED_COMPLETION_SCRIPT = """
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[4])
+redis.call("SET", KEYS[1], ARGV[1], "EX", ttl)
+redis.call("ZADD", KEYS[2], now, ARGV[3])
+redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", now - ttl)
+local excess = redis.call("ZCARD", KEYS[2]) - tonumber(ARGV[5])
+if excess <= 0 then
+    return 0
+end
+local evicted = redis.call("ZPOPMIN", KEYS[2], excess)
+for index = 1, #evicted, 2 do
+    redis.call("DEL", ARGV[6] .. evicted[index])
+end
+return excess
+"""
+set_cached_completion_script = LuaScript(SET_CACHED_COMPLETION_SCRIPT)
+
+# Deletes the flight lock only while it is held by the flight, as a lock that
+# expired may have been taken by the flight of another worker since.
+# KEYS[1]: flight lock, ARGV[1]: flight id
+RELEASE_FLIGHT_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+release_flight_lock_script = LuaScript(RELEASE_FLIGHT_LOCK_SCRIPT)
+
+
+def get_completion_hash(completion_kwargs: dict) -> str:
+    canonical = json.dumps(
+        completion_kwargs, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_cache_key(completion_hash: str) -> str:
+    return f"completion_cache:{completion_hash}"
+
+
+def get_flight_lock_key(completion_hash: str) -> str:
+    return f"completion_flight:{completion_hash}:lock"
+
+
+def get_flight_stream_key(completion_hash: str, flight_id: str) -> str:
+    return f"completion_flight:{completion_hash}:{flight_id}"
+
+
+async def get_cached_completion(
+    redis_client: redis.Redis,
+    completion_hash: str,
+) -> str | None:
+    content = await redis_client.get(get_cache_key(completion_hash))
+    return content.decode() if content is not None else None
+
+
+async def set_cached_completion(
+    redis_client: redis.Redis,
+    completion_hash: str,
+    content: str,
+    ttl: int,
+    max_entries: int,
+) -> None:
+    """
+    Stores the completion with a TTL and evicts the oldest entries once the
+    index of cached completions holds more than max_entries.
+    """
+    await set_cached_completion_script(
+        redis_client,
+        keys=[get_cache_key(completion_hash), CACHE_INDEX_KEY],
+        args=[
+            content,
+            ttl,
+            completion_hash,
+            time.time(),
+            max_entries,
+            get_cache_key(""),
+        ],
+    )
+
+
+async def acquire_flight_lock(
+    redis_client: redis.Redis,
+    completion_hash: str,
+    ttl: int,
+) -> tuple[bool, str]:
+    """
+    Takes the lock for driving the completion, or returns the id of the flight
+    that holds it. Every flight streams to its own key, so followers never
+    read tokens of an earlier flight.
+    """
+    flight_id = secrets.token_hex(8)
+    current_flight_id = await redis_client.set(
+        get_flight_lock_key(completion_hash), flight_id, nx=True, ex=ttl, get=True
+    )
+    if current_flight_id is None:
+        return True, flight_id
+    return False, current_flight_id.decode()
+
+
+async def release_flight_lock(
+    redis_client: redis.Redis,
+    completion_hash: str,
+    flight_id: str,
+) -> bool:
+    return bool(
+        await release_flight_lock_script(
+            redis_client,
+            keys=[get_flight_lock_key(completion_hash)],
+            args=[flight_id],
+        )
+    )
+
+
+async def publish_flight_stream(
+    tokens: AsyncIterator[str],
+    redis_client: redis.Redis,
+    completion_hash: str,
+    flight_id: str,
+    ttl: int,
+) -> AsyncIterator[str]:
+    stream_key = get_flight_stream_key(completion_hash, flight_id)
+    try:
+        async for token in publish_token_stream(tokens, redis_client, stream_key, ttl):
+            yield token
+    finally:
+        await release_flight_lock(redis_client, completion_hash, flight_id)
+
+
+def read_flight_stream(
+    redis_client: redis.Redis,
+    completion_hash: str,
+    flight_id: str,
+    timeout: int,
+) -> AsyncIterator[str]:
+    return read_token_stream(
+        redis_client, get_flight_stream_key(completion_hash, flight_id), timeout
+    )
@@ -1,30 +1,241 @@
+import asyncio
+import logging
+from enum import StrEnum, auto
+from typing import AsyncIterator
+
 import redis.asyncio as redis
 
-from ..models import EventType, EventWithMeta, User, Event
+from ..models import (
+    CRUDAction,
+    Datetime,
+    Event,
+    EventStatus,
+    EventType,
+    EventWithMeta,
+    ObjectChange,
+    User,
+    get_event_stream_key,
+)
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
 
 STOPWORD = "STOP"
 
 
+class SlowConsumerPolicy(StrEnum):
+    DROP = auto()
+    DISCONNECT = auto()
+
+
 def create_events_list(owner: User, event_types: list[EventType]) -> list[str]:
     return [f"{event_type.value}:{owner.id}" for event_type in event_types]
 
 
+def get_event_patterns() -> list[str]:
+    return [f"{event_type.value}:*" for event_type in EventType]
+
+
+def decode_event_message(message: str) -> tuple[str | None, str]:
+    event_id, separator, data = message.partition(" ")
+    if not separator:
+        return None, message
+    return event_id, data
+
+
+def parse_event_id(event_id: str) -> tuple[int, int]:
+    milliseconds, _, sequence = event_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def is_newer(event_id: str, last_event_id: str) -> bool:
+    return parse_event_id(event_id) > parse_event_id(last_event_id)
+
+
+def format_server_sent_event(event_id: str | None, data: str) -> str:
+    if event_id is None:
+        return f"data: {data}\n\n"
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(self, channels: list[str], max_queue_size: int):
+        self.channels = channels
+        self.queue: asyncio.Queue[tuple[str | None, str] | None] = asyncio.Queue(
+            maxsize=max_queue_size
+        )
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, event: tuple[str | None, str], policy: SlowConsumerPolicy) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if policy == SlowConsumerPolicy.DISCONNECT:
+                self.close()
+
+    def discard_until(self, event_id: str) -> None:
+        events = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+        for event in events:
+            if event is None or event[0] is None or is_newer(event[0], event_id):
+                self.queue.put_nowait(event)
+
+    def close(self) -> None:
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def __aiter__(self) -> AsyncIterator[tuple[str | None, str]]:
+        while (event := await self.queue.get()) is not None:
+            yield event
+
+
+class EventHub:
+    """
+    Holds a single pattern subscription per process and fans messages out to
+    the subscriptions of the connected clients, keyed by channel.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 100,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP,
+        reconnect_delay: float = 1.0,
+    ):
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self.reconnect_delay = reconnect_delay
+        self.subscriptions: dict[str, set[Subscription]] = {}
+
+    def subscribe(self, channels: list[str]) -> Subscription:
+        subscription = Subscription(channels, self.max_queue_size)
+        for channel in channels:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for channel in subscription.channels:
+            subscriptions = self.subscriptions.get(channel)
+            if subscriptions is None:
+                continue
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[channel]
+
+    def dispatch(self, channel: str, message: str) -> None:
+        event = decode_event_message(message)
+        for subscription in list(self.subscriptions.get(channel, ())):
+            subscription.put(event, self.policy)
+
+    async def listen(self, redis_client: redis.Redis) -> None:
+        async with redis_client.pubsub(ignore_subscribe_messages=True) as pubsub:
+            await pubsub.psubscribe(*get_event_patterns())
+            async for message in pubsub.listen():
+                if message["type"] == "pmessage":
+                    self.dispatch(message["channel"].decode(), message["data"].decode())
+
+    async def run(self, redis_client: redis.Redis) -> None:
+        while True:
+            try:
+                await self.listen(redis_client)
+            except redis.RedisError:
+                logger.exception("Event hub lost its subscription. Reconnecting")
+            await asyncio.sleep(self.reconnect_delay)
+
+
+async def read_event_streams(
+    redis_client: redis.Redis,
+    events_list: list[str],
+    last_event_id: str,
+    count: int = 500,
+) -> AsyncIterator[tuple[str, str]]:
+    stream_ids = {
+        get_event_stream_key(channel): last_event_id for channel in events_list
+    }
+    while True:
+        response = await redis_client.xread(stream_ids, count=count)
+        events = []
+        for stream_key, entries in response:
+            for event_id, fields in entries:
+                stream_ids[stream_key.decode()] = event_id.decode()
+                events.append((event_id.decode(), fields[b"data"].decode()))
+        if not events:
+            return
+        for event in sorted(events, key=lambda event: parse_event_id(event[0])):
+            yield event
+
+
 async def subscribe_event(
     events_list: list[str],
-    redis_client: redis.Redis,
-) -> str:
-    async with redis_client.pubsub() as pubsub:
-        await pubsub.subscribe(*events_list)
-        while True:
-            message = await pubsub.get_message(
-                ignore_subscribe_messages=True, timeout=None
-            )
-            if message is None:
-                continue
-            data = message["data"].decode()
+    event_hub: EventHub,
+    redis_client: redis.Redis | None = None,
+    last_event_id: str | None = None,
+) -> AsyncIterator[str]:
+    # Subscribe before reading the streams, so no event falls between the two
+    subscription = event_hub.subscribe(events_list)
+    try:
+        if last_event_id:
+            async for event_id, data in read_event_streams(
+                redis_client, events_list, last_event_id
+            ):
+                last_event_id = event_id
+                if subscription.queue.full():
+                    subscription.discard_until(last_event_id)
+                yield format_server_sent_event(event_id, data)
+        async for event_id, data in subscription:
             if data == STOPWORD:
                 break
-            yield data + "\n"
+            if event_id and last_event_id and not is_newer(event_id, last_event_id):
+                continue
+            yield format_server_sent_event(event_id, data)
+    finally:
+        event_hub.unsubscribe(subscription)
+
+
+def build_change_event(
+    owner: User,
+    class_name: str,
+    instance_id: int,
+    action: CRUDAction,
+    updated_at: Datetime | None = None,
+    paths: list[str] | None = None,
+) -> EventWithMeta | None:
+    if not settings.object_change_events:
+        return None
+    return EventWithMeta(
+        owner=owner.id,
+        type=EventType.OBJECT,
+        event=Event(
+            action=action,
+            status=EventStatus.COMPLETED,
+            object=ObjectChange(
+                class_name=class_name,
+                id=instance_id,
+                updated_at=updated_at.timestamp if updated_at else None,
+                paths=paths,
+            ),
+        ),
+    )
+
+
+def build_change_events(
+    owner: User,
+    class_name: str,
+    instance_ids: list[int],
+    action: CRUDAction,
+    updated_at: Datetime | None = None,
+    paths: list[str] | None = None,
+) -> list[EventWithMeta] | None:
+    if not settings.object_change_events:
+        return None
+    return [
+        build_change_event(owner, class_name, id, action, updated_at, paths)
+        for id in instance_ids
+    ]
 
 
 async def publish_event(
@@ -1,9 +1,11 @@
-from typing import Any, Type
+import time
+from typing import Iterator, Type
 
 import redis
 import redis.exceptions
-from redis.commands.search.field import NumericField, TextField
+from redis.commands.search.field import Field, NumericField, TagField, TextField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from pydantic import BaseModel
 
 from ..models import Chat, Prompt, PromptTemplate, CompletionParameters
 from ..redis.keys import get_class_name
@@ -44,36 +46,221 @@ def get_meta_model_schema():
 
 def get_prompt_schema():
     return (
-        TextField("$.object.description"),
-        TextField("$.object.name"),
+        TextField("$.object.name", as_name="name", weight=2.0),
+        TextField("$.object.description", as_name="description"),
+        TextField("$.object.messages[*].content", as_name="content"),
+        TagField("$.object.tags[*]", as_name="tag"),
+        TagField("$.object.language.iso639_3", as_name="language"),
     )
 
 
+def get_chat_schema():
+    return (
+        TagField("$.object.completion_parameters.model", as_name="model"),
+        TextField("$.object.messages[*].content", as_name="content"),
+        NumericField("$.object.message_count", as_name="message_count"),
+    )
+
+
+def get_completion_parameters_schema():
+    return (TagField("$.object.model", as_name="model"),)
+
+
+class_schema_mapping = {
+    "PromptTemplate": get_prompt_schema,
+    "Chat": get_chat_schema,
+    "Prompt": get_prompt_schema,
+    "CompletionParameters": get_completion_parameters_schema,
+}
+
+
+# Bump the version of a class when its schema changes and run `restllm migrate_index`.
+# Version 1 are the unversioned indexes created before aliases were introduced.
+index_versions = {
+    "PromptTemplate": 2,
+    "Chat": 3,
+    "Prompt": 2,
+    "CompletionParameters": 2,
+}
+
+
+def get_index_version(class_name: str) -> int:
+    return index_versions.get(class_name, 1)
+
+
+def get_index_schema(class_name: str) -> tuple[Field, ...]:
+    class_schema = class_schema_mapping.get(class_name)
+    return get_meta_model_schema() + (class_schema() if class_schema else ())
+
+
+def get_field_names(schema: tuple[Field, ...], field_type: type[Field]) -> list[str]:
+    return [field.as_name for field in schema if isinstance(field, field_type)]
+
+
+def get_text_field_names(class_name: str) -> list[str]:
+    return get_field_names(get_index_schema(class_name), TextField)
+
+
+def get_tag_field_names(class_name: str) -> list[str]:
+    return get_field_names(get_index_schema(class_name), TagField)
+
+
 def get_index_key_from_class(_class: Type):
     return get_index_key(get_class_name(_class))
 
 
 def get_index_key(class_name: str):
+    # Alias of the current versioned index, which is what the app queries
     return f"meta_model_index:{class_name}"
 
 
+def get_versioned_index_key(class_name: str, version: int):
+    return f"{get_index_key(class_name)}:v{version}"
+
+
 def get_index_prefix(_class: Type):
     return f"{get_class_name(_class)}:"
 
 
-def create_index_on_meta_model(
+def get_index(_class: type, redis_client: redis.Redis):
+    return redis_client.ft(get_index_key_from_class(_class))
+
+
+class IndexingProgress(BaseModel):
+    index_name: str
+    indexing: bool
+    percent_indexed: float
+    num_docs: int
+    elapsed_seconds: float
+    docs_per_second: float
+
+
+def get_index_info(redis_client: redis.Redis, index_name: str) -> dict | None:
+    try:
+        return redis_client.ft(index_name).info()
+    except redis.exceptions.ResponseError as error:
+        if "unknown index name" in str(error).lower():
+            return None
+        raise error
+
+
+def create_versioned_index(
     redis_client: redis.Redis,
-    meta_model_schema: tuple,
-    _class: Type,
-) -> Any:
-    index = get_index(_class, redis_client)
-    return index.create_index(
-        meta_model_schema,
-        definition=IndexDefinition(
-            prefix=[get_index_prefix(_class)], index_type=IndexType.JSON
-        ),
+    class_name: str,
+    version: int,
+) -> str:
+    index_name = get_versioned_index_key(class_name, version)
+    if get_index_info(redis_client, index_name) is None:
+        redis_client.ft(index_name).create_index(
+            get_index_schema(class_name),
+            definition=IndexDefinition(
+                prefix=[get_index_prefix(get_class_from_class_name(class_name))],
+                index_type=IndexType.JSON,
+            ),
+        )
+    return index_name
+
+
+def create_index_with_alias(redis_client: redis.Redis, class_name: str) -> bool:
+    """
+    Creates the current version of the index and its alias when the alias does
+    not exist yet. Existing indexes are left for `migrate_index` to replace.
+    """
+    if get_index_info(redis_client, get_index_key(class_name)) is not None:
+        return False
+    index_name = create_versioned_index(
+        redis_client, class_name, get_index_version(class_name)
     )
+    redis_client.ft(index_name).aliasadd(get_index_key(class_name))
+    return True
 
 
-def get_index(_class: type, redis_client: redis.Redis):
-    return redis_client.ft(get_index_key_from_class(_class))
+def wait_for_indexing(
+    redis_client: redis.Redis,
+    index_name: str,
+    poll_interval: float = 1.0,
+) -> Iterator[IndexingProgress]:
+    start = time.perf_counter()
+    previous_docs, previous_time = 0, start
+    while True:
+        info = get_index_info(redis_client, index_name)
+        if info is None:
+            raise IndexNotFound(f"The index '{index_name}' does not exist")
+        now = time.perf_counter()
+        num_docs = int(info["num_docs"])
+        progress = IndexingProgress(
+            index_name=index_name,
+            indexing=info["indexing"] not in ("0", 0),
+            percent_indexed=float(info["percent_indexed"]),
+            num_docs=num_docs,
+            elapsed_seconds=now - start,
+            docs_per_second=(num_docs - previous_docs) / max(now - previous_time, 1e-9),
+        )
+        yield progress
+        if not progress.indexing:
+            return
+        previous_docs, previous_time = num_docs, now
+        time.sleep(poll_interval)
+
+
+# Sets the message count of a chat stored before the count was indexed. The
+# messages are counted in the script, so an append in between is not lost.
+# KEYS[1]: chat key
+BACKFILL_MESSAGE_COUNT_SCRIPT = """
+if #redis.call("JSON.TYPE", KEYS[1], "$.object.message_count") > 0 then
+    return 0
+end
+local message_count = redis.call("JSON.ARRLEN", KEYS[1], "$.object.messages")[1]
+if not message_count then
+    return 0
+end
+redis.call("JSON.SET", KEYS[1], "$.object.message_count", message_count)
+return 1
+"""
+
+
+def backfill_message_count(redis_client: redis.Redis) -> int:
+    script = redis_client.register_script(BACKFILL_MESSAGE_COUNT_SCRIPT)
+    return sum(
+        script(keys=[key])
+        for key in redis_client.scan_iter(
+            match=f"{get_index_prefix(Chat)}*", _type="ReJSON-RL"
+        )
+    )
+
+
+# Fills in indexed fields missing from documents stored before the field was
+# added, as they would drop out of queries filtering on the field
+class_backfills = {
+    "Chat": backfill_message_count,
+}
+
+
+def backfill_documents(redis_client: redis.Redis, class_name: str) -> int:
+    backfill = class_backfills.get(class_name)
+    return backfill(redis_client) if backfill else 0
+
+
+def swap_index_alias(
+    redis_client: redis.Redis,
+    class_name: str,
+    index_name: str,
+) -> str | None:
+    """
+    Points the alias queried by the app to the given index and returns the name
+    of the index it pointed to before.
+    """
+    alias = get_index_key(class_name)
+    info = get_index_info(redis_client, alias)
+    previous_index_name = info["index_name"] if info else None
+    if previous_index_name == alias:
+        # An unversioned index holds the alias name, so the alias can only be
+        # added once it is dropped. Both run in one transaction, so no query
+        # runs in between and finds neither of them. Documents are kept
+        pipeline = redis_client.pipeline(transaction=True)
+        pipeline.execute_command("FT.DROPINDEX", alias)
+        pipeline.execute_command("FT.ALIASUPDATE", alias, index_name)
+        pipeline.execute()
+    else:
+        redis_client.ft(index_name).aliasupdate(alias)
+    return previous_index_name
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import secrets
+from typing import Awaitable, Callable
+
+import redis.asyncio as redis
+
+from ..models import (
+    Chat,
+    CompletionJob,
+    Event,
+    EventType,
+    EventWithMeta,
+    TaskAction,
+)
+from .keys import get_class_name
+from .scripts import LuaScript
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_KEY = "completion_job:queue"
+JOB_WORKERS_KEY = "completion_job:workers"
+
+# Moves the jobs of a worker whose heartbeat expired back to the end of the
+# queue that is popped next, and forgets the worker.
+# KEYS[1]: heartbeat of the worker, KEYS[2]: jobs of the worker, KEYS[3]: queue,
+# KEYS[4]: workers
+# ARGV[1]: worker id
+REQUEUE_JOBS_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    return 0
+end
+local requeued = 0
+while redis.call("LMOVE", KEYS[2], KEYS[3], "LEFT", "RIGHT") do
+    requeued = requeued + 1
+end
+redis.call("SREM", KEYS[4], ARGV[1])
+return requeued
+"""
+requeue_jobs_script = LuaScript(REQUEUE_JOBS_SCRIPT)
+
+JobHandler = Callable[[redis.Redis, CompletionJob], Awaitable[None]]
+
+
+def get_job_key(job_id: str) -> str:
+    return f"completion_job:{job_id}"
+
+
+def get_job_stream_key(job: CompletionJob) -> str:
+    # Every attempt has its own stream, so readers never see two attempts joined
+    return f"completion_job:{job.id}:{job.attempt}:tokens"
+
+
+def get_worker_heartbeat_key(worker_id: str) -> str:
+    return f"completion_job:worker:{worker_id}"
+
+
+def get_worker_jobs_key(worker_id: str) -> str:
+    return f"completion_job:worker:{worker_id}:jobs"
+
+
+def get_job_chat_key(job: CompletionJob) -> str:
+    return f"{get_class_name(Chat)}:{job.owner}:{job.chat_id}"
+
+
+def build_job_event(job: CompletionJob, action: TaskAction) -> EventWithMeta:
+    return EventWithMeta(
+        owner=job.owner,
+        type=EventType.TASK,
+        event=Event(
+            action=action,
+            status=job.status,
+            object=job.model_dump(mode="json", exclude={"content"}),
+        ),
+    )
+
+
+async def save_job(
+    redis_client: redis.Redis,
+    job: CompletionJob,
+    ttl: int,
+    action: TaskAction,
+    enqueue: bool = False,
+) -> None:
+    async with redis_client.pipeline() as pipeline:
+        pipeline.multi()
+        pipeline.set(get_job_key(job.id), job.model_dump_json(), ex=ttl)
+        if enqueue:
+            pipeline.lpush(JOB_QUEUE_KEY, job.id)
+        build_job_event(job, action).add_to_pipeline(pipeline)
+        await pipeline.execute()
+
+
+async def get_job(redis_client: redis.Redis, job_id: str) -> CompletionJob | None:
+    job = await redis_client.get(get_job_key(job_id))
+    return CompletionJob.model_validate_json(job) if job is not None else None
+
+
+class CompletionJobWorker:
+    """
+    Pops completion jobs from the Redis queue and runs them as tasks. A job is
+    only popped when the process has a free slot, so jobs wait in Redis for
+    any process with capacity. Jobs for the same model also share a smaller
+    number of slots, so one slow upstream cannot take every slot. A popped job
+    whose model has no free slot goes back to the end of the queue, where
+    other workers can take it, so it does not keep jobs for other models
+    waiting.
+
+    Popped jobs are moved to a list of the worker until they finish, and the
+    worker keeps a heartbeat in Redis. Workers put the jobs of workers whose
+    heartbeat expired back in the queue, so the jobs of a crashed worker are
+    run again.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        model_concurrency: int = 4,
+        poll_timeout: int = 5,
+        retry_delay: float = 1.0,
+        heartbeat_ttl: int = 30,
+    ):
+        self.concurrency = concurrency
+        self.model_concurrency = model_concurrency
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self.heartbeat_ttl = heartbeat_ttl
+        self.worker_id = secrets.token_hex(8)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.model_slots: dict[str, asyncio.Semaphore] = {}
+        self.model_released = asyncio.Event()
+        self.tasks: set[asyncio.Task] = set()
+
+    @property
+    def jobs_key(self) -> str:
+        return get_worker_jobs_key(self.worker_id)
+
+    def get_model_slots(self, model: str) -> asyncio.Semaphore:
+        if model not in self.model_slots:
+            self.model_slots[model] = asyncio.Semaphore(self.model_concurrency)
+        return self.model_slots[model]
+
+    async def pop(self, redis_client: redis.Redis) -> CompletionJob | None:
+        job_id = await redis_client.blmove(
+            JOB_QUEUE_KEY, self.jobs_key, self.poll_timeout, "RIGHT", "LEFT"
+        )
+        if job_id is None:
+            return None
+        job = await get_job(redis_client, job_id.decode())
+        if job is None:
+            # Jobs expire when they wait in the queue for longer than their ttl
+            await self.acknowledge(redis_client, job_id.decode())
+        return job
+
+    async def acknowledge(self, redis_client: redis.Redis, job_id: str) -> None:
+        await redis_client.lrem(self.jobs_key, 1, job_id)
+
+    async def return_job(self, redis_client: redis.Redis, job_id: str) -> None:
+        async with redis_client.pipeline() as pipeline:
+            pipeline.lrem(self.jobs_key, 1, job_id)
+            pipeline.lpush(JOB_QUEUE_KEY, job_id)
+            await pipeline.execute()
+
+    def release_model_slot(self, model: str) -> None:
+        self.get_model_slots(model).release()
+        released, self.model_released = self.model_released, asyncio.Event()
+        released.set()
+
+    async def wait_for_model_slot(self) -> None:
+        try:
+            await asyncio.wait_for(self.model_released.wait(), self.retry_delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def send_heartbeat(self, redis_client: redis.Redis) -> None:
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.set(
+                get_worker_heartbeat_key(self.worker_id), 1, ex=self.heartbeat_ttl
+            )
+            pipeline.sadd(JOB_WORKERS_KEY, self.worker_id)
+            await pipeline.execute()
+
+    async def requeue_stale_jobs(self, redis_client: redis.Redis) -> int:
+        requeued = 0
+        for worker_id in await redis_client.smembers(JOB_WORKERS_KEY):
+            worker_id = worker_id.decode()
+            if worker_id == self.worker_id:
+                continue
+            requeued += await requeue_jobs_script(
+                redis_client,
+                keys=[
+                    get_worker_heartbeat_key(worker_id),
+                    get_worker_jobs_key(worker_id),
+                    JOB_QUEUE_KEY,
+                    JOB_WORKERS_KEY,
+                ],
+                args=[worker_id],
+            )
+        if requeued:
+            logger.warning("Requeued %s completion jobs of stopped workers", requeued)
+        return requeued
+
+    async def keep_alive(self, redis_client: redis.Redis) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_ttl / 3)
+            try:
+                await self.send_heartbeat(redis_client)
+                await self.requeue_stale_jobs(redis_client)
+            except Exception:
+                logger.exception("Failed to send completion job worker heartbeat")
+
+    async def run(self, redis_client: redis.Redis, handler: JobHandler) -> None:
+        await self.send_heartbeat(redis_client)
+        keep_alive = asyncio.create_task(self.keep_alive(redis_client))
+        try:
+            await self.run_jobs(redis_client, handler)
+        finally:
+            keep_alive.cancel()
+
+    async def run_jobs(self, redis_client: redis.Redis, handler: JobHandler) -> None:
+        while True:
+            await self.slots.acquire()
+            try:
+                job = await self.pop(redis_client)
+            except redis.RedisError:
+                self.slots.release()
+                logger.exception("Failed to pop completion job. Retrying")
+                await asyncio.sleep(self.retry_delay)
+                continue
+            except BaseException:
+                self.slots.release()
+                raise
+            if job is None:
+                self.slots.release()
+                continue
+            model_slots = self.get_model_slots(job.model)
+            if model_slots.locked():
+                try:
+                    await self.return_job(redis_client, job.id)
+                except redis.RedisError:
+                    # Kept, and run once its model has a free slot
+                    logger.exception("Failed to return completion job %s", job.id)
+                else:
+                    self.slots.release()
+                    await self.wait_for_model_slot()
+                    continue
+            await model_slots.acquire()
+            task = asyncio.create_task(self.process(redis_client, job, handler))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def process(
+        self,
+        redis_client: redis.Redis,
+        job: CompletionJob,
+        handler: JobHandler,
+    ) -> None:
+        try:
+            await handler(redis_client, job)
+        except Exception:
+            logger.exception("Completion job %s failed", job.id)
+        finally:
+            self.slots.release()
+            self.release_model_slot(job.model)
+            try:
+                await self.acknowledge(redis_client, job.id)
+            except redis.RedisError:
+                logger.exception("Failed to acknowledge completion job %s", job.id)
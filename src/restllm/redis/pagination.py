@@ -0,0 +1,80 @@
+import base64
+import json
+
+import orjson
+from pydantic import BaseModel, ValidationError
+
+from .queries import SortingField
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Cursor(BaseModel):
+    """
+    Position after the last item of a page, ordered by the sorting field with
+    the id as tie breaker.
+    """
+
+    sorting_field: SortingField
+    ascending: bool
+    value: float
+    id: int
+
+    def encode(self) -> str:
+        data = json.dumps(
+            [self.sorting_field, self.ascending, self.value, self.id],
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, cursor: str) -> "Cursor":
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            sorting_field, ascending, value, id = json.loads(data)
+            return cls(
+                sorting_field=sorting_field,
+                ascending=ascending,
+                value=value,
+                id=id,
+            )
+        except (ValueError, TypeError, ValidationError) as exec:
+            raise InvalidCursor("Invalid cursor") from exec
+
+
+def format_range(value: float | int, ascending: bool) -> str:
+    if ascending:
+        return f"[({value!r} +inf]"
+    return f"[-inf ({value!r}]"
+
+
+def create_keyset_filter(cursor: Cursor) -> str:
+    id_range = format_range(cursor.id, cursor.ascending)
+    if cursor.sorting_field == SortingField.ID:
+        return f"@id:{id_range}"
+    field = f"@{cursor.sorting_field}"
+    value_range = format_range(cursor.value, cursor.ascending)
+    return (
+        f"({field}:{value_range} | "
+        f"({field}:[{cursor.value!r} {cursor.value!r}] @id:{id_range}))"
+    )
+
+
+def build_page_body(
+    total: int,
+    items: list[bytes],
+    next_cursor: Cursor | None = None,
+) -> bytes:
+    return b"".join(
+        [
+            b'{"total":',
+            str(total).encode(),
+            b',"items":[',
+            b",".join(items),
+            b'],"next_cursor":',
+            orjson.dumps(next_cursor.encode() if next_cursor else None),
+            b"}",
+        ]
+    )
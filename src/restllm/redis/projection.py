@@ -0,0 +1,52 @@
+import re
+from typing import Any
+
+FIELD_PATTERN = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*(\.[a-zA-Z_][a-zA-Z0-9_]*)*$")
+
+# Always returned so projected objects can still be addressed by clients
+REQUIRED_FIELDS = ("id",)
+
+
+class InvalidField(ValueError):
+    pass
+
+
+def parse_fields(fields: str) -> list[str]:
+    field_list = [field.strip() for field in fields.split(",") if field.strip()]
+    for field in field_list:
+        if not FIELD_PATTERN.match(field):
+            raise InvalidField(f"Invalid field '{field}'")
+    return list(dict.fromkeys([*REQUIRED_FIELDS, *field_list]))
+
+
+def get_field_path(field: str) -> str:
+    return f"$.{field}"
+
+
+def get_field_paths(fields: list[str]) -> list[str]:
+    return [get_field_path(field) for field in fields]
+
+
+def set_nested_value(data: dict, field: str, value: Any) -> None:
+    *parents, name = field.split(".")
+    for parent in parents:
+        data = data.setdefault(parent, {})
+    data[name] = value
+
+
+def build_projection(values_by_field: dict[str, list]) -> dict:
+    projection = {}
+    for field, values in values_by_field.items():
+        if values:
+            set_nested_value(projection, field, values[0])
+    return projection
+
+
+def build_projection_from_json_get(fields: list[str], result: Any) -> dict | None:
+    if result is None:
+        return None
+    if len(fields) == 1:
+        result = {get_field_path(fields[0]): result}
+    return build_projection(
+        {field: result.get(get_field_path(field)) for field in fields}
+    )
@@ -1,5 +1,7 @@
-from redis.commands.search.query import Query
+import re
 from enum import StrEnum, auto
+
+from redis.commands.search.query import Query
 from ..models import User
 
 
@@ -15,17 +17,41 @@ def create_privat_query(
     return Query(f"@owner:[{owner.id} {owner.id}]").dialect(3)
 
 
-def add_pagination_to_query(
-    query: Query,
-    offset: int,
-    limit: int,
-) -> Query:
-    return query.paging(offset, limit)
+HIGHLIGHT_TAGS = ("<b>", "</b>")
+TEXT_SPECIAL_CHARACTERS = re.compile(r"([,.<>{}\[\]\"':;!@#$%^&*()\-+=~|/\\])")
+TAG_SPECIAL_CHARACTERS = re.compile(r"([,.<>{}\[\]\"':;!@#$%^&*()\-+=~|/\\\s])")
+
 
+def escape_text(text: str) -> str:
+    return " ".join(TEXT_SPECIAL_CHARACTERS.sub(r"\\\1", term) for term in text.split())
 
-def add_sorting_to_query(
-    query: Query,
-    sorting_field: SortingField,
-    ascending: bool,
+
+def escape_tag(value: str) -> str:
+    return TAG_SPECIAL_CHARACTERS.sub(r"\\\1", value)
+
+
+def create_search_query(
+    owner: User,
+    text: str | None = None,
+    tag_filters: dict[str, list[str]] | None = None,
+    created_after: float | None = None,
+    text_fields: list[str] | None = None,
 ) -> Query:
-    return query.sort_by(str(sorting_field), asc=ascending)
+    query_parts = [f"@owner:[{owner.id} {owner.id}]"]
+    if text and text.strip():
+        query_parts.append(f"({escape_text(text)})")
+    for field, values in (tag_filters or {}).items():
+        if values:
+            tags = " | ".join(escape_tag(value) for value in values)
+            query_parts.append(f"@{field}:{{{tags}}}")
+    if created_after is not None:
+        query_parts.append(f"@created_at:[({created_after!r} +inf]")
+    # Dialect 2 returns single values for the highlighted text fields
+    query = Query(" ".join(query_parts)).dialect(2).with_scores()
+    if text_fields:
+        query = query.return_fields("$", *text_fields).highlight(
+            fields=text_fields, tags=list(HIGHLIGHT_TAGS)
+        )
+    if not text:
+        query = query.sort_by(str(SortingField.CREATED_AT), asc=False)
+    return query
@@ -1,7 +1,10 @@
 import redis.asyncio as redis
 import time
 
+from pydantic import BaseModel
+
 from ..models import User
+from .scripts import LuaScript
 
 CALLS_PER_MINUTE_LIMIT = 25
 
@@ -27,7 +30,7 @@ async def check_rate_limit(
         set_expiration(pipeline, rate_limit_key, MILLISECONDS_IN_MINUTE)
 
         result = await pipeline.execute()
-        return is_rate_limited(calculate_rate_limit_score(result))
+        return is_rate_limited(calculate_rate_limit_score(result[2]))
 
 
 def get_current_epoch_milliseconds():
@@ -73,3 +76,83 @@ def calculate_rate_limit_score(entries: list[bytes]):
 
 def is_rate_limited(score: int):
     return score > CALLS_PER_MINUTE_LIMIT
+
+
+# Generic cell rate algorithm (GCRA). The key only holds the theoretical arrival
+# time (TAT) in milliseconds, so each check is O(1) regardless of call volume.
+# KEYS[1]: rate limit key
+# ARGV[1]: limit per period, ARGV[2]: period in ms, ARGV[3]: weight of the call
+GCRA_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local weight = tonumber(ARGV[3])
+local emission_interval = period / limit
+
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local tat = tonumber(redis.call("GET", KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+
+local new_tat = math.ceil(tat + emission_interval * weight)
+local allow_at = new_tat - period
+if allow_at > now then
+    local remaining = math.floor((now - (tat - period)) / emission_interval)
+    return {0, math.max(remaining, 0), allow_at - now, tat - now}
+end
+
+redis.call("SET", KEYS[1], new_tat, "PX", new_tat - now)
+return {1, math.floor((now - allow_at) / emission_interval), 0, new_tat - now}
+"""
+
+gcra_script = LuaScript(GCRA_SCRIPT)
+
+
+class RateLimitResult(BaseModel):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after_ms: int
+    retry_after_ms: int
+
+    def get_headers(self) -> dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(to_seconds(self.reset_after_ms)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(to_seconds(self.retry_after_ms))
+        return headers
+
+
+def to_seconds(milliseconds: int) -> int:
+    return -(-milliseconds // 1000)
+
+
+def get_gcra_key(user: User, api_path: str) -> str:
+    return f"ratelimit:gcra:{user.id}:{api_path}"
+
+
+async def check_gcra_rate_limit(
+    redis_client: redis.Redis,
+    user: User,
+    api_path: str,
+    route_weight_score: int = 1,
+    limit: int = CALLS_PER_MINUTE_LIMIT,
+    period_ms: int = MILLISECONDS_IN_MINUTE,
+) -> RateLimitResult:
+    allowed, remaining, retry_after_ms, reset_after_ms = await gcra_script(
+        redis_client,
+        keys=[get_gcra_key(user, api_path)],
+        args=[limit, period_ms, route_weight_score],
+    )
+    return RateLimitResult(
+        allowed=allowed == 1,
+        limit=limit,
+        remaining=remaining,
+        reset_after_ms=reset_after_ms,
+        retry_after_ms=retry_after_ms,
+    )
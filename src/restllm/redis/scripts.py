@@ -0,0 +1,29 @@
+import hashlib
+from typing import Any, Iterable, Sequence
+
+import redis.asyncio as redis
+from redis.exceptions import NoScriptError
+
+
+class LuaScript:
+    """
+    Lua script that is hashed once per process and run with EVALSHA. The
+    script is only sent to Redis when Redis answers that it does not know it,
+    which is once per server rather than once per call.
+    """
+
+    def __init__(self, script: str):
+        self.script = script
+        self.sha = hashlib.sha1(script.encode()).hexdigest()
+
+    async def __call__(
+        self,
+        redis_client: redis.Redis,
+        keys: Sequence[str] = (),
+        args: Iterable[Any] = (),
+    ) -> Any:
+        try:
+            return await redis_client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await redis_client.script_load(self.script)
+            return await redis_client.evalsha(self.sha, len(keys), *keys, *args)
@@ -1,38 +1,182 @@
-import json
+from typing import Any
 
+import orjson
 import redis.asyncio as redis
+from redis.commands.search.aggregation import AggregateRequest, Asc, Desc
 from redis.commands.search.query import Query
 from ..models import User
+from ..tracing import traced
 
 from .index import get_index_key
-from .queries import (
-    SortingField,
-    add_pagination_to_query,
-    add_sorting_to_query,
-    create_privat_query,
-)
+from .pagination import Cursor, create_keyset_filter
+from .projection import build_projection_from_json_get, get_field_paths
+from .queries import HIGHLIGHT_TAGS, SortingField, create_privat_query
 
+ROOT_PATH = b"$"
 
-async def search_index(
-    redis_client: redis.Redis, query: Query, class_name: str
-) -> list[dict]:
-    index = redis_client.ft(get_index_key(class_name))
-    result = await index.search(query)
-    return [json.loads(item["json"])[0] for item in result.docs]
 
+def unwrap_json_array(value: bytes) -> bytes:
+    # Dialect 3 and JSON.MGET on "$" wrap each document in a single element array
+    return value[1:-1]
 
+
+def parse_scored_search_reply(
+    reply: list,
+) -> tuple[int, list[tuple[float, dict[bytes, bytes]]]]:
+    hits = [
+        (float(score), dict(zip(fields[::2], fields[1::2])))
+        for score, fields in zip(reply[2::3], reply[3::3])
+    ]
+    return reply[0], hits
+
+
+def build_search_hit(score: float, document: dict[bytes, bytes]) -> bytes:
+    highlight_tag = HIGHLIGHT_TAGS[0].encode()
+    highlights = {
+        name.decode(): value.decode()
+        for name, value in document.items()
+        if name != ROOT_PATH and highlight_tag in value
+    }
+    return b"".join(
+        [
+            b'{"score":',
+            orjson.dumps(score),
+            b',"highlights":',
+            orjson.dumps(highlights),
+            b',"instance":',
+            document[ROOT_PATH],
+            b"}",
+        ]
+    )
+
+
+@traced
+async def search_instances(
+    redis_client: redis.Redis,
+    query: Query,
+    class_name: str,
+) -> tuple[int, list[bytes]]:
+    """
+    Runs a scored search and returns each hit as JSON bytes, with the stored
+    document passed through and the highlighted text fields next to it.
+    """
+    reply = await redis_client.execute_command(
+        "FT.SEARCH", get_index_key(class_name), *query.get_args()
+    )
+    total, hits = parse_scored_search_reply(reply)
+    return total, [build_search_hit(score, document) for score, document in hits]
+
+
+def create_page_request(
+    owner: User,
+    limit: int,
+    sorting_field: SortingField,
+    ascending: bool,
+    offset: int = 0,
+    cursor: Cursor | None = None,
+) -> AggregateRequest:
+    query_string = create_privat_query(owner).query_string()
+    if cursor:
+        query_string = f"{query_string} {create_keyset_filter(cursor)}"
+    order = Asc if ascending else Desc
+    sorting_fields = [order(f"@{sorting_field}")]
+    if sorting_field != SortingField.ID:
+        sorting_fields.append(order("@id"))
+    return (
+        AggregateRequest(query_string)
+        .load("@__key", "@id", f"@{sorting_field}")
+        .sort_by(*sorting_fields)
+        .limit(offset, limit)
+        .dialect(3)
+    )
+
+
+def create_count_query(owner: User) -> Query:
+    return create_privat_query(owner).paging(0, 0)
+
+
+def parse_aggregate_value(value: bytes | None) -> Any:
+    # Dialect 3 returns loaded JSON fields as an array of their values, while
+    # __key is returned as it is. Fields missing from a document are nil, or
+    # an empty array
+    if value is None:
+        return None
+    if value.startswith(b"["):
+        return next(iter(orjson.loads(value)), None)
+    return value.decode()
+
+
+def parse_aggregate_row(row: list) -> dict[str, Any]:
+    return {
+        name.decode(): parse_aggregate_value(value)
+        for name, value in zip(row[::2], row[1::2])
+    }
+
+
+@traced
+async def get_page_instances(
+    redis_client: redis.Redis,
+    keys: list[str],
+    fields: list[str] | None = None,
+) -> list[bytes | None]:
+    if not keys:
+        return []
+    if not fields:
+        results = await redis_client.execute_command("JSON.MGET", *keys, ROOT_PATH)
+        return [unwrap_json_array(result) if result else None for result in results]
+    async with redis_client.pipeline(transaction=False) as pipeline:
+        for key in keys:
+            pipeline.json().get(key, *get_field_paths(fields))
+        results = await pipeline.execute()
+    return [
+        orjson.dumps(build_projection_from_json_get(fields, result))
+        if result
+        else None
+        for result in results
+    ]
+
+
+@traced
 async def list_instances(
     redis_client: redis.Redis,
     class_name: str,
     owner: User,
-    offset: int | None = None,
-    limit: int | None = None,
-    sorting_field: SortingField | None = None,
+    limit: int,
+    sorting_field: SortingField = SortingField.CREATED_AT,
     ascending: bool = True,
-) -> list[dict]:
-    query = create_privat_query(owner)
-    if offset >= 0 and limit > 0:
-        query = add_pagination_to_query(query, offset, limit)
-    if sorting_field:
-        query = add_sorting_to_query(query, sorting_field, ascending)
-    return await search_index(redis_client, query, class_name)
+    offset: int = 0,
+    cursor: Cursor | None = None,
+    fields: list[str] | None = None,
+) -> tuple[int, list[bytes], Cursor | None]:
+    """
+    Keyset pagination on (sorting_field, id). A cursor continues after the
+    last row of the previous page instead of skipping an offset. Instances are
+    returned as JSON bytes, as stored in Redis.
+    """
+    if cursor:
+        sorting_field, ascending, offset = cursor.sorting_field, cursor.ascending, 0
+    index_key = get_index_key(class_name)
+    page_request = create_page_request(
+        owner, limit, sorting_field, ascending, offset, cursor
+    )
+    async with redis_client.pipeline(transaction=False) as pipeline:
+        pipeline.execute_command("FT.AGGREGATE", index_key, *page_request.build_args())
+        pipeline.execute_command(
+            "FT.SEARCH", index_key, *create_count_query(owner).get_args()
+        )
+        aggregate_reply, count_reply = await pipeline.execute()
+    rows = [parse_aggregate_row(row) for row in aggregate_reply[1:]]
+    instances = await get_page_instances(
+        redis_client, [row["__key"] for row in rows], fields
+    )
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = Cursor(
+            sorting_field=sorting_field,
+            ascending=ascending,
+            value=float(rows[-1][str(sorting_field)]),
+            id=int(rows[-1]["id"]),
+        )
+    # Keys deleted between the two calls are skipped
+    items = [instance for instance in instances if instance]
+    return count_reply[0], items, next_cursor
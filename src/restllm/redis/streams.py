@@ -0,0 +1,131 @@
+import asyncio
+import time
+from typing import AsyncIterator
+
+import redis.asyncio as redis
+
+from ..settings import settings
+
+
+class TokenStreamError(Exception):
+    pass
+
+
+class TokenBuffer:
+    def __init__(self, flush_bytes: int, flush_interval: float):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.tokens: list[str] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    def __bool__(self) -> bool:
+        return bool(self.tokens)
+
+    def append(self, token: str) -> None:
+        self.tokens.append(token)
+        self.size += len(token.encode())
+
+    def should_flush(self) -> bool:
+        return (
+            self.size >= self.flush_bytes
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def flush(self) -> str:
+        content = "".join(self.tokens)
+        self.tokens.clear()
+        self.size = 0
+        self.last_flush = time.monotonic()
+        return content
+
+
+async def add_stream_entries(
+    redis_client: redis.Redis,
+    stream_key: str,
+    entries: list[dict],
+    ttl: int,
+    max_len: int = settings.token_stream_max_len,
+) -> None:
+    # The ttl is set with every write, so the stream of a worker that dies
+    # mid completion still expires
+    async with redis_client.pipeline(transaction=False) as pipeline:
+        for entry in entries:
+            pipeline.xadd(stream_key, entry, maxlen=max_len, approximate=True)
+        pipeline.expire(stream_key, ttl)
+        await pipeline.execute()
+
+
+async def publish_token_stream(
+    tokens: AsyncIterator[str],
+    redis_client: redis.Redis,
+    stream_key: str,
+    ttl: int,
+    flush_bytes: int = settings.completion_flush_bytes,
+    flush_interval: float = settings.token_stream_flush_interval,
+    max_len: int = settings.token_stream_max_len,
+) -> AsyncIterator[str]:
+    """
+    Adds the tokens to a Redis stream while passing them on, and ends the
+    stream with a done or error entry. Tokens are buffered, and an entry holds
+    the tokens of a flush, so a write carries several tokens. The stream
+    expires ttl seconds after the last write.
+    """
+    buffer = TokenBuffer(flush_bytes, flush_interval)
+
+    def get_entries(end: dict) -> list[dict]:
+        return [{"token": buffer.flush()}, end] if buffer else [end]
+
+    try:
+        async for token in tokens:
+            buffer.append(token)
+            if buffer.should_flush():
+                await add_stream_entries(
+                    redis_client, stream_key, [{"token": buffer.flush()}], ttl, max_len
+                )
+            yield token
+        await add_stream_entries(
+            redis_client, stream_key, get_entries({"done": 1}), ttl, max_len
+        )
+    except (Exception, asyncio.CancelledError) as exec:
+        await add_stream_entries(
+            redis_client,
+            stream_key,
+            get_entries({"error": str(exec) or "Cancelled"}),
+            ttl,
+            max_len,
+        )
+        raise exec
+
+
+async def end_token_stream(
+    redis_client: redis.Redis,
+    stream_key: str,
+    error: str,
+    ttl: int,
+) -> None:
+    """Ends the stream with an error entry, which its readers raise"""
+    await add_stream_entries(redis_client, stream_key, [{"error": error}], ttl)
+
+
+async def read_token_stream(
+    redis_client: redis.Redis,
+    stream_key: str,
+    timeout: int,
+    count: int = 100,
+) -> AsyncIterator[str]:
+    last_id = "0-0"
+    while True:
+        response = await redis_client.xread(
+            {stream_key: last_id}, count=count, block=timeout * 1000
+        )
+        if not response:
+            raise TokenStreamError("Timed out waiting for the next token")
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                if b"done" in fields:
+                    return
+                if b"error" in fields:
+                    raise TokenStreamError(fields[b"error"].decode())
+                yield fields[b"token"].decode()
@@ -0,0 +1,34 @@
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends
+
+from ..dependencies import admission_controller, get_redis_client, get_user
+from ..models import User
+from ..models.completion import ModelTypes
+from ..redis.admission import AdmissionStatistics
+
+router = APIRouter(
+    prefix="/admission",
+    tags=["admission"],
+)
+
+
+@router.get(
+    "",
+    description="Queue depth, wait times and running completions per model, for the completions admitted by this process",
+)
+async def get_admission_statistics(
+    user: User = Depends(get_user),
+    redis_client: redis.Redis = Depends(get_redis_client),
+) -> list[AdmissionStatistics]:
+    models = list(
+        dict.fromkeys([*map(str, ModelTypes), *admission_controller.statistics])
+    )
+    global_in_flight = await admission_controller.get_global_in_flight(
+        redis_client, models
+    )
+    return [
+        admission_controller.get_statistics(model).model_copy(
+            update={"global_in_flight": in_flight}
+        )
+        for model, in_flight in zip(models, global_in_flight)
+    ]
@@ -0,0 +1,167 @@
+import asyncio
+import datetime
+from typing import Type
+
+import redis.asyncio as redis
+import redis.exceptions
+from fastapi import APIRouter, Depends, Query, Response
+from redis.commands.search.aggregation import AggregateRequest
+
+from ..dependencies import get_redis_client, get_user
+from ..exceptions import IndexNotImplemented
+from ..models import (
+    Chat,
+    CompletionParameters,
+    DailyCount,
+    MessageStatistics,
+    ModelUsageStatistics,
+    User,
+)
+from ..redis.analytics import (
+    SECONDS_IN_DAY,
+    aggregate,
+    create_count_per_day_request,
+    create_message_statistics_request,
+    create_model_usage_request,
+    get_analytics_cache_key,
+    get_cached,
+)
+from ..redis.keys import get_class_name
+from ..settings import settings
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+)
+
+days_query = Query(
+    default=30,
+    gt=0,
+    le=366,
+    description="Number of days, including today, the statistics are computed over",
+)
+
+
+def get_created_after(days: int) -> float:
+    today = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+    return (today // SECONDS_IN_DAY - (days - 1)) * SECONDS_IN_DAY
+
+
+def set_cache_control(response: Response) -> None:
+    response.headers["Cache-Control"] = f"private, max-age={settings.analytics_cache_ttl}"
+
+
+async def aggregate_class(
+    redis_client: redis.Redis, cls: Type, request: AggregateRequest
+) -> list[dict[str, str]]:
+    try:
+        return await aggregate(redis_client, get_class_name(cls), request)
+    except redis.exceptions.ResponseError as exec:
+        if str(exec).endswith("no such index"):
+            raise IndexNotImplemented(cls) from exec
+        raise exec
+
+
+@router.get("/chats/daily", response_model=list[DailyCount])
+async def get_chats_per_day(
+    response: Response,
+    days: int = days_query,
+    redis_client: redis.Redis = Depends(get_redis_client),
+    user: User = Depends(get_user),
+):
+    created_after = get_created_after(days)
+
+    async def compute() -> list[dict]:
+        rows = await aggregate_class(
+            redis_client, Chat, create_count_per_day_request(user, created_after)
+        )
+        return [
+            {
+                "day": datetime.datetime.fromtimestamp(
+                    float(row["day"]), tz=datetime.timezone.utc
+                )
+                .date()
+                .isoformat(),
+                "count": int(row["count"]),
+            }
+            for row in rows
+        ]
+
+    set_cache_control(response)
+    return await get_cached(
+        redis_client,
+        get_analytics_cache_key(user, "chats_daily", days, int(created_after)),
+        settings.analytics_cache_ttl,
+        compute,
+    )
+
+
+@router.get("/chats/messages", response_model=MessageStatistics)
+async def get_message_statistics(
+    response: Response,
+    days: int = days_query,
+    redis_client: redis.Redis = Depends(get_redis_client),
+    user: User = Depends(get_user),
+):
+    created_after = get_created_after(days)
+
+    async def compute() -> dict:
+        rows = await aggregate_class(
+            redis_client, Chat, create_message_statistics_request(user, created_after)
+        )
+        if not rows:
+            return MessageStatistics().model_dump()
+        return {
+            "chats": int(rows[0].get("chats") or 0),
+            "messages": int(float(rows[0].get("messages") or 0)),
+            "average": float(rows[0].get("average") or 0),
+            "max": int(float(rows[0].get("max") or 0)),
+        }
+
+    set_cache_control(response)
+    return await get_cached(
+        redis_client,
+        get_analytics_cache_key(user, "chats_messages", days, int(created_after)),
+        settings.analytics_cache_ttl,
+        compute,
+    )
+
+
+@router.get("/models", response_model=ModelUsageStatistics)
+async def get_model_usage(
+    response: Response,
+    days: int = days_query,
+    redis_client: redis.Redis = Depends(get_redis_client),
+    user: User = Depends(get_user),
+):
+    created_after = get_created_after(days)
+
+    async def compute() -> dict:
+        chat_rows, completion_parameters_rows = await asyncio.gather(
+            aggregate_class(
+                redis_client, Chat, create_model_usage_request(user, created_after)
+            ),
+            aggregate_class(
+                redis_client,
+                CompletionParameters,
+                create_model_usage_request(user, created_after),
+            ),
+        )
+        return {
+            "chats": [
+                {"model": row["model"], "count": int(row["count"])}
+                for row in chat_rows
+            ],
+            "completion_parameters": [
+                {"model": row["model"], "count": int(row["count"])}
+                for row in completion_parameters_rows
+            ],
+        }
+
+    set_cache_control(response)
+    return await get_cached(
+        redis_client,
+        get_analytics_cache_key(user, "models", days, int(created_after)),
+        settings.analytics_cache_ttl,
+        compute,
+    )
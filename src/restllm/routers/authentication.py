@@ -1,4 +1,5 @@
 import redis.asyncio as redis
+from cryptography.fernet import InvalidToken, MultiFernet
 from fastapi import APIRouter, BackgroundTasks
 
 from fastapi import Depends, HTTPException, status, Response
@@ -6,12 +7,8 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from ..tasks.email import send_email_verification_url
 from ..cryptography.authentication import create_tokens
-from ..cryptography.keys import get_fernet
-from ..cryptography.secure_url import (
-    decrypt_payload,
-    generate_secure_url,
-    payload_is_valid,
-)
+from ..cryptography.keys import FernetKeyRing
+from ..cryptography.secure_url import generate_secure_url, payload_is_valid
 from ..models.authentication import Token, UserSignUp, ChangePassword
 from ..endpoints.authentication import create_user_instance
 from ..models import User
@@ -22,6 +19,8 @@ from ..dependencies import (
     change_password_form,
     create_instance_id,
     decode_user_token,
+    get_fernet,
+    get_key_ring,
     get_user,
 )
 from ..redis.keys import get_class_name
@@ -76,6 +75,7 @@ async def user_signup(
     background_tasks: BackgroundTasks,
     signup_data: UserSignUp = Depends(signup_form),
     redis_client: redis.Redis = Depends(get_redis_client),
+    fernet: MultiFernet = Depends(get_fernet),
 ):
     user_exists = await redis_client.exists(signup_data.email_key)
     if user_exists:
@@ -97,7 +97,6 @@ async def user_signup(
             detail="Registration failed",
         )
 
-    fernet = await get_fernet(redis_client)
     signed_data = generate_secure_url(fernet, {"user_id": instance_id})
     verification_url = f"http://localhost:8000/v1/authentication/verify-email/{signed_data.get('payload')}/{signed_data.get('signature')}"
     background_tasks.add_task(
@@ -114,14 +113,22 @@ async def verify_email(
     payload: str = paths.payload_path,
     signature: str = paths.signature_path,
     redis_client: redis.Redis = Depends(get_redis_client),
+    key_ring: FernetKeyRing = Depends(get_key_ring),
 ):
-    fernet = await get_fernet(redis_client)
     if not payload_is_valid(payload, signature):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid request",
         )
-    user_id: int = decrypt_payload(fernet, payload).get("user_id")
+    try:
+        user_id: int = (await key_ring.decrypt_payload(redis_client, payload)).get(
+            "user_id"
+        )
+    except InvalidToken:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid request",
+        )
     user_key = f"{get_class_name(User)}:{user_id}"
     updated = await redis_client.json().set(user_key, "$.verified", True, xx=True)
     if not updated:
@@ -1,29 +1,119 @@
+from typing import Literal
+
 import redis.asyncio as redis
 import redis.exceptions
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from ..dependencies import (
     get_redis_client,
     build_get_instance_key,
+    build_rate_limit,
 )
 from ..endpoints.completion import chat_acompletion_call
-from ..exceptions import ObjectNotFoundException
-from ..models import Chat, ChatMessage, ChatWithMeta, RoleTypes
+from ..endpoints.context import set_token_count
+from ..exceptions import (
+    CompletionJobNotFoundException,
+    CompletionOverloadedException,
+    ObjectNotFoundException,
+)
+from ..models import (
+    Chat,
+    ChatMessage,
+    ChatWithMeta,
+    CompletionJob,
+    RoleTypes,
+    TaskAction,
+)
+from ..redis.admission import AdmissionRejected
 from ..redis.commands import append_chat_message, get_instance
+from ..redis.jobs import get_job, get_job_chat_key, get_job_stream_key, save_job
 from ..redis.keys import get_class_name
+from ..redis.ratelimit import RateLimitResult
+from ..redis.streams import TokenStreamError, read_token_stream
+from ..settings import settings
+from ..types import paths
 
 router = APIRouter()
 
+COMPLETION_ROUTE_WEIGHT = 1
+
+cache_query = Query(
+    default=False,
+    description="Serve and store the completion from the completion cache, also for non-zero temperatures. Only applies when the cache is enabled",
+)
+mode_query = Query(
+    default="stream",
+    description="Stream the completion in the response, or run it as a background job. Async returns the job, which can be fetched or attached to while it runs",
+)
+
+
+async def create_completion_response(
+    chat_with_meta: ChatWithMeta,
+    chat_id: int,
+    redis_client: redis.Redis,
+    key: str,
+    cache: bool,
+    mode: str,
+    rate_limit: RateLimitResult,
+):
+    if mode == "stream":
+        try:
+            tokens = await chat_acompletion_call(
+                chat_with_meta, redis_client, key, cache
+            )
+        except AdmissionRejected as exec:
+            raise CompletionOverloadedException(exec.retry_after) from exec
+        return StreamingResponse(
+            tokens,
+            media_type="text/event-stream",
+            headers=rate_limit.get_headers(),
+        )
+    job = CompletionJob(
+        owner=chat_with_meta.owner,
+        chat_id=chat_id,
+        model=chat_with_meta.object.completion_parameters.model,
+        cache=cache,
+    )
+    await save_job(
+        redis_client, job, settings.completion_job_ttl, TaskAction.START, enqueue=True
+    )
+    return JSONResponse(
+        job.model_dump(mode="json"),
+        status_code=202,
+        headers=rate_limit.get_headers(),
+    )
+
+
+async def stream_job_tokens(
+    job: CompletionJob,
+    redis_client: redis.Redis,
+):
+    try:
+        async for token in read_token_stream(
+            redis_client,
+            get_job_stream_key(job),
+            settings.completion_job_stream_timeout,
+        ):
+            yield token
+    except TokenStreamError as exec:
+        # Tokens are streamed as plain text, so the failed or stalled job ends
+        # the stream with an error event that cannot be mistaken for tokens
+        yield f"\n\nevent: error\ndata: {exec}\n\n"
+
 
 @router.get(
     "/completion",
     description="Complete a chat from an existing state on server",
 )
 async def get_completion(
+    id: int = paths.id_path,
+    cache: bool = cache_query,
+    mode: Literal["stream", "async"] = mode_query,
     redis_client: redis.Redis = Depends(get_redis_client),
     key: str = Depends(build_get_instance_key(Chat)),
+    rate_limit: RateLimitResult = Depends(build_rate_limit(COMPLETION_ROUTE_WEIGHT)),
 ) -> str:
     instance = await get_instance(
         redis_client=redis_client,
@@ -37,9 +127,8 @@ async def get_completion(
             status_code=404,
             detail=f"{get_class_name(ChatMessage)} with role {RoleTypes.USER} not found",
         )
-    return StreamingResponse(
-        chat_acompletion_call(chat_with_meta, redis_client, key),
-        media_type="text/event-stream",
+    return await create_completion_response(
+        chat_with_meta, id, redis_client, key, cache, mode, rate_limit
     )
 
 
@@ -49,19 +138,62 @@ async def get_completion(
 )
 async def post_completion(
     chat_message: ChatMessage,
+    id: int = paths.id_path,
+    cache: bool = cache_query,
+    mode: Literal["stream", "async"] = mode_query,
     redis_client: redis.Redis = Depends(get_redis_client),
     key: str = Depends(build_get_instance_key(Chat)),
+    rate_limit: RateLimitResult = Depends(build_rate_limit(COMPLETION_ROUTE_WEIGHT)),
 ) -> str:
     try:
         updated, updated_at, instance = await append_chat_message(
             redis_client=redis_client,
-            instance=chat_message,
+            instance=set_token_count(chat_message),
             key=key,
         )
         chat_with_meta = ChatWithMeta.model_validate(instance)
-        return StreamingResponse(
-            chat_acompletion_call(chat_with_meta, redis_client, key),
-            media_type="text/event-stream",
+        return await create_completion_response(
+            chat_with_meta, id, redis_client, key, cache, mode, rate_limit
         )
     except redis.exceptions.ResponseError as exec:
         raise ObjectNotFoundException(Chat) from exec
+
+
+async def get_chat_job(
+    job_id: str,
+    redis_client: redis.Redis = Depends(get_redis_client),
+    key: str = Depends(build_get_instance_key(Chat)),
+) -> CompletionJob:
+    job = await get_job(redis_client, job_id)
+    if job is None or get_job_chat_key(job) != key:
+        raise CompletionJobNotFoundException
+    return job
+
+
+@router.get(
+    "/completion/jobs/{job_id}",
+    description="Get the status of a completion job, and its content once completed",
+)
+async def get_completion_job(
+    job: CompletionJob = Depends(get_chat_job),
+) -> CompletionJob:
+    return job
+
+
+@router.get(
+    "/completion/jobs/{job_id}/stream",
+    description="Attach to the token stream of a completion job. The tokens are streamed from the start of the completion. A job that fails or stalls ends the stream with an 'error' event, as does a job that is run again after its worker stopped",
+    response_class=StreamingResponse,
+)
+async def attach_completion_job(
+    job: CompletionJob = Depends(get_chat_job),
+    redis_client: redis.Redis = Depends(get_redis_client),
+):
+    if job.is_finished():
+        return StreamingResponse(
+            iter([job.content or ""]), media_type="text/event-stream"
+        )
+    return StreamingResponse(
+        stream_job_tokens(job, redis_client),
+        media_type="text/event-stream",
+    )
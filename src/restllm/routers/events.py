@@ -1,10 +1,15 @@
 import redis.asyncio as redis
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Header
 from fastapi.responses import StreamingResponse
 
-from ..dependencies import get_redis_client, get_user
-from ..models import ChatMessage, CRUDAction, Event, EventStatus, EventType
-from ..redis.events import create_events_list, publish_event, subscribe_event
+from ..dependencies import get_event_hub, get_redis_client, get_user
+from ..models import ChatMessage, CRUDAction, Event, EventStatus, EventType, User
+from ..redis.events import (
+    EventHub,
+    create_events_list,
+    publish_event,
+    subscribe_event,
+)
 
 router = APIRouter(
     prefix="/events",
@@ -14,16 +19,25 @@ router = APIRouter(
 
 @router.get("/{event_type}")
 async def events(
-    request: Request,
     event_type: EventType,
+    user: User = Depends(get_user),
+    event_hub: EventHub = Depends(get_event_hub),
     redis_client: redis.Redis = Depends(get_redis_client),
+    last_event_id: str | None = Header(
+        default=None,
+        alias="Last-Event-ID",
+        pattern=r"^\d+-\d+$",
+        description="ID of the last received event. Events published after it are replayed before live events.",
+    ),
 ):
-    events_list = create_events_list(get_user(request), [event_type])
+    events_list = create_events_list(user, [event_type])
 
     return StreamingResponse(
         subscribe_event(
             events_list,
+            event_hub,
             redis_client,
+            last_event_id,
         ),
         media_type="text/event-stream",
     )
@@ -31,7 +45,7 @@ async def events(
 
 @router.post("/create")
 async def create_event(
-    request: Request,
+    user: User = Depends(get_user),
     redis_client: redis.Redis = Depends(get_redis_client),
 ):
     event = Event(
@@ -41,6 +55,6 @@ async def create_event(
     )
     return await publish_event(
         event=event,
-        owner=get_user(request),
+        owner=user,
         redis_client=redis_client,
     )
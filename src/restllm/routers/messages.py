@@ -2,10 +2,13 @@ import redis.asyncio as redis
 import redis.exceptions
 from fastapi import APIRouter, Depends
 
-from ..dependencies import get_redis_client, build_get_instance_key
+from ..dependencies import get_redis_client, get_user, build_get_instance_key
+from ..endpoints.context import set_token_count
 from ..exceptions import ObjectNotFoundException
-from ..models import Chat, ChatMessage, ChatWithMeta
+from ..models import Chat, ChatMessage, ChatWithMeta, CRUDAction, Datetime, User
 from ..redis.commands import append_chat_message, edit_chat_message
+from ..redis.events import build_change_event
+from ..redis.keys import get_class_name
 from ..types import paths
 
 router = APIRouter()
@@ -18,15 +21,27 @@ router = APIRouter()
 )
 async def update_chat_message(
     chat_message: ChatMessage,
+    id: int = paths.id_path,
     index: int = paths.index_path,
     redis_client: redis.Redis = Depends(get_redis_client),
     key: str = Depends(build_get_instance_key(Chat)),
+    user: User = Depends(get_user),
 ):
+    now = Datetime()
     updated, updated_at, instance = await edit_chat_message(
         redis_client=redis_client,
-        instance=chat_message,
+        instance=set_token_count(chat_message),
         index=index,
         key=key,
+        updated_at=now,
+        change_event=build_change_event(
+            user,
+            get_class_name(Chat),
+            id,
+            CRUDAction.UPDATE,
+            now,
+            [f"$.object.messages[{index}]"],
+        ),
     )
     if not updated and not updated_at:
         raise ObjectNotFoundException(ChatMessage)
@@ -40,14 +55,26 @@ async def update_chat_message(
 )
 async def add_chat_message(
     chat_message: ChatMessage,
+    id: int = paths.id_path,
     redis_client: redis.Redis = Depends(get_redis_client),
     key: str = Depends(build_get_instance_key(Chat)),
+    user: User = Depends(get_user),
 ):
+    now = Datetime()
     try:
         updated, updated_at, instance = await append_chat_message(
             redis_client=redis_client,
-            instance=chat_message,
+            instance=set_token_count(chat_message),
             key=key,
+            updated_at=now,
+            change_event=build_change_event(
+                user,
+                get_class_name(Chat),
+                id,
+                CRUDAction.UPDATE,
+                now,
+                ["$.object.messages"],
+            ),
         )
         return instance
     except redis.exceptions.ResponseError as exec:
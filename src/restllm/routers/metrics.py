@@ -0,0 +1,81 @@
+from fastapi import APIRouter, Response
+
+from ..dependencies import (
+    admission_controller,
+    completion_coalescer,
+    completion_job_worker,
+    first_token_tracker,
+)
+from ..metrics import CONTENT_TYPE, Gauge, registry
+
+router = APIRouter(tags=["metrics"])
+
+ADMISSION_FIELDS = ("queued", "in_flight", "admitted", "rejected", "timed_out")
+
+
+def collect_admission_statistics():
+    for statistics in admission_controller.statistics.values():
+        for field in ADMISSION_FIELDS:
+            yield (statistics.model, field), getattr(statistics, field)
+
+
+def collect_admission_wait():
+    for statistics in admission_controller.statistics.values():
+        yield (statistics.model, "total"), statistics.wait_seconds_total
+        yield (statistics.model, "max"), statistics.wait_seconds_max
+
+
+def collect_hedge_deadlines():
+    for route in first_token_tracker.samples:
+        yield (route,), first_token_tracker.get_deadline(route)
+
+
+registry.register(
+    Gauge(
+        "restllm_admission_completions",
+        "Completions waiting for, running with and refused admission in this process",
+        ("model", "state"),
+        collect_admission_statistics,
+    )
+)
+registry.register(
+    Gauge(
+        "restllm_admission_wait_seconds",
+        "Total and longest wait for admission in this process",
+        ("model", "statistic"),
+        collect_admission_wait,
+    )
+)
+registry.register(
+    Gauge(
+        "restllm_completion_hedge_deadline_seconds",
+        "Time to first token after which a completion route is hedged",
+        ("route",),
+        collect_hedge_deadlines,
+    )
+)
+registry.register(
+    Gauge(
+        "restllm_completion_jobs_running",
+        "Completion jobs running in this process",
+        (),
+        lambda: [((), len(completion_job_worker.tasks))],
+    )
+)
+registry.register(
+    Gauge(
+        "restllm_completion_flights",
+        "Upstream completions shared by coalesced requests in this process",
+        (),
+        lambda: [((), len(completion_coalescer.flights))],
+    )
+)
+
+
+@router.get(
+    "/metrics",
+    description="Metrics of this process in the Prometheus text format",
+    include_in_schema=False,
+)
+async def get_metrics() -> Response:
+    return Response(registry.render(), media_type=CONTENT_TYPE)
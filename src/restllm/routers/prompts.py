@@ -1,11 +1,17 @@
 import redis.asyncio as redis
 from pydantic import ValidationError
 
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from ..dependencies import get_redis_client, build_get_instance_key
 from ..endpoints import add_crud_route
+from ..endpoints.prompts import (
+    NDJSON_MEDIA_TYPE,
+    iter_batch_parameters,
+    read_batch_body,
+    render_prompt_template_lines,
+)
 from ..models import (
     Prompt,
     PromptTemplate,
@@ -24,21 +30,61 @@ add_crud_route(router, PromptTemplate, PromptTemplateWithMeta, prefix="/template
 add_crud_route(router, Prompt, PromptWithMeta, prefix="/prompt")
 
 
-@router.post("/template/{id}/render", response_model=Prompt)
-async def render_prompt_template(
-    parameters: dict[str, str | int | list | dict],
-    redis_client: redis.Redis = Depends(get_redis_client),
-    key: str = Depends(build_get_instance_key(PromptTemplate)),
-) -> Prompt:
+async def get_prompt_template(redis_client: redis.Redis, key: str) -> PromptTemplate:
     template_data = await get_instance(
         redis_client=redis_client,
         key=key,
     )
     if not template_data:
         raise ObjectNotFoundException(PromptTemplate)
-    prompt_template = PromptTemplate.model_validate(template_data.get("object"))
+    return PromptTemplate.model_validate(template_data.get("object"))
+
+
+@router.post("/template/{id}/render", response_model=Prompt)
+async def render_prompt_template(
+    parameters: dict[str, str | int | list | dict],
+    redis_client: redis.Redis = Depends(get_redis_client),
+    key: str = Depends(build_get_instance_key(PromptTemplate)),
+) -> Prompt:
+    prompt_template = await get_prompt_template(redis_client, key)
 
     try:
         return prompt_template.render(parameters)
     except ValidationError as exec:
         return JSONResponse(content={"detail": exec.errors()}, status_code=422)
+
+
+@router.post(
+    "/template/{id}/render/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {NDJSON_MEDIA_TYPE: {}},
+            "description": "One rendered prompt or validation error per line",
+        }
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"type": "object"}}
+                },
+                NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def render_prompt_template_batch(
+    request: Request,
+    redis_client: redis.Redis = Depends(get_redis_client),
+    key: str = Depends(build_get_instance_key(PromptTemplate)),
+) -> StreamingResponse:
+    prompt_template = await get_prompt_template(redis_client, key)
+    parameters_iterator = iter_batch_parameters(
+        await read_batch_body(request), request.headers.get("content-type")
+    )
+    return StreamingResponse(
+        render_prompt_template_lines(prompt_template, parameters_iterator),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
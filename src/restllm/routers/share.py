@@ -1,13 +1,15 @@
 import redis.asyncio as redis
+from cryptography.fernet import InvalidToken, MultiFernet
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from ..cryptography.keys import get_fernet
-from ..cryptography.secure_url import (
-    decrypt_payload,
-    generate_secure_url,
-    payload_is_valid,
+from ..cryptography.keys import FernetKeyRing
+from ..cryptography.secure_url import generate_secure_url, payload_is_valid
+from ..dependencies import (
+    get_fernet,
+    get_key_ring,
+    get_redis_client,
+    get_shareable_key,
 )
-from ..dependencies import get_redis_client, get_shareable_key
 from ..models import MetaModel
 from ..models.share import ShareableObject
 from ..redis.commands import copy_instance
@@ -24,13 +26,13 @@ router = APIRouter(
 async def generate_shared_object(
     redis_client: redis.Redis = Depends(get_redis_client),
     shareable_key: str = Depends(get_shareable_key),
+    fernet: MultiFernet = Depends(get_fernet),
 ) -> ShareableObject:
     token = await copy_instance(
         redis_client=redis_client,
         source_key=shareable_key,
         expire_time=settings.shared_object_expire,
     )
-    fernet = await get_fernet(redis_client)
     signed_url = generate_secure_url(fernet, {"token": token})
     signed_url.update(expire_time=settings.shared_object_expire)
     return signed_url
@@ -41,14 +43,22 @@ async def get_shared_object(
     payload: str = paths.payload_path,
     signature: str = paths.signature_path,
     redis_client: redis.Redis = Depends(get_redis_client),
+    key_ring: FernetKeyRing = Depends(get_key_ring),
 ) -> MetaModel:
-    fernet = await get_fernet(redis_client)
     if not payload_is_valid(payload, signature):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid request",
         )
-    token: str = decrypt_payload(fernet, payload).get("token")
+    try:
+        token: str = (await key_ring.decrypt_payload(redis_client, payload)).get(
+            "token"
+        )
+    except InvalidToken:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid request",
+        )
     instance = await redis_client.json().get(token)
     if not instance:
         raise HTTPException(
@@ -1,6 +1,6 @@
 import redis.asyncio as redis
 import redis.exceptions
-from fastapi import APIRouter, Depends, Response, status
+from fastapi import APIRouter, Depends, Query, Response, status
 
 from ..dependencies import (
     get_redis_client,
@@ -9,8 +9,9 @@ from ..dependencies import (
     get_user,
 )
 from ..exceptions import ObjectNotFoundException, ObjectAlreadyExistsException
-from ..models import UserProfile, UserProfileWithMeta, User
-from ..redis.commands import create_instance, update_instance
+from ..models import UserProfile, UserProfileWithMeta, UsageSummary, User
+from ..models.usage import get_current_period, parse_usage_ledger
+from ..redis.commands import create_instance, get_usage, update_instance
 
 router = APIRouter(
     prefix="/user",
@@ -23,6 +24,21 @@ async def get_token_data(current_user: User = Depends(get_user)):
     return current_user
 
 
+@router.get("/usage", response_model=UsageSummary)
+async def get_user_usage(
+    period: str | None = Query(
+        default=None,
+        pattern=r"^\d{4}-\d{2}$",
+        description="Month of the usage. Defaults to the current month",
+        examples=["2023-11"],
+    ),
+    user: User = Depends(get_user),
+    redis_client: redis.Redis = Depends(get_redis_client),
+):
+    period = period or get_current_period()
+    return parse_usage_ledger(period, await get_usage(redis_client, user, period))
+
+
 @router.get("/profile", response_model=UserProfileWithMeta)
 async def get_user_profile(
     redis_client: redis.Redis = Depends(get_redis_client),
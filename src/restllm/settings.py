@@ -1,5 +1,16 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
-from pydantic import Field, RedisDsn, HttpUrl, SecretStr
+from pydantic import BaseModel, Field, RedisDsn, HttpUrl, SecretStr
+
+
+class ModelLimit(BaseModel):
+    concurrency: int = Field(gt=0)
+    tokens_per_minute: int = Field(
+        default=0,
+        ge=0,
+        description="Estimated tokens per minute. 0 disables the token budget",
+    )
 
 
 class Settings(BaseSettings):
@@ -20,6 +31,218 @@ class Settings(BaseSettings):
         default="/share",
         description="APIRouter prefix for the 'share' route",
     )
+    batch_max_size: int = Field(
+        default=500,
+        description="Maximum number of ressources handled by a single batch request",
+    )
+    batch_max_body_size: int = Field(
+        default=1_048_576,
+        description="Maximum size in bytes of the body of a batch request that is parsed in memory",
+    )
+    completion_stream_persistence: bool = Field(
+        default=True,
+        description="Persist completion tokens to Redis while the completion is streaming instead of once it has finished.",
+    )
+    completion_flush_bytes: int = Field(
+        default=256,
+        description="Number of buffered bytes that triggers a flush of streamed completion tokens to Redis.",
+    )
+    completion_flush_interval: float = Field(
+        default=0.5,
+        description="Time in seconds after which buffered completion tokens are flushed to Redis.",
+    )
+    token_stream_flush_interval: float = Field(
+        default=0.05,
+        description="Time in seconds tokens are buffered before they are added to the Redis stream of a completion job or shared completion. Flushed sooner once completion_flush_bytes are buffered.",
+    )
+    token_stream_max_len: int = Field(
+        default=10_000,
+        description="Approximate maximum number of entries in the Redis stream of a completion job or shared completion",
+    )
+    fernet_key_ring_size: int = Field(
+        default=6,
+        description="Number of Fernet keys kept for decryption. Encrypted payloads stay valid for ring size times the rotation interval.",
+    )
+    fernet_key_rotation_interval: int = Field(
+        default=3600,
+        description="Time in seconds between Fernet key rotations",
+    )
+    fernet_key_refresh_interval: int = Field(
+        default=60,
+        description="Time in seconds between reloads of the Fernet key ring from Redis",
+    )
+    rate_limit_per_minute: int = Field(
+        default=25,
+        description="Weighted number of calls a user can make per minute to a rate limited route",
+    )
+    access_log_queue_size: int = Field(
+        default=10_000,
+        description="Maximum number of access log entries buffered in memory. Entries are dropped when the buffer is full.",
+    )
+    access_log_batch_size: int = Field(
+        default=500,
+        description="Maximum number of access log entries written to Redis in one pipeline",
+    )
+    access_log_stream_max_len: int = Field(
+        default=100_000,
+        description="Approximate maximum length of the access log stream",
+    )
+    event_queue_size: int = Field(
+        default=100,
+        description="Maximum number of undelivered events buffered per connected events client",
+    )
+    event_slow_consumer_policy: Literal["drop", "disconnect"] = Field(
+        default="drop",
+        description="Whether events are dropped or the client is disconnected when its buffer is full",
+    )
+    event_stream_max_len: int = Field(
+        default=10_000,
+        description="Approximate number of events kept per event stream for clients resuming with Last-Event-ID",
+    )
+    object_change_events: bool = Field(
+        default=True,
+        description="Publish an object event for every create, update and delete made through the CRUD endpoints",
+    )
+    user_token_cache_size: int = Field(
+        default=10_000,
+        description="Number of verified access tokens cached in memory per process. Set to 0 to disable the cache.",
+    )
+    template_cache_size: int = Field(
+        default=1024,
+        description="Number of compiled prompt templates and argument models cached per process.",
+    )
+    validate_list_responses: bool = Field(
+        default=True,
+        description="Validate list responses against the response model. Disable to pass documents through from Redis as stored, which skips decoding and validating every item.",
+    )
+    analytics_cache_ttl: int = Field(
+        default=60,
+        description="Seconds analytics results are cached in Redis and by clients",
+    )
+    context_trimming: bool = Field(
+        default=True,
+        description="Drop the oldest non-system messages that do not fit in the context window of the model",
+    )
+    completion_token_reserve: int = Field(
+        default=1024,
+        description="Tokens reserved for the completion when max_tokens is not set",
+    )
+    token_count_cache_size: int = Field(
+        default=10_000,
+        description="Number of message token counts cached per process",
+    )
+    completion_cache: bool = Field(
+        default=False,
+        description="Cache completions of deterministic requests, with temperature 0 or cache=true",
+    )
+    completion_cache_ttl: int = Field(
+        default=3600,
+        description="Seconds a cached completion is kept",
+    )
+    completion_cache_max_entries: int = Field(
+        default=10_000,
+        description="Number of cached completions before the oldest are evicted",
+    )
+    completion_coalescing: Literal["off", "local", "redis"] = Field(
+        default="local",
+        description="Share one upstream completion between concurrent identical requests, within a worker or across workers through Redis",
+    )
+    completion_flight_ttl: int = Field(
+        default=120,
+        description="Seconds a shared completion may run before other workers stop waiting for it",
+    )
+    completion_job_concurrency: int = Field(
+        default=8,
+        ge=0,
+        description="Number of completion jobs run at once per process. 0 disables the job worker of the process",
+    )
+    completion_job_model_concurrency: int = Field(
+        default=4,
+        gt=0,
+        description="Number of completion jobs run at once per process for the same model",
+    )
+    completion_job_ttl: int = Field(
+        default=86_400,
+        description="Seconds a completion job and its result are kept",
+    )
+    completion_job_stream_timeout: int = Field(
+        default=300,
+        description="Seconds a client attached to a completion job waits for the next token",
+    )
+    completion_job_heartbeat_ttl: int = Field(
+        default=30,
+        gt=0,
+        description="Seconds without a heartbeat after which the running jobs of a worker are put back in the queue",
+    )
+    completion_fallbacks: dict[str, list[str]] = Field(
+        default={},
+        description="Models to fall back to, in order, when a model fails before its first token, e.g. {\"gpt-4\": [\"gpt-3.5-turbo\", \"ollama/llama2\"]}. Ollama models use ollama_base_url",
+    )
+    completion_hedging: bool = Field(
+        default=False,
+        description="Fire a second request when a model has not produced its first token within its hedge deadline, and stream the first to answer",
+    )
+    completion_hedge_percentile: float = Field(
+        default=0.95,
+        gt=0,
+        le=1,
+        description="Percentile of the recent times to first token of a model used as its hedge deadline",
+    )
+    completion_hedge_default_deadline: float = Field(
+        default=5.0,
+        description="Hedge deadline in seconds for models with too few times to first token recorded",
+    )
+    completion_hedge_min_samples: int = Field(
+        default=20,
+        description="Number of recorded times to first token before the percentile is used as hedge deadline",
+    )
+    admission_control: bool = Field(
+        default=True,
+        description="Limit concurrent completions and tokens per minute per model across all workers",
+    )
+    admission_default_limit: ModelLimit = Field(
+        default=ModelLimit(concurrency=32),
+        description="Limit for models without an entry in admission_model_limits",
+    )
+    admission_model_limits: dict[str, ModelLimit] = Field(
+        default={},
+        description="Limits per model, e.g. {\"gpt-4\": {\"concurrency\": 8, \"tokens_per_minute\": 40000}}",
+    )
+    admission_queue_size: int = Field(
+        default=100,
+        ge=0,
+        description="Number of completions per model and process waiting for admission before new ones are rejected",
+    )
+    admission_queue_timeout: float = Field(
+        default=30.0,
+        description="Seconds a completion waits for admission before it is rejected",
+    )
+    admission_lease_ttl: int = Field(
+        default=300,
+        description="Seconds an admitted completion holds its slot without streaming a token, before the slot is freed for others",
+    )
+    admission_poll_interval: float = Field(
+        default=0.1,
+        description="Seconds between admission attempts while the model is saturated by other workers",
+    )
+    metrics: bool = Field(
+        default=True,
+        description="Serve the metrics of the process at /metrics for Prometheus",
+    )
+    tracing: bool = Field(
+        default=False,
+        description="Trace dependencies, Redis commands and completion streams with OpenTelemetry. Requires the tracing extra",
+    )
+    tracing_exporter: Literal["otlp", "file"] = Field(
+        default="otlp",
+        description="Export spans over OTLP/HTTP, or as JSON lines to tracing_file_path",
+    )
+    tracing_otlp_endpoint: str | None = Field(
+        default=None,
+        description="OTLP/HTTP traces endpoint. Defaults to OTEL_EXPORTER_OTLP_TRACES_ENDPOINT or http://localhost:4318/v1/traces",
+    )
+    tracing_file_path: str = "traces.jsonl"
+    tracing_service_name: str = "restllm"
     base_url: HttpUrl = "http://localhost:8000"
     redis_dsn: RedisDsn = "redis://localhost:6379/0"
     ollama_base_url: HttpUrl = "http://localhost:11434"
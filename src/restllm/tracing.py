@@ -0,0 +1,164 @@
+import functools
+import inspect
+import time
+from typing import AsyncIterator, Callable, TypeVar
+
+from .settings import settings
+
+Function = TypeVar("Function", bound=Callable)
+
+tracer = None
+
+
+def create_span_exporter():
+    if settings.tracing_exporter == "file":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+        class FileSpanExporter(ConsoleSpanExporter):
+            def shutdown(self) -> None:
+                self.out.close()
+
+        return FileSpanExporter(
+            out=open(settings.tracing_file_path, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    return OTLPSpanExporter(endpoint=settings.tracing_otlp_endpoint)
+
+
+def configure_tracing():
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            SimpleSpanProcessor,
+        )
+    except ImportError as exec:
+        raise ImportError(
+            "Tracing requires the tracing extra. Install it with: pip install restllm[tracing]"
+        ) from exec
+
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: settings.tracing_service_name})
+    )
+    exporter = create_span_exporter()
+    if settings.tracing_exporter == "file":
+        # Written as they end, so tests can read the spans without a flush
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+    else:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    # The provider shuts down its exporter at exit, which closes the file
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+if settings.tracing:
+    tracer = configure_tracing().get_tracer("restllm")
+
+
+def record_error(span, error: Exception) -> None:
+    from opentelemetry.trace import Status, StatusCode
+
+    span.record_exception(error)
+    span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+def get_span_name(function: Callable) -> str:
+    return f"{function.__module__.removeprefix('restllm.')}.{function.__name__}"
+
+
+def traced(function: Function) -> Function:
+    """
+    Runs the function in a span named after its module and name. Functions
+    are returned as they are when tracing is disabled, so the decorator costs
+    nothing then.
+    """
+    if tracer is None:
+        return function
+    name = get_span_name(function)
+
+    if inspect.isasyncgenfunction(function):
+
+        @functools.wraps(function)
+        async def async_generator_wrapper(*args, **kwargs):
+            # Not made the current span, as the context of a generator can
+            # change between two iterations
+            span = tracer.start_span(name)
+            generator = function(*args, **kwargs)
+            try:
+                item = await anext(generator)
+                while True:
+                    # Values and errors sent in, like the error of a request
+                    # sent to a yield dependency, are passed on to the generator
+                    try:
+                        value = yield item
+                    except GeneratorExit:
+                        await generator.aclose()
+                        raise
+                    except BaseException as exec:
+                        item = await generator.athrow(exec)
+                    else:
+                        item = await generator.asend(value)
+            except StopAsyncIteration:
+                return
+            except Exception as exec:
+                record_error(span, exec)
+                raise
+            finally:
+                span.end()
+
+        return async_generator_wrapper
+
+    if inspect.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def coroutine_wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return await function(*args, **kwargs)
+
+        return coroutine_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with tracer.start_as_current_span(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+async def trace_completion_stream(
+    tokens: AsyncIterator[str],
+    model: str,
+    route: str,
+) -> AsyncIterator[str]:
+    span = tracer.start_span(
+        "completion.stream",
+        attributes={"llm.model": model, "llm.route": route},
+    )
+    started_at = time.perf_counter()
+    token_count = 0
+    try:
+        async for token in tokens:
+            if not token_count:
+                span.add_event("first_token")
+                span.set_attribute(
+                    "llm.first_token_seconds", time.perf_counter() - started_at
+                )
+            token_count += 1
+            yield token
+    except Exception as exec:
+        record_error(span, exec)
+        raise
+    finally:
+        span.set_attribute("llm.token_count", token_count)
+        span.end()
+
+
+def instrument_app(app) -> None:
+    """Adds a span per request, which the spans of the request nest under"""
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
@@ -5,7 +5,7 @@ from ..redis.queries import SortingField
 offset_query = Query(
     default=0,
     ge=0,
-    description="Offset to use for resuling list. Can be used for pagination by starting with offset 0 and limit 10, then offset 10 and limit 20",
+    description="Offset to use for resuling list. Prefer the cursor for pagination, as the cost of an offset grows with its size",
     examples=[0, 10],
 )
 limit_query = Query(
@@ -24,3 +24,43 @@ ascending_query = Query(
     description="Should response be sorting in ascending order?. Default is True",
     examples=[True, False],
 )
+cursor_query = Query(
+    default=None,
+    description="Cursor returned as next_cursor by the previous page. The sorting of the previous page is kept when used",
+)
+ids_query = Query(
+    ...,
+    description="Comma separated list of ressource IDs",
+    examples=["1,2,3"],
+)
+fields_query = Query(
+    default=None,
+    description="Comma separated list of fields to return, using dot notation for nested fields. The response is not validated against the full ressource model when used",
+    examples=["object.completion_parameters,updated_at"],
+)
+search_text_query = Query(
+    default=None,
+    max_length=500,
+    description="Full text query matched against the text fields of the ressource",
+    examples=["python code"],
+)
+tag_query = Query(
+    default=None,
+    description="Only return ressources with one of the given tags",
+    examples=[["Zero-shot Prompting"]],
+)
+model_query = Query(
+    default=None,
+    description="Only return ressources using the given model",
+    examples=["gpt-4"],
+)
+language_query = Query(
+    default=None,
+    description="Only return ressources in the given iso639-3 language",
+    examples=["eng"],
+)
+created_after_query = Query(
+    default=None,
+    description="Only return ressources created after this datetime",
+    examples=["2023-11-01T00:00:00Z"],
+)
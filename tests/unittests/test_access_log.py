@@ -0,0 +1,18 @@
+from restllm.redis.access_log import AccessLogWriter
+
+
+def test_log_drops_entries_when_queue_is_full():
+    writer = AccessLogWriter(max_queue_size=2)
+    for index in range(5):
+        writer.log({"path": f"/{index}"})
+    assert writer.queue.qsize() == 2
+    assert writer.dropped == 3
+
+
+def test_get_batch_respects_batch_size():
+    writer = AccessLogWriter(batch_size=3)
+    for index in range(5):
+        writer.log({"path": f"/{index}"})
+    batch = writer.get_batch(writer.queue.get_nowait())
+    assert [entry["path"] for entry in batch] == ["/0", "/1", "/2"]
+    assert writer.queue.qsize() == 2
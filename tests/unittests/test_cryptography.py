@@ -1,6 +1,15 @@
+import asyncio
+import time
+
 import pytest
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 
+from restllm.cryptography.authentication import TokenCache
+from restllm.cryptography.keys import (
+    FernetKeyRing,
+    build_multi_fernet,
+    rotation_is_due,
+)
 from restllm.cryptography.secure_url import (
     decrypt_payload,
     encrypt_payload,
@@ -38,3 +47,77 @@ def test_decrypt_payload(test_fernet_instance, test_payload):
     assert (
         test_payload == decrypted_payload
     ), f"{decrypt_payload} failed to decrypt object into expected dictionary: {test_payload}"
+
+
+def test_key_ring_decrypts_payload_from_previous_key(test_payload):
+    previous_key = Fernet.generate_key()
+    previous_payload = encrypt_payload(Fernet(previous_key), test_payload)
+
+    multi_fernet = build_multi_fernet([Fernet.generate_key(), previous_key])
+    assert decrypt_payload(multi_fernet, previous_payload) == test_payload
+
+
+def test_key_ring_encrypts_with_current_key(test_payload):
+    current_key = Fernet.generate_key()
+    multi_fernet = build_multi_fernet([current_key, Fernet.generate_key()])
+
+    encrypted_payload = encrypt_payload(multi_fernet, test_payload)
+    assert decrypt_payload(Fernet(current_key), encrypted_payload) == test_payload
+
+
+def test_rotation_is_due():
+    assert rotation_is_due(None, 3600)
+    assert rotation_is_due(time.time() - 7200, 3600)
+    assert not rotation_is_due(time.time(), 3600)
+
+
+class LocalFernetKeyRing(FernetKeyRing):
+    """Loads its keys from a list instead of Redis"""
+
+    def __init__(self, keys: list[bytes]):
+        super().__init__()
+        self.keys = keys
+
+    async def load(self, redis_client):
+        return list(self.keys), time.time()
+
+
+def test_key_ring_decrypts_payload_from_key_rotated_by_another_worker(
+    test_payload,
+):
+    key_ring = LocalFernetKeyRing([Fernet.generate_key()])
+    asyncio.run(key_ring.refresh(None))
+    rotated_key = Fernet.generate_key()
+    key_ring.keys.insert(0, rotated_key)
+    encrypted_payload = encrypt_payload(Fernet(rotated_key), test_payload)
+
+    decrypted_payload = asyncio.run(key_ring.decrypt_payload(None, encrypted_payload))
+    assert decrypted_payload == test_payload
+
+
+def test_key_ring_raises_invalid_token_after_refresh(test_payload):
+    key_ring = LocalFernetKeyRing([Fernet.generate_key()])
+    asyncio.run(key_ring.refresh(None))
+    encrypted_payload = encrypt_payload(Fernet(Fernet.generate_key()), test_payload)
+
+    with pytest.raises(InvalidToken):
+        asyncio.run(key_ring.decrypt_payload(None, encrypted_payload))
+
+
+def test_token_cache_evicts_least_recently_used():
+    token_cache = TokenCache(max_size=2)
+    expires_at = time.time() + 60
+    token_cache.set("first", 1, expires_at)
+    token_cache.set("second", 2, expires_at)
+    assert token_cache.get("first") == 1
+    token_cache.set("third", 3, expires_at)
+    assert token_cache.get("second") is None
+    assert token_cache.get("first") == 1
+    assert token_cache.get("third") == 3
+
+
+def test_token_cache_expires_entries():
+    token_cache = TokenCache()
+    token_cache.set("token", 1, time.time() - 1)
+    assert token_cache.get("token") is None
+    assert token_cache.entries == {}
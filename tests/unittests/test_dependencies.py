@@ -0,0 +1,21 @@
+import pytest
+from jose import jwt
+
+from restllm.dependencies import decode_token
+from restllm.exceptions import InvalidCredentialsException
+from restllm.settings import settings
+
+
+def encode(payload: dict) -> str:
+    return jwt.encode(payload, settings.secret_key, algorithm=settings.jwt_algorithm)
+
+
+def test_decode_token_returns_payload_and_expiry():
+    payload, expires_at = decode_token(encode({"sub": "1", "exp": 4102444800}))
+    assert payload == {"sub": "1"}
+    assert expires_at == 4102444800
+
+
+def test_decode_token_rejects_token_without_expiry():
+    with pytest.raises(InvalidCredentialsException):
+        decode_token(encode({"sub": "1"}))
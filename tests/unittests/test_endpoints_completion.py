@@ -0,0 +1,122 @@
+import asyncio
+
+import anyio
+import pytest
+
+from restllm.endpoints import completion
+from restllm.endpoints.completion import persist_streamed_tokens
+
+
+class FakeMessageStore:
+    """Records the messages of a chat instead of writing them to Redis"""
+
+    def __init__(self):
+        self.messages: list[dict] = []
+
+    async def start_chat_message(self, redis_client, instance, key, usage=None):
+        await asyncio.sleep(0)
+        self.messages.append({"content": instance.content, "token_count": None})
+        return len(self.messages) - 1
+
+    async def append_chat_message_content(self, redis_client, content, index, key):
+        await asyncio.sleep(0)
+        self.messages[index]["content"] += content
+
+    async def set_message_token_count(
+        self, redis_client, key, index, token_count, usage=None
+    ):
+        await asyncio.sleep(0)
+        self.messages[index]["token_count"] = token_count
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeMessageStore()
+    monkeypatch.setattr(completion, "start_chat_message", store.start_chat_message)
+    monkeypatch.setattr(
+        completion, "append_chat_message_content", store.append_chat_message_content
+    )
+    monkeypatch.setattr(
+        completion, "set_message_token_count", store.set_message_token_count
+    )
+    monkeypatch.setattr(
+        completion, "count_completion_tokens", lambda model, content: len(content)
+    )
+    monkeypatch.setattr(completion.settings, "completion_flush_bytes", 4)
+    monkeypatch.setattr(completion.settings, "completion_flush_interval", 60.0)
+    return store
+
+
+async def generate(tokens: list[str], error: Exception | None = None):
+    for token in tokens:
+        yield token
+    if error is not None:
+        raise error
+
+
+async def consume(tokens) -> list[str]:
+    return [token async for token in tokens]
+
+
+def test_persist_streamed_tokens(store):
+    tokens = ["He", "llo", " wo", "rld", "!"]
+    streamed = asyncio.run(
+        consume(persist_streamed_tokens(generate(tokens), None, "Chat:1:1", "gpt-4"))
+    )
+    assert streamed == tokens
+    assert store.messages == [{"content": "Hello world!", "token_count": 12}]
+
+
+def test_persist_streamed_tokens_without_tokens(store):
+    tokens = persist_streamed_tokens(
+        generate([], ConnectionError()), None, "Chat:1:1", "gpt-4"
+    )
+    with pytest.raises(ConnectionError):
+        asyncio.run(consume(tokens))
+    assert store.messages == []
+
+
+def test_persist_streamed_tokens_keeps_partial_content(store):
+    tokens = persist_streamed_tokens(
+        generate(["He", "llo", " wo"], ConnectionError()), None, "Chat:1:1", "gpt-4"
+    )
+    with pytest.raises(ConnectionError):
+        asyncio.run(consume(tokens))
+    assert store.messages == [{"content": "Hello wo", "token_count": 8}]
+
+
+def test_persist_streamed_tokens_on_disconnect(store):
+    async def disconnect():
+        tokens = persist_streamed_tokens(
+            generate(["Hello", " world"]), None, "Chat:1:1", "gpt-4"
+        )
+        assert await anext(tokens) == "Hello"
+        await tokens.aclose()
+
+    asyncio.run(disconnect())
+    assert store.messages == [{"content": "Hello", "token_count": 5}]
+
+
+def test_persist_streamed_tokens_when_request_is_cancelled(store):
+    received = []
+
+    async def stalled_tokens():
+        yield "He"
+        yield "y"
+        await asyncio.Event().wait()
+
+    async def receive(tokens):
+        async for token in tokens:
+            received.append(token)
+
+    async def disconnect():
+        tokens = persist_streamed_tokens(stalled_tokens(), None, "Chat:1:1", "gpt-4")
+        # Cancelled like Starlette cancels the scope of a disconnected request
+        async with anyio.create_task_group() as group:
+            group.start_soon(receive, tokens)
+            while len(received) < 2:
+                await asyncio.sleep(0)
+            group.cancel_scope.cancel()
+
+    asyncio.run(disconnect())
+    assert store.messages == [{"content": "Hey", "token_count": 3}]
@@ -0,0 +1,115 @@
+import pytest
+
+from restllm.endpoints import context
+from restllm.endpoints.context import (
+    TokenCountCache,
+    fit_to_context,
+    set_token_counts,
+    trim_messages,
+)
+from restllm.models import Chat
+
+
+@pytest.fixture
+def count_words(monkeypatch):
+    monkeypatch.setattr(
+        context, "count_text_tokens", lambda model, text: len(text.split())
+    )
+
+
+@pytest.fixture
+def messages() -> list[dict]:
+    # Each message costs its words and 4 tokens of overhead
+    return [
+        {"role": "system", "content": "Be brief"},
+        {"role": "user", "content": "one two three"},
+        {"role": "assistant", "content": "four"},
+        {"role": "user", "content": "five six"},
+    ]
+
+
+def test_trim_messages_keeps_system_and_drops_oldest(count_words, messages):
+    assert trim_messages(messages, "gpt-4", budget=17) == [
+        messages[0],
+        messages[2],
+        messages[3],
+    ]
+    assert trim_messages(messages, "gpt-4", budget=24) == messages
+
+
+def test_trim_messages_keeps_single_oversized_message(count_words, messages):
+    oversized = {"role": "user", "content": "word " * 100}
+    assert trim_messages([oversized], "gpt-4", budget=10) == [oversized]
+    assert trim_messages([messages[0], oversized], "gpt-4", budget=10) == [
+        messages[0],
+        oversized,
+    ]
+
+
+def test_trim_messages_drops_function_call_with_its_reply(count_words):
+    call = {
+        "role": "assistant",
+        "content": "",
+        "function_call": {"name": "get_weather", "arguments": "{}"},
+    }
+    reply = {"role": "function", "name": "get_weather", "content": "sunny and warm"}
+    question = {"role": "user", "content": "and tomorrow"}
+    messages = [{"role": "user", "content": "weather"}, call, reply, question]
+    # The question and the reply cost 14 tokens, the call another 8
+    assert trim_messages(messages, "gpt-4", budget=14) == [question]
+    assert trim_messages(messages, "gpt-4", budget=22) == [call, reply, question]
+
+
+def test_trim_messages_keeps_function_call_of_last_reply(count_words):
+    call = {
+        "role": "assistant",
+        "content": "",
+        "function_call": {"name": "get_weather", "arguments": "{}"},
+    }
+    reply = {"role": "function", "name": "get_weather", "content": "sunny"}
+    assert trim_messages([call, reply], "gpt-4", budget=1) == [call, reply]
+
+
+def test_fit_to_context_reserves_max_tokens(count_words, messages):
+    # The context window of gpt-4 is 8192 tokens, and 3 are reserved for the reply
+    completion_kwargs = {"model": "gpt-4", "max_tokens": 8172, "messages": messages}
+    assert fit_to_context(completion_kwargs)["messages"] == [
+        messages[0],
+        messages[2],
+        messages[3],
+    ]
+
+
+def test_token_count_cache_keys_on_digest(monkeypatch):
+    counted = []
+
+    def token_counter(model: str, text: str) -> int:
+        counted.append(text)
+        return len(text)
+
+    monkeypatch.setattr(context.litellm, "token_counter", token_counter)
+    token_count_cache = TokenCountCache(max_size=2)
+    assert token_count_cache.count("gpt-4", "first") == 5
+    assert token_count_cache.count("gpt-4", "first") == 5
+    assert counted == ["first"]
+    assert ("gpt-4", TokenCountCache.get_digest("first")) in token_count_cache.entries
+
+    token_count_cache.count("gpt-4", "second")
+    token_count_cache.count("gpt-4", "third")
+    assert len(token_count_cache.entries) == 2
+    token_count_cache.count("gpt-4", "first")
+    assert counted == ["first", "second", "third", "first"]
+
+
+def test_set_token_counts_replaces_client_token_counts(count_words):
+    chat = Chat.model_validate(
+        {
+            "completion_parameters": {"model": "gpt-3.5-turbo"},
+            "messages": [
+                {"role": "user", "content": "Hello there", "token_count": 1000},
+                {"role": "assistant", "content": "Hi"},
+            ],
+        }
+    )
+    set_token_counts(chat)
+    assert [message.token_count for message in chat.messages] == [2, 1]
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from restllm.endpoints.prompts import (
+    NDJSON_MEDIA_TYPE,
+    iter_batch_parameters,
+    render_prompt_template_lines,
+)
+from restllm.exceptions import InvalidBatchException
+from restllm.models.prompts import PromptTagName, PromptTemplate
+from restllm.settings import settings
+
+
+@pytest.fixture
+def prompt_template() -> PromptTemplate:
+    return PromptTemplate(
+        name="greeting",
+        description="Greets the user of the context",
+        messages=[{"role": "user", "content": "Hello, {{ context.user.name }}"}],
+        arguments=[{"name": "context", "type": "dict"}],
+        language={"iso639_3": "eng"},
+        tags=[PromptTagName.ZEROSHOT],
+    )
+
+
+def render_rows(prompt_template: PromptTemplate, body: bytes, content_type=None):
+    lines = "".join(
+        render_prompt_template_lines(
+            prompt_template, iter_batch_parameters(body, content_type)
+        )
+    )
+    return [json.loads(line) for line in lines.splitlines()]
+
+
+def test_render_batch_reports_errors_per_row(prompt_template):
+    body = json.dumps(
+        [
+            {"context": {"user": {"name": "Ada"}}},
+            {"context": "Ada"},
+            {"context": {}},
+            ["Ada"],
+        ]
+    ).encode()
+
+    rows = render_rows(prompt_template, body)
+    assert [row["index"] for row in rows] == [0, 1, 2, 3]
+    assert rows[0]["prompt"]["messages"] == [{"role": "user", "content": "Hello, Ada"}]
+    assert rows[1]["detail"][0]["loc"] == ["context"]
+    # Undefined attributes fail in the template rather than in validation
+    assert rows[2]["detail"] == "'dict object' has no attribute 'user'"
+    assert rows[3]["detail"] == "Parameters must be a JSON object"
+
+
+def test_render_batch_from_ndjson(prompt_template):
+    body = b'{"context": {"user": {"name": "Ada"}}}\n\nnot json\n'
+
+    rows = render_rows(prompt_template, body, NDJSON_MEDIA_TYPE)
+    assert rows[0]["prompt"]["messages"][0]["content"] == "Hello, Ada"
+    assert rows[1]["index"] == 1 and "detail" in rows[1]
+
+
+def test_render_batch_rejects_too_many_rows(monkeypatch):
+    monkeypatch.setattr(settings, "batch_max_size", 2)
+
+    with pytest.raises(InvalidBatchException):
+        iter_batch_parameters(b"{}\n{}\n{}\n", NDJSON_MEDIA_TYPE)
+    with pytest.raises(InvalidBatchException):
+        iter_batch_parameters(b"[{}, {}, {}]", "application/json")
+
+
+def test_render_batch_rejects_invalid_body():
+    with pytest.raises(InvalidBatchException):
+        iter_batch_parameters(b"{", "application/json")
+    with pytest.raises(InvalidBatchException):
+        iter_batch_parameters(b"{}", "application/json")
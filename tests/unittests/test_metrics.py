@@ -0,0 +1,54 @@
+import asyncio
+
+from restllm.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    format_labels,
+    redis_command_seconds,
+    timed_redis_command,
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency", ("model",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, "gpt-4")
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{model="gpt-4",le="0.1"} 2',
+        'latency_seconds_bucket{model="gpt-4",le="1.0"} 3',
+        'latency_seconds_bucket{model="gpt-4",le="+Inf"} 4',
+        'latency_seconds_sum{model="gpt-4"} 2.65',
+        'latency_seconds_count{model="gpt-4"} 4',
+    ]
+
+
+def test_registry_renders_counters_and_gauges():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("tokens_total", "Tokens", ("model",)))
+    counter.inc(3, "gpt-4")
+    counter.inc(2, "gpt-4")
+    registry.register(Gauge("queued", "Queued", (), lambda: [((), 7)]))
+    assert registry.render().splitlines()[2::3] == [
+        'tokens_total{model="gpt-4"} 5',
+        "queued 7",
+    ]
+
+
+def test_format_labels_escapes_values():
+    assert format_labels(("route",), ['a"b\\c']) == '{route="a\\"b\\\\c"}'
+
+
+def test_timed_redis_command_observes_failures():
+    @timed_redis_command
+    async def failing_command():
+        raise ConnectionError
+
+    try:
+        asyncio.run(failing_command())
+    except ConnectionError:
+        pass
+    assert redis_command_seconds.get_count("failing_command") == 1
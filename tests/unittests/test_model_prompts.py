@@ -4,6 +4,7 @@ from pydantic import ValidationError
 from restllm.models.prompts import (
     PromptTemplate,
     PromptTagName,
+    get_template_cache_info,
     is_valid_jinja2_template,
 )
 
@@ -158,3 +159,24 @@ def test_model_render_from_template_multiple(valid_multiple_messages):
     rendered_string = instance.render({"test_system": "name1", "test_user": "name2"})
     assert rendered_string.get("messages")[0].get("content") == "Hello, name1"
     assert rendered_string.get("messages")[1].get("content") == "Hello, name2"
+
+
+def test_render_reuses_compiled_template(valid_test_messages):
+    instance = PromptTemplate(
+        name="CachedTemplate",
+        description="Test description",
+        messages=valid_test_messages,
+        arguments=[{"name": "test", "type": "str"}],
+        language={"iso639_3": "eng"},
+        tags=[PromptTagName.ZEROSHOT],
+    )
+    assert instance.render({"test": "world"})["messages"][0]["content"] == "Hello, world"
+    hits = get_template_cache_info()
+    instance.render({"test": "again"})
+    cache_info = get_template_cache_info()
+    assert cache_info["compile_template"]["hits"] == hits["compile_template"]["hits"] + 1
+    assert (
+        cache_info["create_arguments_model"]["hits"]
+        == hits["create_arguments_model"]["hits"] + 1
+    )
+    assert instance.create_model() is instance.create_model()
@@ -0,0 +1,34 @@
+from restllm.models.usage import TokenUsage, parse_usage_ledger
+
+
+def test_token_usage_increments_skip_zero_fields():
+    usage = TokenUsage(owner=1, model="gpt-4", prompt_tokens=10, requests=1)
+    assert usage.get_increments() == {"gpt-4:prompt_tokens": 10, "gpt-4:requests": 1}
+    assert usage.get_key() == f"usage:1:{usage.period}"
+
+
+def test_parse_usage_ledger_groups_by_model():
+    summary = parse_usage_ledger(
+        "2023-11",
+        {
+            b"gpt-4:prompt_tokens": b"10",
+            b"gpt-4:completion_tokens": b"5",
+            b"gpt-3.5-turbo:requests": b"2",
+        },
+    )
+    assert [model.model_dump() for model in summary.models] == [
+        {
+            "model": "gpt-3.5-turbo",
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "requests": 2,
+            "total_tokens": 0,
+        },
+        {
+            "model": "gpt-4",
+            "prompt_tokens": 10,
+            "completion_tokens": 5,
+            "requests": 0,
+            "total_tokens": 15,
+        },
+    ]
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from restllm.providers import CompletionRouter, FirstTokenTracker, get_route_kwargs
+
+
+def create_start(
+    delays: dict[str, float],
+    failing: set[str] = frozenset(),
+    queued: dict[str, float] = {},
+):
+    started, closed = [], []
+
+    async def start(route: str):
+        started.append(route)
+        await asyncio.sleep(queued.get(route, 0))
+        if route in failing:
+            raise ConnectionError(f"{route} is down")
+
+        async def tokens():
+            try:
+                await asyncio.sleep(delays.get(route, 0))
+                for token in (route, "!"):
+                    yield token
+            finally:
+                closed.append(route)
+
+        return tokens()
+
+    return start, started, closed
+
+
+async def collect(router: CompletionRouter, routes: list[str], start):
+    route, tokens = await router.route(routes, start)
+    return route, [token async for token in tokens]
+
+
+def test_tracker_uses_default_deadline_until_enough_samples():
+    tracker = FirstTokenTracker(min_samples=3, percentile=0.5, default_deadline=4.0)
+    tracker.record("gpt-4", 1.0)
+    assert tracker.get_deadline("gpt-4") == 4.0
+    for seconds in (3.0, 2.0):
+        tracker.record("gpt-4", seconds)
+    assert tracker.get_deadline("gpt-4") == 2.0
+    assert tracker.get_percentile("gpt-4", 1.0) == 3.0
+
+
+def test_router_falls_back_when_route_fails():
+    router = CompletionRouter(FirstTokenTracker())
+    start, started, _ = create_start({}, failing={"gpt-4"})
+    result = asyncio.run(collect(router, ["gpt-4", "gpt-3.5-turbo"], start))
+    assert result == ("gpt-3.5-turbo", ["gpt-3.5-turbo", "!"])
+    assert started == ["gpt-4", "gpt-3.5-turbo"]
+
+
+def test_router_raises_error_of_last_route():
+    router = CompletionRouter(FirstTokenTracker())
+    start, _, _ = create_start({}, failing={"gpt-4", "gpt-3.5-turbo"})
+    with pytest.raises(ConnectionError, match="gpt-3.5-turbo"):
+        asyncio.run(collect(router, ["gpt-4", "gpt-3.5-turbo"], start))
+
+
+def test_hedged_request_wins_and_cancels_slow_route():
+    tracker = FirstTokenTracker(default_deadline=0.01)
+    router = CompletionRouter(tracker, hedging=True)
+    start, started, closed = create_start({"gpt-4": 1.0})
+    result = asyncio.run(collect(router, ["gpt-4", "ollama/llama2"], start))
+    assert result == ("ollama/llama2", ["ollama/llama2", "!"])
+    assert started == ["gpt-4", "ollama/llama2"]
+    assert sorted(closed) == ["gpt-4", "ollama/llama2"]
+    assert set(tracker.samples) == {"gpt-4", "ollama/llama2"}
+
+
+def test_route_waiting_for_admission_is_not_hedged():
+    tracker = FirstTokenTracker(default_deadline=0.02)
+    router = CompletionRouter(tracker, hedging=True)
+    start, started, _ = create_start({}, queued={"gpt-4": 0.1})
+    result = asyncio.run(collect(router, ["gpt-4", "ollama/llama2"], start))
+    assert result == ("gpt-4", ["gpt-4", "!"])
+    assert started == ["gpt-4"]
+    assert tracker.samples["gpt-4"][0] < 0.02
+
+
+def test_route_failing_while_queued_falls_back():
+    router = CompletionRouter(FirstTokenTracker(), hedging=True)
+    start, started, _ = create_start({}, failing={"gpt-4"}, queued={"gpt-4": 0.01})
+    result = asyncio.run(collect(router, ["gpt-4", "gpt-3.5-turbo"], start))
+    assert result == ("gpt-3.5-turbo", ["gpt-3.5-turbo", "!"])
+    assert started == ["gpt-4", "gpt-3.5-turbo"]
+
+
+def test_get_route_kwargs_points_ollama_to_base_url():
+    kwargs = {"model": "gpt-4", "messages": []}
+    assert get_route_kwargs(kwargs, "gpt-3.5-turbo")["model"] == "gpt-3.5-turbo"
+    assert "api_base" in get_route_kwargs(kwargs, "ollama/llama2")
+    assert kwargs["model"] == "gpt-4"
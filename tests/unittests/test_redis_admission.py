@@ -0,0 +1,184 @@
+import asyncio
+
+import anyio
+import pytest
+
+from restllm.redis.admission import (
+    AdmissionController,
+    AdmissionLease,
+    AdmissionRejected,
+)
+from restllm.settings import ModelLimit
+
+
+class LocalAdmissionController(AdmissionController):
+    """Admits completions against a local counter instead of Redis"""
+
+    def __init__(self, retry_after: float = 0, **kwargs):
+        super().__init__(default_limit=ModelLimit(concurrency=1), **kwargs)
+        self.running = 0
+        self.retry_after = retry_after
+
+    async def try_acquire(self, redis_client, lease: AdmissionLease):
+        if self.running >= self.get_limit(lease.model).concurrency:
+            return False, self.retry_after
+        self.running += 1
+        return True, 0
+
+    async def release(self, redis_client, lease: AdmissionLease):
+        self.running -= 1
+        self.get_statistics(lease.model).in_flight -= 1
+        self.notify_release(lease.model)
+
+
+def test_admits_waiting_completions_in_order():
+    controller = LocalAdmissionController(poll_interval=5)
+    admitted = []
+
+    async def complete(index: int):
+        lease = await controller.admit(None, "gpt-4", 10)
+        admitted.append(index)
+        await asyncio.sleep(0.01)
+        await controller.release(None, lease)
+
+    async def run():
+        await asyncio.gather(*[complete(index) for index in range(4)])
+
+    asyncio.run(run())
+    statistics = controller.get_statistics("gpt-4")
+    assert admitted == [0, 1, 2, 3]
+    assert (statistics.admitted, statistics.queued, statistics.in_flight) == (4, 0, 0)
+    assert statistics.wait_seconds_max > 0
+
+
+def test_rejects_completions_when_queue_is_full():
+    controller = LocalAdmissionController(queue_size=1, queue_timeout=0.05)
+
+    async def run():
+        await controller.admit(None, "gpt-4", 10)
+        waiting = asyncio.ensure_future(controller.admit(None, "gpt-4", 10))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit(None, "gpt-4", 10)
+        with pytest.raises(AdmissionRejected):
+            await waiting
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    statistics = controller.get_statistics("gpt-4")
+    assert rejected.retry_after >= 1
+    assert (statistics.rejected, statistics.timed_out) == (1, 1)
+    assert not controller.queues["gpt-4"]
+
+
+def test_limits_are_per_model():
+    controller = LocalAdmissionController()
+    controller.model_limits = {"gpt-4": ModelLimit(concurrency=8)}
+    assert controller.get_limit("gpt-4").concurrency == 8
+    assert controller.get_limit("gpt-3.5-turbo").concurrency == 1
+
+
+def test_rejects_with_retry_after_of_token_budget():
+    controller = LocalAdmissionController(retry_after=2.5, queue_timeout=0.05)
+
+    async def run():
+        await controller.admit(None, "gpt-4", 10)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit(None, "gpt-4", 10)
+        return rejected.value
+
+    assert asyncio.run(run()).retry_after == 2.5
+
+
+async def stream_tokens():
+    yield "a"
+    yield "b"
+
+
+def test_hold_releases_lease_once():
+    controller = LocalAdmissionController()
+
+    async def run():
+        lease = await controller.admit(None, "gpt-4", 10)
+        hold = controller.hold(None, lease, stream_tokens())
+        tokens = [token async for token in hold]
+        await hold.aclose()
+        return tokens
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert controller.running == 0
+    assert controller.get_statistics("gpt-4").in_flight == 0
+
+
+def test_hold_releases_lease_when_closed_before_iteration():
+    controller = LocalAdmissionController()
+
+    async def run():
+        lease = await controller.admit(None, "gpt-4", 10)
+        await controller.hold(None, lease, stream_tokens()).aclose()
+
+    asyncio.run(run())
+    assert controller.running == 0
+    assert controller.get_statistics("gpt-4").in_flight == 0
+
+
+def test_hold_releases_lease_when_dropped():
+    controller = LocalAdmissionController()
+
+    async def run():
+        lease = await controller.admit(None, "gpt-4", 10)
+        controller.hold(None, lease, stream_tokens())
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert controller.running == 0
+    assert controller.get_statistics("gpt-4").in_flight == 0
+
+
+class FakeLeaseClient:
+    def __init__(self):
+        self.leases = set()
+
+    async def zrem(self, key, member):
+        await asyncio.sleep(0)
+        self.leases.discard(member)
+
+
+class LeaseAdmissionController(AdmissionController):
+    """Keeps leases in a fake client and releases them like Redis"""
+
+    def __init__(self):
+        super().__init__(default_limit=ModelLimit(concurrency=1))
+
+    async def try_acquire(self, redis_client, lease: AdmissionLease):
+        redis_client.leases.add(lease.id)
+        return True, 0
+
+
+def test_hold_releases_lease_when_consumer_is_cancelled():
+    controller = LeaseAdmissionController()
+    redis_client = FakeLeaseClient()
+    received = []
+
+    async def endless_tokens():
+        while True:
+            await asyncio.sleep(0)
+            yield "a"
+
+    async def consume(hold):
+        async for token in hold:
+            received.append(token)
+
+    async def run():
+        lease = await controller.admit(redis_client, "gpt-4", 10)
+        hold = controller.hold(redis_client, lease, endless_tokens())
+        # Cancelled like Starlette cancels the scope of a disconnected request
+        async with anyio.create_task_group() as group:
+            group.start_soon(consume, hold)
+            while not received:
+                await asyncio.sleep(0)
+            group.cancel_scope.cancel()
+
+    asyncio.run(run())
+    assert redis_client.leases == set()
+    assert controller.get_statistics("gpt-4").in_flight == 0
@@ -0,0 +1,81 @@
+import asyncio
+
+from restllm.models import User
+from restllm.models import ModelUsage
+from restllm.redis.analytics import (
+    aggregate,
+    create_count_per_day_request,
+    create_model_usage_request,
+    get_cached,
+)
+
+owner = User(id=1, first_name="Alice", last_name="Wonderer", email="a@example.com")
+
+
+class FakeCacheClient:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key: str):
+        return self.values.get(key)
+
+    async def set(self, key: str, value: bytes, ex: int):
+        self.values[key] = value
+
+
+class FakeAggregateClient:
+    def __init__(self, reply: list):
+        self.reply = reply
+
+    async def execute_command(self, *args):
+        return self.reply
+
+
+def test_count_per_day_request_groups_by_day():
+    args = create_count_per_day_request(owner, created_after=86400.0).build_args()
+    assert args[0] == "@owner:[1 1] @created_at:[86400.0 +inf]"
+    assert "floor(@created_at / 86400) * 86400" in args
+    assert args[args.index("GROUPBY") : args.index("GROUPBY") + 3] == [
+        "GROUPBY",
+        "1",
+        "@day",
+    ]
+
+
+def test_model_usage_request_sorts_by_count():
+    args = create_model_usage_request(owner).build_args()
+    assert args[args.index("SORTBY") : args.index("SORTBY") + 4] == [
+        "SORTBY",
+        "2",
+        "@count",
+        "DESC",
+    ]
+
+
+def test_get_cached_computes_once():
+    redis_client = FakeCacheClient()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"count": 1}
+
+    async def run():
+        first = await get_cached(redis_client, "key", 60, compute)
+        second = await get_cached(redis_client, "key", 60, compute)
+        return first, second
+
+    assert asyncio.run(run()) == ({"count": 1}, {"count": 1})
+    assert len(calls) == 1
+
+
+
+def test_aggregate_groups_documents_without_the_field():
+    redis_client = FakeAggregateClient(
+        [2, [b"model", b'["gpt-4"]', b"count", b"3"], [b"model", None, b"count", b"1"]]
+    )
+    request = create_model_usage_request(owner)
+
+    rows = asyncio.run(aggregate(redis_client, "Chat", request))
+    assert rows == [{"model": "gpt-4", "count": "3"}, {"model": None, "count": "1"}]
+    assert ModelUsage(model=rows[1]["model"], count=int(rows[1]["count"])).model is None
@@ -0,0 +1,149 @@
+import asyncio
+
+from restllm.redis.coalescing import CompletionCoalescer, CompletionFlight
+from restllm.redis.completion_cache import (
+    get_completion_hash,
+    get_flight_lock_key,
+    release_flight_lock,
+    release_flight_lock_script,
+)
+
+
+def test_completion_hash_ignores_key_order():
+    assert get_completion_hash(
+        {"model": "gpt-4", "messages": [{"role": "user", "content": "Hi"}]}
+    ) == get_completion_hash(
+        {"messages": [{"content": "Hi", "role": "user"}], "model": "gpt-4"}
+    )
+    assert get_completion_hash({"model": "gpt-4"}) != get_completion_hash(
+        {"model": "gpt-3.5-turbo"}
+    )
+
+
+def test_flight_replays_tokens_to_late_followers():
+    async def collect() -> list[str]:
+        flight = CompletionFlight()
+        flight.publish("Hello")
+        follower = asyncio.ensure_future(
+            asyncio.gather(*[collect_tokens(flight.follow()) for _ in range(2)])
+        )
+        await asyncio.sleep(0)
+        flight.publish(" world")
+        flight.finish()
+        return await follower
+
+    assert asyncio.run(collect()) == [["Hello", " world"], ["Hello", " world"]]
+
+
+async def collect_tokens(tokens) -> list[str]:
+    return [token async for token in tokens]
+
+
+def test_coalescer_runs_one_upstream_completion():
+    calls = []
+
+    async def tokens():
+        for token in ("a", "b"):
+            await asyncio.sleep(0)
+            yield token
+
+    async def upstream():
+        calls.append(1)
+        return tokens()
+
+    async def run() -> list:
+        coalescer = CompletionCoalescer()
+        joined = [await coalescer.join(None, "hash", upstream) for _ in range(3)]
+        results = await asyncio.gather(*[collect_tokens(t) for t, _ in joined])
+        return [leader for _, leader in joined], results, coalescer.flights
+
+    leaders, results, flights = asyncio.run(run())
+    assert calls == [1]
+    assert leaders == [True, False, False]
+    assert results == [["a", "b"]] * 3
+    assert flights == {}
+
+
+def test_coalescer_propagates_upstream_errors():
+    async def tokens():
+        yield "a"
+        raise RuntimeError("upstream failed")
+
+    async def upstream():
+        return tokens()
+
+    async def run() -> str:
+        coalescer = CompletionCoalescer()
+        tokens, _ = await coalescer.join(None, "hash", upstream)
+        try:
+            await collect_tokens(tokens)
+        except RuntimeError as error:
+            return str(error)
+
+    assert asyncio.run(run()) == "upstream failed"
+
+
+def test_coalescer_fails_followers_when_start_fails():
+    async def upstream():
+        await asyncio.sleep(0)
+        raise RuntimeError("rejected")
+
+    async def run() -> list:
+        coalescer = CompletionCoalescer()
+        leader = asyncio.ensure_future(coalescer.join(None, "hash", upstream))
+        await asyncio.sleep(0)
+        follower = coalescer.join(None, "hash", upstream)
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        return [str(result) for result in results], coalescer.flights
+
+    # The follower is rejected before it has any tokens to stream
+    assert asyncio.run(run()) == (["rejected", "rejected"], {})
+
+
+def test_coalescer_followers_wait_for_start():
+    admitted = asyncio.Event()
+
+    async def tokens():
+        yield "a"
+
+    async def upstream():
+        await admitted.wait()
+        return tokens()
+
+    async def run() -> list:
+        coalescer = CompletionCoalescer()
+        leader = asyncio.ensure_future(coalescer.join(None, "hash", upstream))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(coalescer.join(None, "hash", upstream))
+        await asyncio.sleep(0)
+        waiting = not follower.done()
+        admitted.set()
+        joined = await asyncio.gather(leader, follower)
+        results = await asyncio.gather(*[collect_tokens(t) for t, _ in joined])
+        return waiting, results
+
+    assert asyncio.run(run()) == (True, [["a"], ["a"]])
+
+
+class FakeLockClient:
+    """Runs the release script against a dict of keys"""
+
+    def __init__(self, values: dict[str, str]):
+        self.values = values
+
+    async def evalsha(self, sha, numkeys, key, flight_id):
+        assert sha == release_flight_lock_script.sha
+        if self.values.get(key) != flight_id:
+            return 0
+        del self.values[key]
+        return 1
+
+
+def test_release_flight_lock_keeps_lock_of_other_flight():
+    lock_key = get_flight_lock_key("hash")
+    redis_client = FakeLockClient({lock_key: "other"})
+
+    assert not asyncio.run(release_flight_lock(redis_client, "hash", "flight"))
+    assert redis_client.values == {lock_key: "other"}
+    assert asyncio.run(release_flight_lock(redis_client, "hash", "other"))
+    assert redis_client.values == {}
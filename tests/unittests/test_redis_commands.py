@@ -0,0 +1,162 @@
+import asyncio
+
+import redis.exceptions
+
+from restllm.metrics import redis_command_seconds
+from restllm.models import ChatMessage, User
+from restllm.models.events import (
+    CRUDAction,
+    Event,
+    EventStatus,
+    EventType,
+    EventWithMeta,
+)
+from restllm.redis.commands import (
+    CREATE_WITH_EVENT_SCRIPT,
+    DELETE_WITH_EVENT_SCRIPT,
+    create_multiple_instances,
+    delete_multiple_instances,
+    split_results,
+    start_chat_message,
+)
+
+
+class FakePipeline:
+    def __init__(self, client: "FakeRedisClient"):
+        self.client = client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    def multi(self):
+        pass
+
+    def json(self):
+        return self
+
+    def arrappend(self, key, path, value):
+        self.client.commands.append(("JSON.ARRAPPEND", key, path))
+
+    def get(self, key):
+        self.client.commands.append(("JSON.GET", key))
+
+    def numincrby(self, key, path, number):
+        self.client.commands.append(("JSON.NUMINCRBY", key, path))
+
+    def set(self, key, path, value, nx=False, xx=False):
+        self.client.commands.append(("JSON.SET", key, path))
+
+    def delete(self, key):
+        self.client.commands.append(("DEL", key))
+
+    def eval(self, script, numkeys, *keys_and_args):
+        self.client.commands.append(("EVAL", script, *keys_and_args[:numkeys]))
+
+    async def execute(self, raise_on_error=True):
+        return self.client.results
+
+
+class FakeRedisClient:
+    def __init__(self, results: list):
+        self.results = results
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def build_change_event(action: CRUDAction) -> EventWithMeta:
+    return EventWithMeta(
+        owner=1,
+        type=EventType.OBJECT,
+        event=Event(action=action, status=EventStatus.COMPLETED, object={}),
+    )
+
+
+def test_split_results():
+    assert split_results([1, 2, 3, 4], 2) == [[1, 2], [3, 4]]
+
+
+def test_create_multiple_instances_reports_each_item():
+    owner = User(id=1, first_name="Alice", last_name="Wonderer", email="a@example.com")
+    error = redis.exceptions.ResponseError("exists")
+    redis_client = FakeRedisClient([True, error])
+    results = asyncio.run(
+        create_multiple_instances(
+            redis_client,
+            owner,
+            [ChatMessage(role="user", content="Hi")] * 2,
+            [3, 4],
+            ["ChatMessage:1:3", "ChatMessage:1:4"],
+        )
+    )
+    assert [created for created, _ in results] == [True, error]
+    assert [meta_instance.id for _, meta_instance in results] == [3, 4]
+    assert [command[1] for command in redis_client.commands] == [
+        "ChatMessage:1:3",
+        "ChatMessage:1:4",
+    ]
+
+
+def test_delete_multiple_instances_reports_each_item():
+    redis_client = FakeRedisClient([1, 0])
+    results = asyncio.run(delete_multiple_instances(redis_client, ["a", "b"]))
+    assert results == [1, 0]
+    assert redis_client.commands == [("DEL", "a"), ("DEL", "b")]
+
+
+def test_create_multiple_instances_writes_with_change_events():
+    owner = User(id=1, first_name="Alice", last_name="Wonderer", email="a@example.com")
+    redis_client = FakeRedisClient([1, 0])
+    results = asyncio.run(
+        create_multiple_instances(
+            redis_client,
+            owner,
+            [ChatMessage(role="user", content="Hi")] * 2,
+            [3, 4],
+            ["ChatMessage:1:3", "ChatMessage:1:4"],
+            change_events=[build_change_event(CRUDAction.CREATE)] * 2,
+        )
+    )
+    assert [created for created, _ in results] == [1, 0]
+    # The event is published by the script that writes the object
+    assert redis_client.commands == [
+        ("EVAL", CREATE_WITH_EVENT_SCRIPT, "ChatMessage:1:3", "event_stream:object:1"),
+        ("EVAL", CREATE_WITH_EVENT_SCRIPT, "ChatMessage:1:4", "event_stream:object:1"),
+    ]
+
+
+def test_delete_multiple_instances_writes_with_change_events():
+    redis_client = FakeRedisClient([1, 0])
+    results = asyncio.run(
+        delete_multiple_instances(
+            redis_client,
+            ["a", "b"],
+            change_events=[build_change_event(CRUDAction.DELETE)] * 2,
+        )
+    )
+    assert results == [1, 0]
+    assert redis_client.commands == [
+        ("EVAL", DELETE_WITH_EVENT_SCRIPT, "a", "event_stream:object:1"),
+        ("EVAL", DELETE_WITH_EVENT_SCRIPT, "b", "event_stream:object:1"),
+    ]
+
+
+def test_start_chat_message_returns_index_and_is_timed():
+    redis_client = FakeRedisClient([[3], True, {}, [3]])
+    count = redis_command_seconds.get_count("start_chat_message")
+    index = asyncio.run(
+        start_chat_message(
+            redis_client, ChatMessage(role="assistant", content=""), "Chat:1:2"
+        )
+    )
+    assert index == 2
+    assert redis_client.commands[0] == (
+        "JSON.ARRAPPEND",
+        "Chat:1:2",
+        "$.object.messages",
+    )
+    assert redis_command_seconds.get_count("start_chat_message") == count + 1
@@ -0,0 +1,125 @@
+import asyncio
+
+from restllm.models import CRUDAction, Datetime, User
+from restllm.redis.events import (
+    STOPWORD,
+    EventHub,
+    SlowConsumerPolicy,
+    build_change_event,
+    decode_event_message,
+    format_server_sent_event,
+    subscribe_event,
+)
+
+
+class FakeStreamClient:
+    def __init__(self, entries: list[tuple[bytes, dict]]):
+        self.entries = entries
+
+    async def xread(self, streams: dict, count: int):
+        stream_key, last_event_id = next(iter(streams.items()))
+        entries = [entry for entry in self.entries if entry[0].decode() > last_event_id]
+        return [[stream_key.encode(), entries[:count]]] if entries else []
+
+
+def test_dispatch_only_reaches_subscribed_channels():
+    event_hub = EventHub()
+    subscription = event_hub.subscribe(["object:1"])
+    other_subscription = event_hub.subscribe(["object:2"])
+
+    event_hub.dispatch("object:1", "1-0 data")
+
+    assert subscription.queue.get_nowait() == ("1-0", "data")
+    assert other_subscription.queue.empty()
+
+
+def test_unsubscribe_removes_empty_channels():
+    event_hub = EventHub()
+    subscription = event_hub.subscribe(["object:1", "task:1"])
+    event_hub.unsubscribe(subscription)
+    assert event_hub.subscriptions == {}
+
+
+def test_drop_policy_counts_dropped_events():
+    event_hub = EventHub(max_queue_size=1, policy=SlowConsumerPolicy.DROP)
+    subscription = event_hub.subscribe(["object:1"])
+
+    for data in ("1-0 first", "2-0 second", "3-0 third"):
+        event_hub.dispatch("object:1", data)
+
+    assert subscription.dropped == 2
+    assert not subscription.closed
+    assert subscription.queue.get_nowait() == ("1-0", "first")
+
+
+def test_disconnect_policy_closes_subscription():
+    event_hub = EventHub(max_queue_size=1, policy=SlowConsumerPolicy.DISCONNECT)
+    subscription = event_hub.subscribe(["object:1"])
+
+    event_hub.dispatch("object:1", "1-0 first")
+    event_hub.dispatch("object:1", "2-0 second")
+
+    assert subscription.closed
+    assert subscription.queue.get_nowait() is None
+
+
+def test_subscribe_event_stops_on_stopword():
+    event_hub = EventHub()
+
+    async def collect() -> list[str]:
+        stream = subscribe_event(["object:1"], event_hub)
+        consumer = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        event_hub.dispatch("object:1", "1-0 data")
+        first = await consumer
+        event_hub.dispatch("object:1", STOPWORD)
+        rest = [data async for data in stream]
+        return [first, *rest]
+
+    assert asyncio.run(collect()) == ["id: 1-0\ndata: data\n\n"]
+    assert event_hub.subscriptions == {}
+
+
+def test_subscribe_event_resumes_from_last_event_id():
+    event_hub = EventHub()
+    redis_client = FakeStreamClient(
+        [(b"1-0", {b"data": b"old"}), (b"2-0", {b"data": b"missed"})]
+    )
+
+    async def collect() -> list[str]:
+        stream = subscribe_event(["object:1"], event_hub, redis_client, "1-0")
+        replayed = await stream.__anext__()
+        # Live duplicate of the replayed event followed by a new event
+        event_hub.dispatch("object:1", "2-0 missed")
+        event_hub.dispatch("object:1", "3-0 new")
+        event_hub.dispatch("object:1", STOPWORD)
+        return [replayed, *[data async for data in stream]]
+
+    assert asyncio.run(collect()) == [
+        "id: 2-0\ndata: missed\n\n",
+        "id: 3-0\ndata: new\n\n",
+    ]
+
+
+def test_decode_event_message():
+    assert decode_event_message("1-0 {}") == ("1-0", "{}")
+    assert decode_event_message(STOPWORD) == (None, STOPWORD)
+
+
+def test_format_server_sent_event_without_id():
+    assert format_server_sent_event(None, "data") == "data: data\n\n"
+
+
+def test_build_change_event():
+    owner = User(id=1, first_name="Alice", last_name="Wonderer", email="a@example.com")
+    updated_at = Datetime()
+    change_event = build_change_event(
+        owner, "Chat", 5, CRUDAction.UPDATE, updated_at, ["$.object"]
+    )
+    assert change_event.get_channel() == "object:1"
+    assert change_event.event.object.model_dump() == {
+        "class_name": "Chat",
+        "id": 5,
+        "updated_at": updated_at.timestamp,
+        "paths": ["$.object"],
+    }
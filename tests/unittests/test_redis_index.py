@@ -0,0 +1,141 @@
+import pytest
+import redis.exceptions
+
+from restllm.redis.index import (
+    BACKFILL_MESSAGE_COUNT_SCRIPT,
+    IndexNotFound,
+    backfill_documents,
+    get_versioned_index_key,
+    swap_index_alias,
+    wait_for_indexing,
+)
+
+
+class FakeIndex:
+    def __init__(self, client: "FakeSearchClient", name: str):
+        self.client = client
+        self.name = name
+
+    def info(self) -> dict:
+        name = self.client.aliases.get(self.name, self.name)
+        if name not in self.client.indexes:
+            raise redis.exceptions.ResponseError("Unknown Index name")
+        return {"index_name": name, **self.client.indexes[name].pop(0)}
+
+    def aliasupdate(self, alias: str):
+        self.client.aliases[alias] = self.name
+
+    def dropindex(self, delete_documents: bool = False):
+        del self.client.indexes[self.name]
+
+
+class FakeTransaction:
+    """Runs the queued search commands once executed"""
+
+    def __init__(self, client: "FakeSearchClient"):
+        self.client = client
+        self.commands: list[tuple] = []
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+
+    def execute(self):
+        self.client.transactions.append([command[0] for command in self.commands])
+        for name, index_name, *args in self.commands:
+            if name == "FT.DROPINDEX":
+                self.client.ft(index_name).dropindex()
+            elif name == "FT.ALIASUPDATE":
+                self.client.ft(args[0]).aliasupdate(index_name)
+
+
+class FakeSearchClient:
+    def __init__(self, indexes: dict[str, list[dict]]):
+        self.indexes = indexes
+        self.aliases = {}
+        self.transactions: list[list[str]] = []
+
+    def ft(self, name: str) -> FakeIndex:
+        return FakeIndex(self, name)
+
+    def pipeline(self, transaction: bool = True) -> FakeTransaction:
+        assert transaction
+        return FakeTransaction(self)
+
+
+def test_wait_for_indexing_reports_progress_until_done():
+    index_name = get_versioned_index_key("Chat", 2)
+    redis_client = FakeSearchClient(
+        {
+            index_name: [
+                {"indexing": "1", "percent_indexed": "0.5", "num_docs": "50"},
+                {"indexing": "0", "percent_indexed": "1", "num_docs": "100"},
+            ]
+        }
+    )
+    progress = list(wait_for_indexing(redis_client, index_name, poll_interval=0))
+    assert [item.num_docs for item in progress] == [50, 100]
+    assert not progress[-1].indexing
+
+
+def test_swap_index_alias_replaces_unversioned_index():
+    index_name = get_versioned_index_key("Chat", 2)
+    redis_client = FakeSearchClient({"meta_model_index:Chat": [{}], index_name: []})
+    previous_index_name = swap_index_alias(redis_client, "Chat", index_name)
+    assert previous_index_name == "meta_model_index:Chat"
+    assert "meta_model_index:Chat" not in redis_client.indexes
+    assert redis_client.aliases == {"meta_model_index:Chat": index_name}
+    assert redis_client.transactions == [["FT.DROPINDEX", "FT.ALIASUPDATE"]]
+
+
+def test_swap_index_alias_moves_alias_between_versions():
+    previous_index_name = get_versioned_index_key("Chat", 1)
+    index_name = get_versioned_index_key("Chat", 2)
+    redis_client = FakeSearchClient({previous_index_name: [{}], index_name: []})
+    redis_client.aliases["meta_model_index:Chat"] = previous_index_name
+
+    assert swap_index_alias(redis_client, "Chat", index_name) == previous_index_name
+    assert redis_client.aliases == {"meta_model_index:Chat": index_name}
+    assert previous_index_name in redis_client.indexes
+    assert redis_client.transactions == []
+
+
+def test_wait_for_indexing_raises_when_index_is_missing():
+    redis_client = FakeSearchClient({})
+    with pytest.raises(IndexNotFound):
+        list(wait_for_indexing(redis_client, get_versioned_index_key("Chat", 2)))
+
+
+class FakeBackfillClient:
+    """Runs the backfill script against documents held in a dict"""
+
+    def __init__(self, documents: dict[str, dict]):
+        self.documents = documents
+
+    def scan_iter(self, match: str, _type: str):
+        prefix = match.removesuffix("*")
+        return [key for key in self.documents if key.startswith(prefix)]
+
+    def register_script(self, script: str):
+        assert script == BACKFILL_MESSAGE_COUNT_SCRIPT
+
+        def backfill(keys: list[str]) -> int:
+            chat = self.documents[keys[0]]["object"]
+            if "message_count" in chat:
+                return 0
+            chat["message_count"] = len(chat["messages"])
+            return 1
+
+        return backfill
+
+
+def test_backfill_documents_sets_missing_message_count():
+    redis_client = FakeBackfillClient(
+        {
+            "Chat:1:1": {"object": {"messages": [{}, {}]}},
+            "Chat:1:2": {"object": {"messages": [{}], "message_count": 1}},
+            "ChatMessage:1:1": {"object": {}},
+        }
+    )
+    assert backfill_documents(redis_client, "Chat") == 1
+    assert redis_client.documents["Chat:1:1"]["object"]["message_count"] == 2
+    assert backfill_documents(redis_client, "Prompt") == 0
@@ -0,0 +1,185 @@
+import asyncio
+
+from restllm.models import CompletionJob, EventStatus, EventType, TaskAction
+from restllm.redis.jobs import (
+    JOB_QUEUE_KEY,
+    JOB_WORKERS_KEY,
+    REQUEUE_JOBS_SCRIPT,
+    CompletionJobWorker,
+    build_job_event,
+    get_job_chat_key,
+    get_job_key,
+    get_job_stream_key,
+    get_worker_heartbeat_key,
+    get_worker_jobs_key,
+)
+from restllm.redis.scripts import LuaScript
+
+
+class FakePipeline:
+    def __init__(self, client: "FakeQueueClient"):
+        self.client = client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    def set(self, key: str, value, ex: int):
+        self.client.heartbeats.add(key)
+
+    def sadd(self, key: str, member: str):
+        self.client.workers.add(member.encode())
+
+    def lrem(self, key: str, count: int, value: str):
+        self.client.lists[key].remove(value.encode())
+
+    def lpush(self, key: str, value: str):
+        self.client.queue.append(value.encode())
+        self.client.returned.append(value)
+
+    async def execute(self):
+        return []
+
+
+class FakeQueueClient:
+    def __init__(self, jobs: list[CompletionJob]):
+        self.queue = [job.id.encode() for job in jobs]
+        self.jobs = {get_job_key(job.id): job.model_dump_json() for job in jobs}
+        self.lists: dict[str, list[bytes]] = {}
+        self.heartbeats: set[str] = set()
+        self.workers: set[bytes] = set()
+        self.scripts: list[tuple] = []
+        self.returned: list[str] = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def blmove(self, source: str, destination: str, timeout, src, dest):
+        if not self.queue:
+            await asyncio.sleep(0.01)
+            return None
+        job_id = self.queue.pop(0)
+        self.lists.setdefault(destination, []).insert(0, job_id)
+        return job_id
+
+    async def lrem(self, key: str, count: int, value: str):
+        self.lists[key].remove(value.encode())
+
+    async def get(self, key: str):
+        return self.jobs.get(key)
+
+    async def smembers(self, key: str):
+        return set(self.workers)
+
+    async def evalsha(self, sha: str, numkeys: int, *keys_and_args):
+        self.scripts.append((sha, *keys_and_args))
+        return 2
+
+
+def create_job(model: str) -> CompletionJob:
+    return CompletionJob(owner=1, chat_id=2, model=model)
+
+
+def test_worker_bounds_concurrency_per_model():
+    jobs = [create_job("gpt-4") for _ in range(4)] + [create_job("llama2")]
+    running: dict[str, int] = {}
+    peak: dict[str, int] = {}
+    finished = []
+
+    async def handler(redis_client, job: CompletionJob):
+        running[job.model] = running.get(job.model, 0) + 1
+        peak[job.model] = max(peak.get(job.model, 0), running[job.model])
+        await asyncio.sleep(0.01)
+        running[job.model] -= 1
+        finished.append(job.id)
+
+    redis_client = FakeQueueClient(jobs)
+    worker = CompletionJobWorker(concurrency=3, model_concurrency=2)
+
+    async def run():
+        task = asyncio.create_task(worker.run(redis_client, handler))
+        while len(finished) < len(jobs) or worker.tasks:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert worker.slots._value == 3
+    assert peak == {"gpt-4": 2, "llama2": 1}
+    assert sorted(finished) == sorted(job.id for job in jobs)
+    # Finished jobs are removed from the jobs of the worker
+    assert redis_client.lists == {worker.jobs_key: []}
+    assert get_worker_heartbeat_key(worker.worker_id) in redis_client.heartbeats
+
+
+def test_worker_returns_jobs_of_saturated_models():
+    jobs = [create_job("gpt-4"), create_job("gpt-4"), create_job("llama2")]
+    llama_finished = asyncio.Event()
+    finished = []
+
+    async def handler(redis_client, job: CompletionJob):
+        if job.model == "gpt-4":
+            # Only finishes once the job for the other model could run
+            await llama_finished.wait()
+        else:
+            llama_finished.set()
+        finished.append(job.id)
+
+    redis_client = FakeQueueClient(jobs)
+    worker = CompletionJobWorker(concurrency=2, model_concurrency=1, retry_delay=0.01)
+
+    async def run():
+        task = asyncio.create_task(worker.run(redis_client, handler))
+        await asyncio.wait_for(llama_finished.wait(), 1)
+        while len(finished) < len(jobs) or worker.tasks:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert jobs[1].id in redis_client.returned
+    assert sorted(finished) == sorted(job.id for job in jobs)
+    assert redis_client.lists == {worker.jobs_key: []}
+    assert worker.slots._value == 2
+
+
+def test_job_stream_key_changes_per_attempt():
+    job = create_job("gpt-4")
+    first_stream_key = get_job_stream_key(job)
+    job.attempt += 1
+    assert get_job_stream_key(job) != first_stream_key
+
+
+def test_worker_requeues_jobs_of_other_workers():
+    redis_client = FakeQueueClient([])
+    worker = CompletionJobWorker()
+    redis_client.workers = {worker.worker_id.encode(), b"stopped"}
+
+    assert asyncio.run(worker.requeue_stale_jobs(redis_client)) == 2
+    assert redis_client.scripts == [
+        (
+            LuaScript(REQUEUE_JOBS_SCRIPT).sha,
+            get_worker_heartbeat_key("stopped"),
+            get_worker_jobs_key("stopped"),
+            JOB_QUEUE_KEY,
+            JOB_WORKERS_KEY,
+            "stopped",
+        )
+    ]
+
+
+def test_build_job_event_leaves_out_content():
+    job = create_job("gpt-4")
+    job.status = EventStatus.COMPLETED
+    job.content = "Hello"
+    event = build_job_event(job, TaskAction.COMPLETE)
+    assert event.type == EventType.TASK
+    assert event.get_channel() == "task:1"
+    assert event.event.status == EventStatus.COMPLETED
+    assert "content" not in event.event.object
+
+
+def test_get_job_chat_key():
+    assert get_job_chat_key(create_job("gpt-4")) == "Chat:1:2"
@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import pytest
+
+from restllm.models import User
+from restllm.redis.pagination import (
+    Cursor,
+    InvalidCursor,
+    build_page_body,
+    create_keyset_filter,
+)
+from restllm.redis.queries import SortingField
+from restllm.redis.search import (
+    create_page_request,
+    list_instances,
+    parse_aggregate_row,
+    unwrap_json_array,
+)
+
+owner = User(id=1, first_name="Alice", last_name="Wonderer", email="a@example.com")
+
+# FT.AGGREGATE with DIALECT 3 returns the loaded JSON fields as arrays
+AGGREGATE_REPLY = [
+    2,
+    [b"__key", b"Chat:1:41", b"id", b"[41]", b"created_at", b"[1700000000.5]"],
+    [b"__key", b"Chat:1:42", b"id", b"[42]", b"created_at", b"[1700000001.25]"],
+]
+
+
+class FakePipeline:
+    def __init__(self, replies: list):
+        self.replies = replies
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    def execute_command(self, *args):
+        return self
+
+    async def execute(self):
+        return self.replies
+
+
+class FakeRedisClient:
+    def __init__(self, replies: list):
+        self.replies = replies
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.replies)
+
+    async def execute_command(self, command, *args):
+        assert command == "JSON.MGET"
+        return [f'[{{"key":"{key}"}}]'.encode() for key in args[:-1]]
+
+
+@pytest.fixture
+def cursor() -> Cursor:
+    return Cursor(
+        sorting_field=SortingField.CREATED_AT,
+        ascending=True,
+        value=1700000000.123456,
+        id=42,
+    )
+
+
+def test_cursor_round_trip(cursor):
+    assert Cursor.decode(cursor.encode()) == cursor
+
+
+def test_decode_invalid_cursor():
+    with pytest.raises(InvalidCursor):
+        Cursor.decode("not-a-cursor")
+
+
+def test_keyset_filter_breaks_ties_on_id(cursor):
+    assert create_keyset_filter(cursor) == (
+        "(@created_at:[(1700000000.123456 +inf] | "
+        "(@created_at:[1700000000.123456 1700000000.123456] @id:[(42 +inf]))"
+    )
+
+
+def test_keyset_filter_on_id_descending(cursor):
+    cursor.sorting_field = SortingField.ID
+    cursor.ascending = False
+    assert create_keyset_filter(cursor) == "@id:[-inf (42]"
+
+
+def test_page_request_sorts_on_field_and_id(cursor):
+    request = create_page_request(
+        owner, 10, SortingField.CREATED_AT, True, cursor=cursor
+    )
+    args = request.build_args()
+    assert args[0] == f"@owner:[1 1] {create_keyset_filter(cursor)}"
+    assert args[args.index("SORTBY") : args.index("SORTBY") + 6] == [
+        "SORTBY",
+        "4",
+        "@created_at",
+        "ASC",
+        "@id",
+        "ASC",
+    ]
+    assert args[args.index("LIMIT") : args.index("LIMIT") + 3] == ["LIMIT", "0", "10"]
+
+
+def test_build_page_body(cursor):
+    body = build_page_body(12, [b'{"id":1}', b'{"id":2}'], cursor)
+    assert json.loads(body) == {
+        "total": 12,
+        "items": [{"id": 1}, {"id": 2}],
+        "next_cursor": cursor.encode(),
+    }
+
+
+def test_unwrap_json_array():
+    assert unwrap_json_array(b'[{"id":1}]') == b'{"id":1}'
+
+
+def test_parse_aggregate_row_unwraps_dialect_3_values():
+    assert parse_aggregate_row(AGGREGATE_REPLY[1]) == {
+        "__key": "Chat:1:41",
+        "id": 41,
+        "created_at": 1700000000.5,
+    }
+
+
+def test_parse_aggregate_row_keeps_missing_values():
+    row = [b"model", None, b"tags", b"[]"]
+    assert parse_aggregate_row(row) == {"model": None, "tags": None}
+
+
+def test_list_instances_returns_cursor_after_full_page():
+    redis_client = FakeRedisClient([AGGREGATE_REPLY, [5]])
+    total, items, next_cursor = asyncio.run(
+        list_instances(redis_client, "Chat", owner, limit=2)
+    )
+    assert total == 5
+    assert items == [b'{"key":"Chat:1:41"}', b'{"key":"Chat:1:42"}']
+    assert next_cursor == Cursor(
+        sorting_field=SortingField.CREATED_AT,
+        ascending=True,
+        value=1700000001.25,
+        id=42,
+    )
@@ -0,0 +1,47 @@
+import pytest
+
+from restllm.redis.projection import (
+    InvalidField,
+    build_projection_from_json_get,
+    get_field_paths,
+    parse_fields,
+)
+
+
+def test_parse_fields_adds_required_fields():
+    assert parse_fields("object.name, updated_at") == [
+        "id",
+        "object.name",
+        "updated_at",
+    ]
+
+
+def test_parse_fields_removes_duplicates():
+    assert parse_fields("id,object.name,object.name") == ["id", "object.name"]
+
+
+@pytest.mark.parametrize("fields", ["object.*", "$.object", "object..name", "a b"])
+def test_parse_fields_rejects_invalid(fields):
+    with pytest.raises(InvalidField):
+        parse_fields(fields)
+
+
+def test_get_field_paths():
+    assert get_field_paths(["id", "object.name"]) == ["$.id", "$.object.name"]
+
+
+def test_build_projection_from_json_get():
+    result = {"$.id": [1], "$.object.name": ["Test"], "$.object.missing": []}
+    projection = build_projection_from_json_get(
+        ["id", "object.name", "object.missing"], result
+    )
+    assert projection == {"id": 1, "object": {"name": "Test"}}
+
+
+def test_build_projection_from_json_get_single_field():
+    assert build_projection_from_json_get(["id"], [1]) == {"id": 1}
+
+
+def test_build_projection_from_json_get_missing_key():
+    assert build_projection_from_json_get(["id"], None) is None
+
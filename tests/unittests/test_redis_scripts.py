@@ -0,0 +1,43 @@
+import asyncio
+
+from redis.exceptions import NoScriptError
+
+from restllm.redis.scripts import LuaScript
+
+
+class FakeRedisClient:
+    """Knows the scripts that were loaded, like a Redis server"""
+
+    def __init__(self):
+        self.scripts: set[str] = set()
+        self.calls: list[tuple] = []
+
+    async def evalsha(self, sha, numkeys, *keys_and_args):
+        self.calls.append(("EVALSHA", sha, numkeys, *keys_and_args))
+        if sha not in self.scripts:
+            raise NoScriptError("No matching script")
+        return list(keys_and_args)
+
+    async def script_load(self, script):
+        self.calls.append(("SCRIPT LOAD",))
+        self.scripts.add(LuaScript(script).sha)
+
+
+def test_lua_script_loads_script_once():
+    script = LuaScript("return ARGV")
+    redis_client = FakeRedisClient()
+
+    async def run():
+        return [
+            await script(redis_client, keys=["key"], args=[1, 2]) for _ in range(3)
+        ]
+
+    assert asyncio.run(run()) == [["key", 1, 2]] * 3
+    assert [call[0] for call in redis_client.calls] == [
+        "EVALSHA",
+        "SCRIPT LOAD",
+        "EVALSHA",
+        "EVALSHA",
+        "EVALSHA",
+    ]
+    assert redis_client.calls[0][1:] == (script.sha, 1, "key", 1, 2)
@@ -0,0 +1,61 @@
+import json
+
+from restllm.models import User
+from restllm.redis.index import get_tag_field_names, get_text_field_names
+from restllm.redis.queries import create_search_query, escape_tag, escape_text
+from restllm.redis.search import build_search_hit, parse_scored_search_reply
+
+owner = User(id=1, first_name="Alice", last_name="Wonderer", email="a@example.com")
+
+
+def test_escape_text_keeps_terms():
+    assert escape_text("clean-code  python") == "clean\\-code python"
+
+
+def test_escape_tag_escapes_spaces():
+    assert escape_tag("Zero-shot Prompting") == "Zero\\-shot\\ Prompting"
+
+
+def test_create_search_query_combines_filters():
+    query = create_search_query(
+        owner,
+        text="python",
+        tag_filters={"tag": ["a", "b"], "model": ["gpt-4"]},
+        created_after=1700000000.5,
+        text_fields=["name"],
+    )
+    assert query.query_string() == (
+        "@owner:[1 1] (python) @tag:{a | b} @model:{gpt\\-4} "
+        "@created_at:[(1700000000.5 +inf]"
+    )
+
+
+def test_create_search_query_without_text_sorts_by_created_at():
+    args = create_search_query(owner).get_args()
+    assert args[args.index("SORTBY") : args.index("SORTBY") + 3] == [
+        "SORTBY",
+        "created_at",
+        "DESC",
+    ]
+
+
+def test_index_schema_field_names():
+    assert get_text_field_names("Prompt") == ["name", "description", "content"]
+    assert get_tag_field_names("Chat") == ["model"]
+    assert get_tag_field_names("User") == []
+
+
+def test_build_search_hit_from_scored_reply():
+    reply = [
+        1,
+        b"Prompt:1:1",
+        b"1.5",
+        [b"$", b'{"id":1}', b"name", b"<b>python</b> prompt", b"description", b"text"],
+    ]
+    total, hits = parse_scored_search_reply(reply)
+    assert total == 1
+    assert json.loads(build_search_hit(*hits[0])) == {
+        "score": 1.5,
+        "highlights": {"name": "<b>python</b> prompt"},
+        "instance": {"id": 1},
+    }
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from restllm.redis.streams import (
+    TokenBuffer,
+    TokenStreamError,
+    publish_token_stream,
+    read_token_stream,
+)
+
+
+class FakePipeline:
+    def __init__(self, client: "FakeStreamClient"):
+        self.client = client
+        self.commands: list[tuple] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    def xadd(self, key: str, fields: dict, maxlen: int, approximate: bool):
+        self.commands.append(("XADD", fields, maxlen, approximate))
+
+    def expire(self, key: str, ttl: int):
+        self.commands.append(("EXPIRE", ttl))
+
+    async def execute(self):
+        self.client.round_trips.append(self.commands)
+        for command in self.commands:
+            if command[0] == "XADD":
+                entry_id = f"{len(self.client.entries)}-0".encode()
+                fields = {
+                    name.encode(): str(value).encode()
+                    for name, value in command[1].items()
+                }
+                self.client.entries.append((entry_id, fields))
+        return []
+
+
+class FakeStreamClient:
+    def __init__(self):
+        self.entries: list[tuple[bytes, dict]] = []
+        self.round_trips: list[list[tuple]] = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def xread(self, streams: dict, count: int, block: int):
+        _, last_id = next(iter(streams.items()))
+        entries = [
+            (entry_id, fields)
+            for entry_id, fields in self.entries
+            if last_id == "0-0"
+            or int(entry_id.split(b"-")[0]) > int(last_id.split(b"-")[0])
+        ]
+        return [(b"stream", entries)] if entries else []
+
+
+async def generate(tokens: list[str], error: Exception | None = None):
+    for token in tokens:
+        yield token
+    if error is not None:
+        raise error
+
+
+async def consume(tokens) -> list[str]:
+    return [token async for token in tokens]
+
+
+def test_token_buffer_flushes_by_size():
+    buffer = TokenBuffer(flush_bytes=4, flush_interval=60.0)
+    buffer.append("ab")
+    assert buffer and not buffer.should_flush()
+    buffer.append("cd")
+    assert buffer.should_flush()
+    assert buffer.flush() == "abcd"
+    assert not buffer and buffer.size == 0
+
+
+def test_token_buffer_flushes_by_interval():
+    buffer = TokenBuffer(flush_bytes=1024, flush_interval=0.0)
+    buffer.append("a")
+    assert buffer.should_flush()
+
+
+def test_token_buffer_counts_bytes():
+    buffer = TokenBuffer(flush_bytes=4, flush_interval=60.0)
+    buffer.append("æø")
+    assert buffer.should_flush()
+
+
+def test_publish_token_stream_batches_tokens():
+    redis_client = FakeStreamClient()
+    tokens = publish_token_stream(
+        generate(["He", "llo", " wo", "rld"]),
+        redis_client,
+        "stream",
+        60,
+        flush_bytes=6,
+        flush_interval=60.0,
+        max_len=100,
+    )
+
+    assert asyncio.run(consume(tokens)) == ["He", "llo", " wo", "rld"]
+    assert redis_client.round_trips == [
+        [("XADD", {"token": "Hello wo"}, 100, True), ("EXPIRE", 60)],
+        [
+            ("XADD", {"token": "rld"}, 100, True),
+            ("XADD", {"done": 1}, 100, True),
+            ("EXPIRE", 60),
+        ],
+    ]
+    read = read_token_stream(redis_client, "stream", 1)
+    assert "".join(asyncio.run(consume(read))) == "Hello world"
+
+
+def test_publish_token_stream_ends_with_error():
+    redis_client = FakeStreamClient()
+    tokens = publish_token_stream(
+        generate(["Hi"], ConnectionError("upstream failed")),
+        redis_client,
+        "stream",
+        60,
+        flush_bytes=100,
+        flush_interval=60.0,
+    )
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(consume(tokens))
+    read = read_token_stream(redis_client, "stream", 1)
+    with pytest.raises(TokenStreamError, match="upstream failed"):
+        asyncio.run(consume(read))
+    assert [entry[1] for entry in redis_client.entries] == [
+        {b"token": b"Hi"},
+        {b"error": b"upstream failed"},
+    ]
@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+
+from restllm import tracing
+from restllm.redis.commands import get_instance
+from restllm.redis.search import search_instances
+
+
+def test_traced_returns_function_when_tracing_is_disabled():
+    def function():
+        pass
+
+    assert tracing.tracer is None
+    assert tracing.traced(function) is function
+
+
+def test_traced_functions_are_not_wrapped_when_tracing_is_disabled():
+    assert not hasattr(search_instances, "__wrapped__")
+    # Only wrapped by the metrics of the Redis commands
+    assert not hasattr(get_instance.__wrapped__, "__wrapped__")
+
+
+def test_get_span_name():
+    assert tracing.get_span_name(search_instances) == "redis.search.search_instances"
+
+
+class FakeJSON:
+    async def get(self, key):
+        return {"key": key}
+
+
+class FakeRedisClient:
+    def json(self):
+        return FakeJSON()
+
+
+@pytest.fixture
+def read_spans(monkeypatch, tmp_path):
+    pytest.importorskip("opentelemetry.sdk")
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing.settings, "tracing_exporter", "file")
+    monkeypatch.setattr(tracing.settings, "tracing_file_path", str(path))
+    provider = tracing.configure_tracing()
+    monkeypatch.setattr(tracing, "tracer", provider.get_tracer("restllm"))
+
+    def read() -> list[dict]:
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    yield read
+    provider.shutdown()
+
+
+def test_traces_redis_commands(read_spans):
+    traced_get_instance = tracing.traced(get_instance)
+    result = asyncio.run(traced_get_instance(FakeRedisClient(), "Chat:1"))
+    [span] = read_spans()
+    assert result == {"key": "Chat:1"}
+    assert span["name"] == "redis.commands.get_instance"
+    assert span["status"]["status_code"] == "UNSET"
+
+
+async def stream_tokens():
+    yield "Hello"
+    yield " world"
+
+
+def test_traces_completion_stream(read_spans):
+    async def collect() -> list[str]:
+        tokens = tracing.trace_completion_stream(stream_tokens(), "gpt-4", "gpt-4")
+        return [token async for token in tokens]
+
+    assert asyncio.run(collect()) == ["Hello", " world"]
+    [span] = read_spans()
+    assert span["name"] == "completion.stream"
+    assert span["attributes"]["llm.model"] == "gpt-4"
+    assert span["attributes"]["llm.token_count"] == 2
+    assert [event["name"] for event in span["events"]] == ["first_token"]
+
+
+def test_traced_generators_receive_errors_and_close(read_spans):
+    received = []
+
+    @tracing.traced
+    async def dependency():
+        try:
+            yield "client"
+        except ValueError as error:
+            received.append(error)
+            raise
+        finally:
+            received.append("closed")
+
+    async def run():
+        with pytest.raises(ValueError):
+            async with contextlib.asynccontextmanager(dependency)():
+                raise ValueError("Request failed")
+        generator = dependency()
+        await anext(generator)
+        await generator.aclose()
+
+    asyncio.run(run())
+    assert [str(item) for item in received] == ["Request failed", "closed", "closed"]
+    assert [span["status"]["status_code"] for span in read_spans()] == [
+        "ERROR",
+        "UNSET",
+    ]